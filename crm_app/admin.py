@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User, Course, Room, Group, Lead, FollowUp, 
-    TrialLesson, KPI, Reactivation
+    TrialLesson, KPI, Reactivation, NotificationLedger, TelegramOutbox, ScheduledAction,
+    LeadStatusEvent, KPIWeekly, KPIMonthly, LatencyHistogram
 )
 
 
@@ -41,8 +42,8 @@ class LeadAdmin(admin.ModelAdmin):
 
 @admin.register(FollowUp)
 class FollowUpAdmin(admin.ModelAdmin):
-    list_display = ['lead', 'sales', 'due_date', 'completed', 'is_overdue']
-    list_filter = ['completed', 'is_overdue', 'due_date']
+    list_display = ['lead', 'sales', 'due_date', 'kind', 'completed', 'is_overdue']
+    list_filter = ['completed', 'is_overdue', 'kind', 'due_date']
 
 
 @admin.register(TrialLesson)
@@ -57,8 +58,46 @@ class KPIAdmin(admin.ModelAdmin):
     list_filter = ['date', 'sales']
 
 
+@admin.register(KPIWeekly, KPIMonthly)
+class KPIRollupAdmin(admin.ModelAdmin):
+    list_display = ['sales', 'period_start', 'days', 'daily_contacts', 'trials_to_sales', 'leads_assigned']
+    list_filter = ['period_start', 'sales']
+
+
+@admin.register(LatencyHistogram)
+class LatencyHistogramAdmin(admin.ModelAdmin):
+    list_display = ['date', 'metric', 'sales', 'course', 'count']
+    list_filter = ['metric', 'date', 'sales']
+    exclude = ['buckets']
+
+
 @admin.register(Reactivation)
 class ReactivationAdmin(admin.ModelAdmin):
     list_display = ['lead', 'reactivation_type', 'days_since_lost', 'sent_at', 'result']
     list_filter = ['reactivation_type', 'result']
 
+
+@admin.register(NotificationLedger)
+class NotificationLedgerAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'object_id', 'chat_id', 'last_sent_at']
+    list_filter = ['kind']
+
+
+@admin.register(TelegramOutbox)
+class TelegramOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'chat_id', 'status', 'receipt_kind', 'attempts', 'created_at', 'sent_at', 'latency_ms']
+    list_filter = ['status', 'receipt_kind']
+    search_fields = ['chat_id', 'last_error']
+
+
+@admin.register(ScheduledAction)
+class ScheduledActionAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'object_id', 'fire_at', 'state', 'attempts', 'updated_at']
+    list_filter = ['kind', 'state']
+
+
+@admin.register(LeadStatusEvent)
+class LeadStatusEventAdmin(admin.ModelAdmin):
+    list_display = ['lead', 'from_status', 'to_status', 'sales', 'at']
+    list_filter = ['to_status']
+    raw_id_fields = ['lead']
@@ -0,0 +1,565 @@
+"""
+Analitika snapshot - Lead, FollowUp va TrialLesson jadvallarining ustunli (columnar) nusxasi
+
+build_snapshot() (har kecha, build_analytics_snapshot_task) jadvallarni ixcham NumPy
+massivlariga eksport qiladi: status, manba, kurs va sotuvchi - butun son kodlari,
+vaqtlar - epoch soniyalari (bo'lmasa -1). Har bir ustun alohida .npy fayl; yangi snapshot
+alohida papkaga yoziladi va CURRENT fayli atomik almashtiriladi.
+
+FunnelEngine fayllarni mmap_mode='r' bilan ochadi va voronka, kogorta va bosqichgacha
+vaqt so'rovlarini vektorlashtirilgan NumPy amallari bilan hisoblaydi - OLTP bazaga
+murojaat qilinmaydi. NumPy ixtiyoriy: o'rnatilmagan bo'lsa NUMPY_AVAILABLE = False.
+"""
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Lead, FollowUp, TrialLesson, LeadStatusEvent, Course, User
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# Voronka bosqichlari (tartib bo'yicha); keyingi bosqichga yetgan lid oldingilaridan ham o'tgan hisoblanadi
+STAGES = [
+    ('created', 'Yaratildi'),
+    ('contacted', 'Aloqa qilindi'),
+    ('trial_registered', 'Sinovga yozildi'),
+    ('trial_attended', 'Sinovga keldi'),
+    ('enrolled', 'Kursga yozildi'),
+]
+STAGE_NAMES = [name for name, _ in STAGES]
+
+# Lid statusi -> voronka bosqichi (lost - bosqich emas)
+STATUS_STAGE = {
+    'contacted': 1,
+    'interested': 1,
+    'reactivation': 1,
+    'trial_registered': 2,
+    'trial_not_attended': 2,
+    'trial_attended': 3,
+    'offer_sent': 3,
+    'enrolled': 4,
+}
+# Sinovga kelganini bildiruvchi TrialLesson natijalari
+ATTENDED_RESULTS = ['attended', 'offer_sent', 'accepted', 'rejected']
+
+STATUS_CODES = [key for key, _ in Lead.STATUS_CHOICES]
+SOURCE_CODES = [key for key, _ in Lead.SOURCE_CHOICES]
+RESULT_CODES = [key for key, _ in TrialLesson.RESULT_CHOICES]
+
+DIMENSIONS = ['course', 'source', 'sales']
+NEVER = -1
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+EPOCH_DATE = date(1970, 1, 1)
+CHUNK_SIZE = 20000
+KEEP_SNAPSHOTS = 2
+
+
+def get_snapshot_dir():
+    """Snapshot papkasi (settings.ANALYTICS_SNAPSHOT_DIR)"""
+    return Path(getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'analytics_snapshot'))
+
+
+def _epoch(value):
+    """datetime -> epoch soniya (None -> NEVER)"""
+    return int(value.timestamp()) if value else NEVER
+
+
+def _local_day(value):
+    """datetime -> mahalliy sana, 1970-01-01 dan kunlar soni"""
+    return (timezone.localtime(value).date() - EPOCH_DATE).days
+
+
+def _day_to_date(day):
+    return EPOCH_DATE + timedelta(days=int(day))
+
+
+def _week_of_day(days):
+    """Kun raqami -> dushanbadan boshlanuvchi hafta raqami (1970-01-01 - payshanba)"""
+    return (days + 3) // 7
+
+
+def _week_start(week):
+    return _day_to_date(int(week) * 7 - 3)
+
+
+# ============ EKSPORT ============
+
+def _export_leads(course_codes, sales_codes):
+    """Lid ustunlari (id bo'yicha tartiblangan)"""
+    total = Lead.objects.count()
+    columns = {
+        'id': np.empty(total, dtype='int64'),
+        'created': np.empty(total, dtype='int64'),
+        'created_day': np.empty(total, dtype='int32'),
+        'status': np.empty(total, dtype='int8'),
+        'source': np.empty(total, dtype='int8'),
+        'course': np.empty(total, dtype='int16'),
+        'sales': np.empty(total, dtype='int32'),
+    }
+    status_index = {key: index for index, key in enumerate(STATUS_CODES)}
+    source_index = {key: index for index, key in enumerate(SOURCE_CODES)}
+    enrolled_at = {}
+
+    size = 0
+    for row, (lead_id, created_at, status, source, course_id, sales_id, enrolled) in enumerate(
+        Lead.objects.order_by('id').values_list(
+            'id', 'created_at', 'status', 'source', 'interested_course_id', 'assigned_sales_id', 'enrolled_at'
+        ).iterator(chunk_size=CHUNK_SIZE)
+    ):
+        if row >= total:
+            break
+        size = row + 1
+        columns['id'][row] = lead_id
+        columns['created'][row] = _epoch(created_at)
+        columns['created_day'][row] = _local_day(created_at)
+        columns['status'][row] = status_index.get(status, NEVER)
+        columns['source'][row] = source_index.get(source, NEVER)
+        columns['course'][row] = course_codes.get(course_id, NEVER)
+        columns['sales'][row] = sales_codes.get(sales_id, NEVER)
+        if enrolled:
+            enrolled_at[row] = _epoch(enrolled)
+
+    # Sanash va o'qish orasida o'chirilgan qatorlar uchun massivlarni qisqartirish
+    columns = {name: column[:size] for name, column in columns.items()}
+    return columns, enrolled_at
+
+
+def _stage_times(lead_ids, enrolled_at):
+    """
+    Har bir lid uchun har bir bosqichga birinchi yetgan vaqt (n x len(STAGES), NEVER - yetmagan)
+    Manbalar: LeadStatusEvent (status bo'yicha birinchi o'tish), TrialLesson natijalari, enrolled_at.
+    """
+    infinity = np.iinfo('int64').max
+    times = np.full((len(lead_ids), len(STAGES)), infinity, dtype='int64')
+
+    def apply(ids, stages, epochs):
+        if not ids:
+            return
+        ids = np.asarray(ids, dtype='int64')
+        rows = np.searchsorted(lead_ids, ids)
+        rows = np.minimum(rows, len(lead_ids) - 1)
+        known = lead_ids[rows] == ids if len(lead_ids) else np.zeros(len(ids), dtype=bool)
+        np.minimum.at(times, (rows[known], np.asarray(stages)[known]), np.asarray(epochs, dtype='int64')[known])
+
+    ids, stages, epochs = [], [], []
+    for lead_id, to_status, first_at in LeadStatusEvent.objects.filter(
+        to_status__in=list(STATUS_STAGE)
+    ).values('lead_id', 'to_status').annotate(first_at=Min('at')).values_list(
+        'lead_id', 'to_status', 'first_at'
+    ).order_by().iterator(chunk_size=CHUNK_SIZE):
+        ids.append(lead_id)
+        stages.append(STATUS_STAGE[to_status])
+        epochs.append(_epoch(first_at))
+    apply(ids, stages, epochs)
+
+    ids, epochs = [], []
+    for lead_id, trial_date, trial_time in TrialLesson.objects.filter(
+        result__in=ATTENDED_RESULTS
+    ).values_list('lead_id', 'date', 'time').iterator(chunk_size=CHUNK_SIZE):
+        ids.append(lead_id)
+        epochs.append(_epoch(timezone.make_aware(datetime.combine(trial_date, trial_time))))
+    apply(ids, [STAGE_NAMES.index('trial_attended')] * len(ids), epochs)
+
+    if enrolled_at:
+        rows = np.fromiter(enrolled_at.keys(), dtype='int64', count=len(enrolled_at))
+        values = np.fromiter(enrolled_at.values(), dtype='int64', count=len(enrolled_at))
+        np.minimum.at(times, (rows, np.full(len(rows), STAGE_NAMES.index('enrolled'))), values)
+
+    # Keyingi bosqichga yetgan lid oldingi bosqichlardan ham o'tgan (vaqti - eng erta keyingi bosqich)
+    times = np.minimum.accumulate(times[:, ::-1], axis=1)[:, ::-1]
+    return np.where(times == infinity, NEVER, times)
+
+
+def _export_followups(lead_ids, sales_codes):
+    """Follow-up ustunlari (lead - lid qatori indeksi)"""
+    total = FollowUp.objects.count()
+    columns = {
+        'lead': np.empty(total, dtype='int64'),
+        'sales': np.empty(total, dtype='int32'),
+        'due': np.empty(total, dtype='int64'),
+        'completed_at': np.empty(total, dtype='int64'),
+    }
+    size = 0
+    for row, (lead_id, sales_id, due_date, completed, completed_at) in enumerate(
+        FollowUp.objects.order_by('id').values_list(
+            'lead_id', 'sales_id', 'due_date', 'completed', 'completed_at'
+        ).iterator(chunk_size=CHUNK_SIZE)
+    ):
+        if row >= total:
+            break
+        size = row + 1
+        columns['lead'][row] = lead_id
+        columns['sales'][row] = sales_codes.get(sales_id, NEVER)
+        columns['due'][row] = _epoch(due_date)
+        # completed_at bo'lmagan eski bajarilgan follow-up'lar - muddati vaqtida bajarilgan deb olinadi
+        columns['completed_at'][row] = _epoch(completed_at or (due_date if completed else None))
+    columns = {name: column[:size] for name, column in columns.items()}
+    columns['lead'] = _lead_rows(lead_ids, columns['lead'])
+    return columns
+
+
+def _export_trials(lead_ids):
+    """Sinov darslari ustunlari"""
+    total = TrialLesson.objects.count()
+    columns = {
+        'lead': np.empty(total, dtype='int64'),
+        'at': np.empty(total, dtype='int64'),
+        'result': np.empty(total, dtype='int8'),
+    }
+    result_index = {key: index for index, key in enumerate(RESULT_CODES)}
+    size = 0
+    for row, (lead_id, trial_date, trial_time, result) in enumerate(
+        TrialLesson.objects.order_by('id').values_list(
+            'lead_id', 'date', 'time', 'result'
+        ).iterator(chunk_size=CHUNK_SIZE)
+    ):
+        if row >= total:
+            break
+        size = row + 1
+        columns['lead'][row] = lead_id
+        columns['at'][row] = _epoch(timezone.make_aware(datetime.combine(trial_date, trial_time)))
+        columns['result'][row] = result_index.get(result, NEVER)
+    columns = {name: column[:size] for name, column in columns.items()}
+    columns['lead'] = _lead_rows(lead_ids, columns['lead'])
+    return columns
+
+
+def _lead_rows(lead_ids, ids):
+    """Lid id -> lid ustunlaridagi qator indeksi (topilmasa NEVER)"""
+    if not len(lead_ids):
+        return np.full(len(ids), NEVER, dtype='int32')
+    rows = np.minimum(np.searchsorted(lead_ids, ids), len(lead_ids) - 1)
+    return np.where(lead_ids[rows] == ids, rows, NEVER).astype('int32')
+
+
+def build_snapshot(base_dir=None):
+    """
+    Yangi snapshot yaratish va CURRENT ni unga o'tkazish
+    Returns: {'path', 'leads', 'followups', 'trials', 'seconds'}
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("Analitika snapshot uchun NumPy o'rnatilmagan (pip install numpy)")
+
+    started = time.monotonic()
+    base_dir = Path(base_dir or get_snapshot_dir())
+    base_dir.mkdir(parents=True, exist_ok=True)
+    generated_at = timezone.now()
+
+    courses = list(Course.objects.order_by('id').values_list('id', 'name'))
+    sales_users = list(User.objects.filter(role='sales').order_by('id').values_list('id', 'username'))
+    course_codes = {course_id: code for code, (course_id, _) in enumerate(courses)}
+    sales_codes = {sales_id: code for code, (sales_id, _) in enumerate(sales_users)}
+
+    leads, enrolled_at = _export_leads(course_codes, sales_codes)
+    stage_times = _stage_times(leads['id'], enrolled_at)
+    for index, name in enumerate(STAGE_NAMES[1:], 1):
+        leads[f'stage_{name}'] = np.ascontiguousarray(stage_times[:, index])
+    tables = {
+        'leads': leads,
+        'followups': _export_followups(leads['id'], sales_codes),
+        'trials': _export_trials(leads['id']),
+    }
+
+    path = base_dir / f"snapshot-{generated_at.strftime('%Y%m%d-%H%M%S')}"
+    tmp_path = base_dir / f'.{path.name}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir()
+    for table, columns in tables.items():
+        for name, column in columns.items():
+            np.save(tmp_path / f'{table}.{name}.npy', column)
+    meta = {
+        'generated_at': generated_at.isoformat(),
+        'today': _local_day(generated_at),
+        'statuses': STATUS_CODES,
+        'sources': SOURCE_CODES,
+        'results': RESULT_CODES,
+        'courses': [{'id': course_id, 'name': name} for course_id, name in courses],
+        'sales': [{'id': sales_id, 'username': username} for sales_id, username in sales_users],
+        'rows': {table: int(len(next(iter(columns.values())))) for table, columns in tables.items()},
+    }
+    (tmp_path / 'meta.json').write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    pointer = base_dir / 'CURRENT.tmp'
+    pointer.write_text(path.name, encoding='utf-8')
+    os.replace(pointer, base_dir / 'CURRENT')
+
+    # Eski snapshotlarni o'chirish (oxirgi KEEP_SNAPSHOTS tasi qoladi)
+    for old in sorted(base_dir.glob('snapshot-*'))[:-KEEP_SNAPSHOTS]:
+        shutil.rmtree(old, ignore_errors=True)
+
+    return {
+        'path': str(path),
+        'leads': meta['rows']['leads'],
+        'followups': meta['rows']['followups'],
+        'trials': meta['rows']['trials'],
+        'seconds': time.monotonic() - started,
+    }
+
+
+# ============ O'QISH ============
+
+class Snapshot:
+    """Snapshot papkasi: meta va mmap qilingan ustunlar"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / 'meta.json').read_text(encoding='utf-8'))
+        self.generated_at = datetime.fromisoformat(self.meta['generated_at'])
+        self._columns = {}
+
+    def column(self, table, name):
+        key = (table, name)
+        if key not in self._columns:
+            self._columns[key] = np.load(self.path / f'{table}.{name}.npy', mmap_mode='r')
+        return self._columns[key]
+
+
+_engines = {}
+
+
+def get_engine(base_dir=None):
+    """
+    Joriy snapshot uchun FunnelEngine (jarayonda keshlanadi, CURRENT o'zgarsa qayta ochiladi)
+    Snapshot yoki NumPy bo'lmasa None.
+    """
+    if not NUMPY_AVAILABLE:
+        return None
+    base_dir = Path(base_dir or get_snapshot_dir())
+    try:
+        name = (base_dir / 'CURRENT').read_text(encoding='utf-8').strip()
+    except OSError:
+        return None
+    path = base_dir / name
+    engine = _engines.get(base_dir)
+    if engine is None or engine.snapshot.path != path:
+        try:
+            engine = FunnelEngine(Snapshot(path))
+        except (OSError, ValueError):
+            return None
+        _engines[base_dir] = engine
+    return engine
+
+
+class FunnelEngine:
+    """
+    Snapshot ustunlari ustida voronka, kogorta va bosqichgacha vaqt so'rovlari
+    Filtrlar (barcha metodlarda): course (kurs id), source (manba kaliti), sales (sotuvchi id),
+    start / end (lid yaratilgan sana, date).
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        meta = snapshot.meta
+        self.today = meta['today']
+        self.courses = meta['courses']
+        self.sales = meta['sales']
+        self.sources = meta['sources']
+        self._course_codes = {course['id']: code for code, course in enumerate(self.courses)}
+        self._sales_codes = {sales['id']: code for code, sales in enumerate(self.sales)}
+        self._source_codes = {key: code for code, key in enumerate(self.sources)}
+        self._source_labels = dict(Lead.SOURCE_CHOICES)
+
+    @property
+    def generated_at(self):
+        return self.snapshot.generated_at
+
+    def leads(self, name):
+        return self.snapshot.column('leads', name)
+
+    def stage_times(self, stage):
+        """Bosqichga yetgan vaqt ustuni (created - yaratilgan vaqt)"""
+        return self.leads('created' if stage == 'created' else f'stage_{stage}')
+
+    def mask(self, course=None, source=None, sales=None, start=None, end=None):
+        """Filtr bo'yicha lidlar maskasi"""
+        mask = np.ones(len(self.leads('id')), dtype=bool)
+        for column, value, codes in (
+            ('course', course, self._course_codes),
+            ('source', source, self._source_codes),
+            ('sales', sales, self._sales_codes),
+        ):
+            if value not in (None, ''):
+                mask &= self.leads(column) == codes.get(value, -2)
+        if start:
+            mask &= self.leads('created_day') >= (start - EPOCH_DATE).days
+        if end:
+            mask &= self.leads('created_day') <= (end - EPOCH_DATE).days
+        return mask
+
+    def _dimension_size(self, dimension):
+        return len({'course': self.courses, 'sales': self.sales, 'source': self.sources}[dimension])
+
+    def label(self, dimension, code):
+        """O'lchov kodi -> nom"""
+        if code < 0:
+            return 'Belgilanmagan'
+        if dimension == 'course':
+            return self.courses[code]['name']
+        if dimension == 'sales':
+            return self.sales[code]['username']
+        key = self.sources[code]
+        return self._source_labels.get(key, key)
+
+    def funnel(self, **filters):
+        """
+        Voronka: har bir bosqichga yetgan lidlar soni
+        Returns: [{'stage', 'label', 'count', 'rate' (jamiga %), 'step_rate' (oldingi bosqichga %)}]
+        """
+        mask = self.mask(**filters)
+        total = int(mask.sum())
+        rows = []
+        previous = total
+        for stage, label in STAGES:
+            count = total if stage == 'created' else int((self.stage_times(stage)[mask] >= 0).sum())
+            rows.append({
+                'stage': stage,
+                'label': label,
+                'count': count,
+                'rate': count / total * 100 if total else 0,
+                'step_rate': count / previous * 100 if previous else 0,
+            })
+            previous = count
+        return rows
+
+    def cohorts(self, stage='enrolled', weeks=12, horizon=8, group_by=(), limit=500, **filters):
+        """
+        Haftalik kogortalar (yaratilgan hafta x group_by o'lchovlari)
+        curve[k] - k+1 hafta ichida bosqichga yetganlar ulushi (%), hali kuzatilmagan haftalar - None
+        Returns: [{'week_start', 'groups', 'size', 'reached', 'curve'}] (yangi haftalar birinchi, ko'pi bilan limit ta)
+        """
+        group_by = [dimension for dimension in group_by if dimension in DIMENSIONS]
+        current_week = _week_of_day(self.today)
+        weeks_column = _week_of_day(self.leads('created_day').astype('int64'))
+        mask = self.mask(**filters) & (weeks_column > current_week - weeks) & (weeks_column <= current_week)
+        if not mask.any():
+            return []
+
+        # (hafta, o'lchovlar...) kalitini bitta int64 ga yig'ish (aralash asosli son) - 1D unique tez
+        radixes = [weeks] + [self._dimension_size(dimension) + 1 for dimension in group_by]
+        keys = weeks_column[mask] - (current_week - weeks + 1)
+        for dimension, radix in zip(group_by, radixes[1:]):
+            keys = keys * radix + (self.leads(dimension)[mask].astype('int64') + 1)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        groups = np.empty((len(unique_keys), len(radixes)), dtype='int64')
+        remainder = unique_keys
+        for position in range(len(radixes) - 1, 0, -1):
+            groups[:, position] = remainder % radixes[position] - 1
+            remainder = remainder // radixes[position]
+        groups[:, 0] = remainder + (current_week - weeks + 1)
+        inverse = inverse.reshape(-1)
+        sizes = np.bincount(inverse, minlength=len(groups))
+
+        created = self.leads('created')[mask]
+        reached_at = self.stage_times(stage)[mask]
+        reached = reached_at >= 0
+        delay = (reached_at - created) // WEEK_SECONDS
+        in_horizon = reached & (delay < horizon)
+        counts = np.bincount(
+            inverse[in_horizon] * horizon + np.maximum(delay[in_horizon], 0),
+            minlength=len(groups) * horizon
+        ).reshape(len(groups), horizon)
+        curves = np.cumsum(counts, axis=1) / sizes[:, None] * 100
+        reached_total = np.bincount(inverse[reached], minlength=len(groups))
+
+        rows = []
+        for index in np.lexsort((np.arange(len(groups)), -groups[:, 0]))[:limit]:
+            week = int(groups[index, 0])
+            observed = current_week - week + 1
+            rows.append({
+                'week_start': _week_start(week),
+                'groups': [self.label(dimension, int(code)) for dimension, code in zip(group_by, groups[index, 1:])],
+                'size': int(sizes[index]),
+                'reached': int(reached_total[index]),
+                'curve': [float(value) if offset < observed else None for offset, value in enumerate(curves[index])],
+            })
+        return rows
+
+    def time_to_stage(self, stage, from_stage='created', group_by=None, **filters):
+        """
+        from_stage dan stage gacha vaqt (soat): soni, o'rtacha, mediana, p75, p90
+        group_by berilsa har bir o'lchov qiymati uchun alohida qator
+        Returns: [{'group', 'count', 'mean', 'median', 'p75', 'p90'}]
+        """
+        mask = self.mask(**filters)
+        start = self.stage_times(from_stage)[mask]
+        end = self.stage_times(stage)[mask]
+        valid = (start >= 0) & (end >= start)
+        hours = (end[valid] - start[valid]) / 3600
+
+        if group_by not in DIMENSIONS:
+            return [self._duration_row(None, hours)]
+        codes = self.leads(group_by)[mask][valid]
+        return [
+            self._duration_row(self.label(group_by, int(code)), hours[codes == code])
+            for code in np.unique(codes)
+        ]
+
+    @staticmethod
+    def _duration_row(group, hours):
+        if not len(hours):
+            return {'group': group, 'count': 0, 'mean': None, 'median': None, 'p75': None, 'p90': None}
+        median, p75, p90 = np.percentile(hours, [50, 75, 90])
+        return {
+            'group': group,
+            'count': int(len(hours)),
+            'mean': float(hours.mean()),
+            'median': float(median),
+            'p75': float(p75),
+            'p90': float(p90),
+        }
+
+    def _selected_rows(self, table, filters):
+        """Filtrdagi lidlarga tegishli follow-up / sinov qatorlari maskasi"""
+        lead_rows = self.snapshot.column(table, 'lead')
+        selected = lead_rows >= 0
+        if any(value not in (None, '') for value in filters.values()):
+            selected &= self.mask(**filters)[np.maximum(lead_rows, 0)]
+        return selected
+
+    def followup_stats(self, **filters):
+        """
+        Filtrdagi lidlarning follow-up'lari: jami, bajarilgan, o'z vaqtida bajarilgan,
+        bajarilmagan muddati o'tganlar (snapshot vaqtiga nisbatan)
+        """
+        selected = self._selected_rows('followups', filters)
+        due = self.snapshot.column('followups', 'due')[selected]
+        completed_at = self.snapshot.column('followups', 'completed_at')[selected]
+        completed = completed_at >= 0
+        generated = int(self.generated_at.timestamp())
+        total = int(selected.sum())
+        done = int(completed.sum())
+        return {
+            'total': total,
+            'completed': done,
+            'on_time': int((completed & (completed_at <= due)).sum()),
+            'overdue': int((~completed & (due < generated)).sum()),
+            'completion_rate': done / total * 100 if total else 0,
+        }
+
+    def trial_stats(self, **filters):
+        """Filtrdagi lidlarning sinov darslari natijalar bo'yicha"""
+        selected = self._selected_rows('trials', filters)
+        results = self.snapshot.column('trials', 'result')[selected].astype('int64')
+        counts = np.bincount(results + 1, minlength=len(self.snapshot.meta['results']) + 1)
+        labels = dict(TrialLesson.RESULT_CHOICES)
+        rows = [{'result': 'Natija kiritilmagan', 'count': int(counts[0])}]
+        rows += [
+            {'result': labels.get(key, key), 'count': int(counts[index + 1])}
+            for index, key in enumerate(self.snapshot.meta['results'])
+        ]
+        return {'total': int(selected.sum()), 'by_result': rows}
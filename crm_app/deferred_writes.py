@@ -0,0 +1,215 @@
+"""
+Signallarni kechiktirilgan ommaviy yozish rejimi (import va ommaviy amallar uchun).
+
+deferred_side_effects() ichida Lead va FollowUp post_save signallari darhol ishlamaydi -
+faqat yengil hodisa navbatga qo'yiladi. Blokdan chiqishda flush():
+- yangi lidlarni bitta bulk INSERT bilan yozadi;
+- ularning status hodisalari, KPI deltalari va 'new_lead' follow-up'larini butun partiya
+  uchun birgalikda hisoblaydi (sotuvchi bo'yicha umumiy holat - SalesLoadCounters);
+- mavjud lidlar hodisalarini odatdagi signal handlerlari orqali qayta ijro etadi;
+- follow-up KPI va eslatmalarini bitta chaqiruvda qo'llaydi;
+- har bir sotuvchiga bitta xabar job'i yuboradi (tranzaksiya commit bo'lgandan keyin).
+
+Blok tranzaksiya ichida ishlaydi: xatolikda lidlar ham, yon ta'sirlar ham yozilmaydi.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+_local = threading.local()
+
+
+def current_batch():
+    """Joriy oqimdagi faol DeferredBatch (bo'lmasa None)"""
+    return getattr(_local, 'batch', None)
+
+
+@contextmanager
+def deferred_side_effects():
+    """
+    Lead/FollowUp signallarini blok oxirigacha kechiktirish.
+    Ichma-ich chaqirilsa tashqi blok partiyasi ishlatiladi (flush faqat bir marta).
+
+    Ishlatish:
+        with deferred_side_effects() as batch:
+            for lead in leads:
+                batch.save_lead(lead)
+                batch.notify_new_lead(lead)
+    """
+    batch = current_batch()
+    if batch is not None:
+        yield batch
+        return
+
+    batch = DeferredBatch()
+    _local.batch = batch
+    try:
+        with transaction.atomic():
+            yield batch
+            # flush vaqtida signallar odatdagidek ishlaydi
+            _local.batch = None
+            batch.flush()
+    finally:
+        _local.batch = None
+
+
+class DeferredBatch:
+    """deferred_side_effects() bloki davomida yig'ilgan hodisalar"""
+
+    def __init__(self):
+        self.new_leads = []          # bulk INSERT qilinadigan lidlar
+        self.lead_events = []        # [(lead, created, old_status, old_sales_id), ...] - save() qilinganlar
+        self.followup_changes = []   # [(eski KPI holati, yangi KPI holati), ...]
+        self.reminders = []          # [(followup_id, due_date), ...]
+        self.notify_leads = []       # xabar yuboriladigan lidlar (yangilarining id si flush'dan keyin ma'lum)
+
+    # ---- blok ichida ----
+
+    def save_lead(self, lead):
+        """
+        Lidni saqlash: yangi lid bulk INSERT uchun navbatga qo'yiladi, mavjudi darhol save() qilinadi.
+        Lead.save() dagi lost_at/enrolled_at va guruh hisoblagichlari mantiqi kerak bo'lgan
+        statuslar (lost, enrolled) odatdagidek save() qilinadi.
+        """
+        if lead.pk is None and lead.status not in ('lost', 'enrolled'):
+            self.new_leads.append(lead)
+        else:
+            lead.save()
+
+    def notify_new_lead(self, lead):
+        """Sotuvchiga yangi lid xabari (flush'da sotuvchi bo'yicha bitta digest)"""
+        self.notify_leads.append(lead)
+
+    def lead_saved(self, lead, created, old_status, old_sales_id):
+        """Lead post_save hodisasi (signals.defer_lead_side_effects)"""
+        self.lead_events.append((lead, created, old_status, old_sales_id))
+
+    def followup_changed(self, old_state, new_state):
+        """FollowUp KPI holati o'zgarishi (signals.update_followup_kpi)"""
+        self.followup_changes.append((old_state, new_state))
+
+    def followup_reminder(self, followup_id, due_date):
+        """FollowUp eslatmasini rejalashtirish (signals.schedule_followup_reminder)"""
+        self.reminders.append((followup_id, due_date))
+
+    # ---- blokdan chiqishda ----
+
+    def flush(self):
+        from .models import Lead
+        from .services import KPICounters, ScheduledActionService, SalesLoadCounters
+
+        # save() orqali yaratilgan lidlar ham shu yo'l bilan (ularning signal handlerlari o'tkazib yuborilgan)
+        created_leads = self.new_leads + [lead for lead, created, _, _ in self.lead_events if created]
+        # Sotuvchi yuklanishi INSERT'dan oldin o'qiladi (cache miss'da DB dan qurilsa partiya ikki marta sanalmasin)
+        load = SalesLoadCounters.get_many([lead.assigned_sales_id for lead in created_leads])
+        if self.new_leads:
+            Lead.objects.bulk_create(self.new_leads, batch_size=500)
+            for lead in self.new_leads:
+                lead._store_tracked()
+            SalesLoadCounters.leads_created(self.new_leads)
+
+        followups = self._created_leads_side_effects(created_leads, load)
+        self._replay_lead_events([event for event in self.lead_events if not event[1]])
+
+        KPICounters.followups_changed(self.followup_changes)
+        ScheduledActionService.schedule_many('followup_reminder', self.reminders)
+        self._publish_notifications(created_leads, followups)
+
+    def _created_leads_side_effects(self, leads, load):
+        """
+        Yangi lidlar: status jurnali, KPI (biriktirish + boshlang'ich status) va 'new_lead' follow-up'lar.
+        Har bir lid uchun signal handleri bilan bir xil natija, lekin so'rovlar soni partiya hajmiga bog'liq emas.
+        load: SalesLoadCounters.get_many() - bulk INSERT'dan oldingi holat, lidlar tartibida oshiriladi
+        """
+        from .models import FollowUp, LeadStatusEvent
+        from .services import KPICounters, FollowUpService
+
+        if not leads:
+            return []
+
+        events = LeadStatusEvent.objects.bulk_create([
+            LeadStatusEvent(lead=lead, from_status='', to_status=lead.status, sales_id=lead.assigned_sales_id)
+            for lead in leads
+        ], batch_size=500)
+        KPICounters.leads_created(events)
+
+        assigned = [lead for lead in leads if lead.assigned_sales_id]
+        if not assigned:
+            return []
+
+        now = timezone.now()
+        # Sotuvchi bo'yicha umumiy holat: bugungi yangi lidlar va follow-up yuki
+        today_counts = {sales_id: counts[0] for sales_id, counts in load.items()}
+        current_followups = {sales_id: counts[1] for sales_id, counts in load.items()}
+        # save() orqali yaratilganlar update_sales_load_counters signalida allaqachon sanalgan
+        bulk_inserted = {id(lead) for lead in self.new_leads}
+
+        plans = []
+        for lead in assigned:
+            sales_id = lead.assigned_sales_id
+            if lead.status == 'new' and id(lead) in bulk_inserted:
+                today_counts[sales_id] = today_counts.get(sales_id, 0) + 1
+            plans.append((lead, current_followups.get(sales_id, 0), today_counts.get(sales_id, 0)))
+            # Har bir yaratilgan follow-up keyingi 24 soat ichida (15-30 daqiqa) - yuk oshadi
+            current_followups[sales_id] = current_followups.get(sales_id, 0) + 1
+
+        due_dates = FollowUpService.calculate_due_dates_bulk([
+            (lead.assigned_sales_id, now, FollowUpService.new_lead_delay(today_new_leads, followups_count))
+            for lead, followups_count, today_new_leads in plans
+        ])
+        followups = FollowUpService.bulk_create_once([
+            FollowUp(
+                lead=lead,
+                sales_id=lead.assigned_sales_id,
+                due_date=due_date,
+                is_overdue=due_date < now,
+                kind='new_lead',
+                notes=FollowUpService.NEW_LEAD_NOTES.format(
+                    current_followups=followups_count, today_new_leads=today_new_leads
+                )
+            )
+            for (lead, followups_count, today_new_leads), due_date in zip(plans, due_dates)
+        ])
+        # bulk_create post_save signalini chaqirmaydi - KPI va eslatmalar umumiy navbatga
+        for followup in followups:
+            self.followup_changes.append((None, KPICounters.followup_state(followup)))
+            self.reminders.append((followup.id, followup.due_date))
+        return followups
+
+    @staticmethod
+    def _replay_lead_events(events):
+        """
+        Mavjud lidlar hodisalari: Lead post_save handlerlarini yozilgan eski qiymatlar bilan
+        qayta ijro etish (FieldTrackerMixin nusxasi vaqtincha eski holatga qaytariladi).
+        """
+        from .models import Lead
+        from . import signals
+
+        for lead, _, old_status, old_sales_id in events:
+            lead._tracked_values.update({'status': old_status, 'assigned_sales': old_sales_id})
+            for handler in (
+                signals.record_status_event,
+                signals.update_assignment_kpi,
+                signals.create_followup_on_status_change,
+            ):
+                handler(sender=Lead, instance=lead, created=False)
+            lead._store_tracked()
+
+    def _publish_notifications(self, created_leads, followups):
+        """Har bir sotuvchiga bitta xabar job'i: yangi/biriktirilgan lidlar digesti"""
+        from .tasks import send_new_leads_digest_task
+
+        lead_ids_by_sales = {}
+        seen = set()
+        followup_leads = {followup.lead_id for followup in followups}
+        for lead in self.notify_leads + [lead for lead in created_leads if lead.id in followup_leads]:
+            if lead.assigned_sales_id and lead.id not in seen:
+                seen.add(lead.id)
+                lead_ids_by_sales.setdefault(lead.assigned_sales_id, []).append(lead.id)
+
+        for sales_id, lead_ids in lead_ids_by_sales.items():
+            transaction.on_commit(
+                lambda sales_id=sales_id, lead_ids=lead_ids: send_new_leads_digest_task.delay(sales_id, lead_ids)
+            )
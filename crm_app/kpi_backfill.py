@@ -0,0 +1,158 @@
+"""
+KPI backfill - yetishmayotgan kunlik KPI qatorlarini parallel hisoblash
+
+Ish (sotuvchi, sanalar bo'lagi) birliklariga bo'linadi va ProcessPoolExecutor da bajariladi.
+Har bir worker jarayoni o'z DB ulanishini ochadi (ota jarayon ulanishlari fork'dan oldin yopiladi).
+Web so'rovlar KPI hisoblamaydi - yetishmagan kunlar "hisoblanmoqda", eskirganlari oxirgi
+qiymati bilan "eskirgan" belgisi bilan ko'rsatiladi va schedule_recompute() orqali
+recompute_kpi_task ga navbatga qo'yiladi.
+"""
+import time
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import connection, connections
+from django.utils import timezone
+
+from .models import User, KPI
+
+
+DEFAULT_CHUNK_DAYS = 7
+RECOMPUTE_KEY = 'kpi_recompute:{sales_id}:{date}'
+RECOMPUTE_DEDUPE_SECONDS = 10 * 60
+
+
+def _init_worker():
+    """Worker jarayoni: Django sozlash (spawn uchun) va meros ulanishlarni tashlash"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def backfill_unit(sales_id, dates):
+    """
+    Bitta ish birligi: bitta sotuvchi uchun sanalar bo'lagi
+    Returns: (sales_id, hisoblangan kunlar soni)
+    """
+    from .services import KPIService
+
+    sales = User.objects.get(pk=sales_id)
+    for date in dates:
+        KPIService.calculate_daily_kpi_all(date, [sales])
+    return sales_id, len(dates)
+
+
+def plan_backfill(start_date, end_date, sales_ids=None, missing_only=True, chunk_days=DEFAULT_CHUNK_DAYS):
+    """
+    Ish birliklarini tuzish
+    Args:
+        start_date, end_date: Sana oralig'i (bugundan keyingi kunlar olinmaydi)
+        sales_ids: Sotuvchilar (None - barcha faol sotuvchilar)
+        missing_only: Faqat KPI qatori yo'q kunlar
+        chunk_days: Bitta birlikdagi kunlar soni
+    Returns: [(sales_id, [date, ...]), ...]
+    """
+    end_date = min(end_date, timezone.localdate())
+    if sales_ids is None:
+        sales_ids = User.objects.filter(role='sales', is_active_sales=True).values_list('id', flat=True)
+    sales_ids = list(sales_ids)
+
+    existing = set()
+    if missing_only:
+        existing = set(KPI.objects.filter(
+            sales_id__in=sales_ids,
+            date__gte=start_date,
+            date__lte=end_date
+        ).values_list('sales_id', 'date'))
+
+    dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    units = []
+    for sales_id in sales_ids:
+        todo = [date for date in dates if (sales_id, date) not in existing]
+        for offset in range(0, len(todo), chunk_days):
+            units.append((sales_id, todo[offset:offset + chunk_days]))
+    return units
+
+
+def run_backfill(units, workers=1, progress=print):
+    """
+    Ish birliklarini bajarish
+    workers > 1 bo'lsa ProcessPoolExecutor ishlatiladi (SQLite da bitta yozuvchi - 1 ga tushiriladi).
+    Returns: {'units', 'days', 'failed', 'seconds', 'days_per_second'}
+    """
+    if workers > 1 and connection.vendor == 'sqlite':
+        progress("SQLite bir vaqtda bitta yozuvchini qo'llaydi - backfill bitta jarayonda bajariladi")
+        workers = 1
+
+    total_days = sum(len(dates) for _, dates in units)
+    started = time.monotonic()
+    done_days = failed = 0
+
+    def report(done_units):
+        elapsed = time.monotonic() - started
+        rate = done_days / elapsed if elapsed else 0
+        progress(
+            f"[{timezone.now()}] KPI backfill: {done_units}/{len(units)} birlik, "
+            f"{done_days}/{total_days} kun ({rate:.1f} kun/s)"
+        )
+
+    if workers <= 1:
+        for index, (sales_id, dates) in enumerate(units, 1):
+            try:
+                done_days += backfill_unit(sales_id, dates)[1]
+            except Exception as e:
+                failed += 1
+                progress(f"KPI backfill xatolik (sotuvchi {sales_id}): {type(e).__name__}: {e}")
+            report(index)
+    else:
+        # Ota jarayon ulanishlari workerlarga o'tmasligi kerak
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(backfill_unit, sales_id, dates): sales_id
+                for sales_id, dates in units
+            }
+            for index, future in enumerate(as_completed(futures), 1):
+                try:
+                    done_days += future.result()[1]
+                except Exception as e:
+                    failed += 1
+                    progress(f"KPI backfill xatolik (sotuvchi {futures[future]}): {type(e).__name__}: {e}")
+                report(index)
+
+    seconds = time.monotonic() - started
+    return {
+        'units': len(units),
+        'days': done_days,
+        'failed': failed,
+        'seconds': seconds,
+        'days_per_second': done_days / seconds if seconds else 0,
+    }
+
+
+def schedule_recompute(sales, dates):
+    """
+    Sahifada yo'q yoki eskirgan KPI kunlarini recompute_kpi_task ga qo'yish
+    Har bir (sotuvchi, sana) uchun alohida dedupe kaliti - bir kun RECOMPUTE_DEDUPE_SECONDS
+    ichida bir martadan ko'p navbatga qo'yilmaydi. Returns: navbatga qo'yilgan sanalar
+    """
+    from django.core.cache import cache
+
+    keys = {
+        date: RECOMPUTE_KEY.format(sales_id=sales.id, date=date.isoformat())
+        for date in sorted(set(dates))
+    }
+    dates = [date for date, key in keys.items() if cache.add(key, 1, RECOMPUTE_DEDUPE_SECONDS)]
+    if not dates:
+        return []
+    try:
+        from .tasks import recompute_kpi_task
+        recompute_kpi_task.delay(sales.id, [date.isoformat() for date in dates])
+        return dates
+    except Exception as e:
+        print(f"KPI qayta hisoblash task ishga tushmadi: {type(e).__name__}: {e}")
+        cache.delete_many([keys[date] for date in dates])
+        return []
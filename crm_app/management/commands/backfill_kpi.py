@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from crm_app.models import User
+from crm_app.kpi_backfill import plan_backfill, run_backfill, DEFAULT_CHUNK_DAYS
+
+
+class Command(BaseCommand):
+    help = 'Yetishmagan kunlik KPI qatorlarini parallel hisoblaydi (ProcessPoolExecutor)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Boshlanish sanasi (YYYY-MM-DD), standart: 30 kun oldin')
+        parser.add_argument('--end', help='Tugash sanasi (YYYY-MM-DD), standart: bugun')
+        parser.add_argument('--sales', nargs='*', help='Sotuvchilar (username yoki ID), standart: barcha faol')
+        parser.add_argument('--workers', type=int, default=4, help='Jarayonlar soni')
+        parser.add_argument('--chunk-days', type=int, default=DEFAULT_CHUNK_DAYS, help='Bitta ish birligidagi kunlar')
+        parser.add_argument('--force', action='store_true', help='Mavjud KPI qatorlarini ham qayta hisoblash')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        try:
+            start_date = date.fromisoformat(options['start']) if options['start'] else today - timedelta(days=30)
+            end_date = date.fromisoformat(options['end']) if options['end'] else today
+        except ValueError as e:
+            raise CommandError(f"Sana noto'g'ri: {e}")
+        if start_date > end_date:
+            raise CommandError('--start --end dan keyin bo\'lmasligi kerak')
+
+        sales_ids = None
+        if options['sales']:
+            sales_ids = []
+            for value in options['sales']:
+                lookup = {'pk': value} if value.isdigit() else {'username': value}
+                try:
+                    sales_ids.append(User.objects.get(role='sales', **lookup).id)
+                except User.DoesNotExist:
+                    raise CommandError(f'Sotuvchi topilmadi: {value}')
+
+        units = plan_backfill(
+            start_date, end_date,
+            sales_ids=sales_ids,
+            missing_only=not options['force'],
+            chunk_days=options['chunk_days']
+        )
+        if not units:
+            self.stdout.write(self.style.SUCCESS('Hisoblanadigan kun yo\'q'))
+            return
+
+        self.stdout.write(
+            f'{start_date} - {end_date}: {len(units)} ta ish birligi, '
+            f'{sum(len(dates) for _, dates in units)} kun, {options["workers"]} ta jarayon'
+        )
+        result = run_backfill(units, workers=options['workers'], progress=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['days']} kun hisoblandi ({result['failed']} xatolik), "
+            f"{result['seconds']:.1f} s, {result['days_per_second']:.1f} kun/s"
+        ))
@@ -0,0 +1,89 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from crm_app.models import User, Lead, FollowUp
+from crm_app.services import DailyReport
+
+
+class Command(BaseCommand):
+    help = 'Kunlik Telegram hisobotini yig\'ish: sotuvchilar soni oshganda so\'rovlar soni o\'zgarmasligini tekshiradi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,50,200', help='Sotuvchilar soni (vergul bilan)')
+        parser.add_argument('--leads', type=int, default=20, help='Har bir vaqtinchalik sotuvchiga lidlar soni')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',') if size.strip()})
+        except ValueError:
+            raise CommandError('--sizes butun sonlar ro\'yxati bo\'lishi kerak, masalan: 1,10,50')
+        if not sizes or sizes[0] < 1:
+            raise CommandError('--sizes musbat sonlardan iborat bo\'lishi kerak')
+
+        today = timezone.now().date()
+        results = []
+        # Vaqtinchalik sotuvchilar va lidlar tranzaksiya oxirida bekor qilinadi
+        with transaction.atomic():
+            sales_users = self._create_sales_users(max(sizes), options['leads'])
+            for size in sizes:
+                queries = []
+                with connection.execute_wrapper(
+                    lambda execute, sql, params, many, context: queries.append(sql) or execute(sql, params, many, context)
+                ):
+                    started = time.perf_counter()
+                    DailyReport(today, sales_users[:size]).render()
+                    elapsed = time.perf_counter() - started
+                results.append((size, len(queries)))
+                self.stdout.write(
+                    f'{size:>6} sotuvchi: {len(queries)} ta so\'rov, {elapsed * 1000:.1f} ms'
+                )
+            transaction.set_rollback(True)
+
+        query_counts = {count for _, count in results}
+        if len(query_counts) == 1:
+            self.stdout.write(self.style.SUCCESS(
+                f'So\'rovlar soni o\'zgarmas: {query_counts.pop()} ta ({sizes[0]}..{sizes[-1]} sotuvchi)'
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'So\'rovlar soni sotuvchilar soniga bog\'liq: '
+                + ', '.join(f'{size}={count}' for size, count in results)
+            ))
+
+    def _create_sales_users(self, count, leads_per_sales):
+        """Benchmark uchun vaqtinchalik sotuvchilar, lidlar va follow-up'lar (signalsiz bulk_create)"""
+        prefix = f'benchmark_{int(time.time())}'
+        User.objects.bulk_create([
+            User(username=f'{prefix}_{index}', role='sales', is_active_sales=True)
+            for index in range(count)
+        ])
+        sales_users = list(User.objects.filter(username__startswith=f'{prefix}_').order_by('id'))
+
+        statuses = ['new', 'contacted', 'interested', 'trial_registered', 'enrolled', 'lost']
+        Lead.objects.bulk_create([
+            Lead(
+                name=f'Benchmark {index}',
+                phone=f'+99890{sales.id % 1000:03d}{index:04d}',
+                assigned_sales=sales,
+                status=statuses[index % len(statuses)],
+            )
+            for sales in sales_users
+            for index in range(leads_per_sales)
+        ], batch_size=500)
+
+        now = timezone.now()
+        leads = Lead.objects.filter(assigned_sales__in=sales_users).values_list('id', 'assigned_sales_id')
+        FollowUp.objects.bulk_create([
+            FollowUp(
+                lead_id=lead_id,
+                sales_id=sales_id,
+                due_date=now + timedelta(hours=(lead_id % 5) * 12 - 30),
+                completed=lead_id % 3 == 0,
+                completed_at=now if lead_id % 3 == 0 else None,
+            )
+            for lead_id, sales_id in leads
+        ], batch_size=500)
+        return sales_users
@@ -0,0 +1,61 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from crm_app.models import User
+from crm_app.services import FollowUpService, WorkCalendar
+
+
+class Command(BaseCommand):
+    help = 'Follow-up vaqtini hisoblash: eski (DB) va WorkCalendar usullarini solishtiradi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=10000, help='Chaqiruvlar soni')
+        parser.add_argument('--sales-id', type=int, help='Sotuvchi ID (bo\'sh bo\'lsa birinchi faol sotuvchi)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        sales_users = User.objects.filter(role='sales', is_active_sales=True)
+        if options['sales_id']:
+            sales_users = sales_users.filter(id=options['sales_id'])
+        sales = sales_users.first()
+        if not sales:
+            raise CommandError('Faol sotuvchi topilmadi')
+
+        # Bir xil tasodifiy kirish ma'lumotlari ikkala usul uchun
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        delays = [timedelta(minutes=15), timedelta(minutes=30), timedelta(hours=2),
+                  timedelta(hours=24), timedelta(days=3), timedelta(days=7)]
+        calls = [
+            (now + timedelta(minutes=rng.randint(-1440, 30 * 1440)), rng.choice(delays))
+            for _ in range(options['calls'])
+        ]
+
+        WorkCalendar.invalidate(sales.id)
+        results = {}
+        for label, func in (
+            ('db', FollowUpService.calculate_work_hours_due_date_db),
+            ('calendar', FollowUpService.calculate_work_hours_due_date),
+        ):
+            queries = []
+            with connection.execute_wrapper(
+                lambda execute, sql, params, many, context: queries.append(sql) or execute(sql, params, many, context)
+            ):
+                started = time.perf_counter()
+                for base_time, delay in calls:
+                    func(sales, base_time, delay)
+                elapsed = time.perf_counter() - started
+            results[label] = (elapsed, len(queries))
+            self.stdout.write(
+                f'{label:>9}: {elapsed:.3f} s, {elapsed / len(calls) * 1e6:.1f} µs/chaqiruv, '
+                f'{len(queries)} ta so\'rov'
+            )
+
+        speedup = results['db'][0] / results['calendar'][0] if results['calendar'][0] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{sales.username}: {len(calls)} ta chaqiruv, WorkCalendar {speedup:.1f}x tezroq'
+        ))
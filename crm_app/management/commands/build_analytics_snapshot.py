@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from crm_app.analytics_snapshot import build_snapshot, get_engine, NUMPY_AVAILABLE
+
+
+class Command(BaseCommand):
+    help = 'Lead, FollowUp va TrialLesson ni ustunli .npy analitika snapshotiga eksport qiladi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Snapshot papkasi (standart: settings.ANALYTICS_SNAPSHOT_DIR)')
+
+    def handle(self, *args, **options):
+        if not NUMPY_AVAILABLE:
+            raise CommandError("NumPy o'rnatilmagan: pip install numpy")
+
+        result = build_snapshot(options['dir'])
+        self.stdout.write(
+            f"{result['path']}: {result['leads']} lid, {result['followups']} follow-up, {result['trials']} sinov"
+        )
+
+        # Tekshiruv: snapshot ochiladi va voronka hisoblanadi
+        engine = get_engine(options['dir'])
+        funnel = engine.funnel() if engine else []
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot tayyor ({result['seconds']:.1f} s): "
+            + ', '.join(f"{row['label']} {row['count']}" for row in funnel)
+        ))
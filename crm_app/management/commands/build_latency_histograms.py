@@ -0,0 +1,35 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from crm_app.services import LatencyStats
+
+
+class Command(BaseCommand):
+    help = "O'tish vaqtlari gistogrammalarini (LatencyHistogram) kunlar bo'yicha qayta yozadi"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Oxirgi necha kun (standart: 90)')
+        parser.add_argument('--start', help='Boshlanish sanasi (YYYY-MM-DD), --days o\'rniga')
+        parser.add_argument('--end', help='Tugash sanasi (YYYY-MM-DD), standart: bugun')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        try:
+            end_date = date.fromisoformat(options['end']) if options['end'] else today
+            start_date = (
+                date.fromisoformat(options['start']) if options['start']
+                else end_date - timedelta(days=options['days'] - 1)
+            )
+        except ValueError as e:
+            raise CommandError(f"Sana noto'g'ri: {e}")
+        if start_date > end_date:
+            raise CommandError('--start --end dan keyin bo\'lmasligi kerak')
+
+        rows = 0
+        day = start_date
+        while day <= end_date:
+            rows += LatencyStats.rebuild_day(day)
+            day += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(
+            f'{start_date} - {end_date}: {(end_date - start_date).days + 1} kun, {rows} ta gistogramma qatori'
+        ))
@@ -11,9 +11,9 @@ class Command(BaseCommand):
         today = timezone.now().date()
         sales_users = User.objects.filter(role='sales', is_active_sales=True)
         
-        for sales in sales_users:
-            kpi = KPIService.calculate_daily_kpi(sales, today)
+        kpis = KPIService.calculate_daily_kpi_all(today, sales_users)
+        for kpi in kpis.values():
             self.stdout.write(
-                self.style.SUCCESS(f'{sales.username} KPI hisoblandi: {kpi.conversion_rate:.1f}%')
+                self.style.SUCCESS(f'{kpi.sales.username} KPI hisoblandi: {kpi.conversion_rate:.1f}%')
             )
 
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from crm_app.telegram_sender import TelegramOutboxSender, get_outbox_stats, format_outbox_stats
+
+
+class Command(BaseCommand):
+    help = 'Telegram outbox navbatini rate limit bilan yuboradi (alohida jarayon)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Parallel HTTP so\'rovlar soni')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--once', action='store_true', help='Navbat bo\'shaguncha yuborib to\'xtash')
+        parser.add_argument('--stats', action='store_true', help='Faqat navbat statistikasini ko\'rsatish')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(format_outbox_stats(get_outbox_stats()))
+            return
+
+        if not settings.TELEGRAM_BOT_TOKEN:
+            raise CommandError('TELEGRAM_BOT_TOKEN sozlanmagan!')
+
+        sender = TelegramOutboxSender(workers=options['workers'], batch_size=options['batch_size'])
+        self.stdout.write(f'Telegram sender ishga tushdi ({sender.workers} ta worker)')
+        try:
+            if options['once']:
+                total = 0
+                while True:
+                    claimed, sent, deferred = sender.drain_once()
+                    total += sent
+                    if not claimed or deferred == claimed:
+                        break
+                self.stdout.write(self.style.SUCCESS(f'{total} ta xabar yuborildi'))
+            else:
+                sender.run_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sender.close()
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0012_user_assigned_courses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('overdue_followup', 'Overdue follow-up'), ('followup_reminder', 'Follow-up eslatmasi'), ('trial_reminder', 'Sinov eslatmasi'), ('post_trial_reminder', 'Sinovdan keyingi sotuv eslatmasi')], max_length=30)),
+                ('object_id', models.PositiveIntegerField(help_text='FollowUp yoki TrialLesson ID')),
+                ('chat_id', models.CharField(max_length=100)),
+                ('last_sent_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'last_sent_at'], name='ledger_kind_sent_idx')],
+                'unique_together': {('kind', 'object_id', 'chat_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:37
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0013_notificationledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.CharField(max_length=100)),
+                ('text', models.TextField()),
+                ('parse_mode', models.CharField(blank=True, default='HTML', max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Kutilmoqda'), ('sending', 'Yuborilmoqda'), ('sent', 'Yuborildi'), ('failed', 'Xatolik')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Keyingi urinish vaqti (backoff)')),
+                ('last_error', models.TextField(blank=True)),
+                ('latency_ms', models.IntegerField(blank=True, help_text="Navbatga qo'shilgandan yetkazilgunicha (ms)", null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'), models.Index(fields=['status', 'sent_at'], name='outbox_status_sent_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0014_telegramoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('followup_reminder', 'Follow-up eslatmasi'), ('trial_end_followup', 'Sinov tugagandan keyin follow-up'), ('post_trial_reminder', 'Sinovdan keyingi sotuv eslatmasi'), ('trial_followup_1d', 'Sinovdan keyin 24 soat follow-up'), ('trial_followup_3d', 'Sinovdan keyin 3-kun follow-up'), ('trial_followup_7d', 'Sinovdan keyin 7-kun follow-up'), ('trial_followup_14d', 'Sinovdan keyin 14-kun follow-up')], max_length=30)),
+                ('object_id', models.PositiveIntegerField(help_text='FollowUp yoki TrialLesson ID')),
+                ('fire_at', models.DateTimeField(help_text='Bajarish vaqti (running holatida - lease tugash vaqti)')),
+                ('state', models.CharField(choices=[('pending', 'Kutilmoqda'), ('running', 'Bajarilmoqda'), ('done', 'Bajarildi'), ('failed', 'Xatolik')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'fire_at'], name='action_state_fire_idx'), models.Index(fields=['kind', 'object_id'], name='action_kind_object_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:41
+
+from datetime import datetime, timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+
+TRIAL_LESSON_DURATION = timedelta(minutes=90)
+TRIAL_FOLLOWUP_STAGES = {
+    'trial_followup_1d': timedelta(hours=24),
+    'trial_followup_3d': timedelta(days=3),
+    'trial_followup_7d': timedelta(days=7),
+    'trial_followup_14d': timedelta(days=14),
+}
+
+
+def backfill_scheduled_actions(apps, schema_editor):
+    """Mavjud follow-up va sinovlar uchun amallarni yaratish (avval beat tasklar tekshirar edi)"""
+    FollowUp = apps.get_model('crm_app', 'FollowUp')
+    TrialLesson = apps.get_model('crm_app', 'TrialLesson')
+    ScheduledAction = apps.get_model('crm_app', 'ScheduledAction')
+
+    now = timezone.now()
+    today_start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    actions = []
+
+    # Bugungi va kelajakdagi eslatma yuborilmagan follow-up'lar
+    for followup_id, due_date in FollowUp.objects.filter(
+        completed=False,
+        reminder_sent=False,
+        sales__isnull=False,
+        due_date__gte=today_start
+    ).values_list('id', 'due_date').iterator():
+        actions.append(ScheduledAction(kind='followup_reminder', object_id=followup_id, fire_at=due_date))
+
+    # Oxirgi 15 kundagi sinovlar
+    for trial in TrialLesson.objects.filter(
+        date__gte=now.date() - timedelta(days=15)
+    ).values('id', 'date', 'time', 'result', 'sales_reminder_sent').iterator():
+        trial_datetime = timezone.make_aware(datetime.combine(trial['date'], trial['time']))
+        if not trial['result']:
+            actions.append(ScheduledAction(
+                kind='trial_end_followup', object_id=trial['id'], fire_at=trial_datetime + TRIAL_LESSON_DURATION
+            ))
+        elif trial['result'] == 'attended':
+            if not trial['sales_reminder_sent'] and trial['date'] >= now.date() - timedelta(days=1):
+                actions.append(ScheduledAction(kind='post_trial_reminder', object_id=trial['id'], fire_at=now))
+            for kind, offset in TRIAL_FOLLOWUP_STAGES.items():
+                if trial_datetime + offset > now - timedelta(hours=1):
+                    actions.append(ScheduledAction(kind=kind, object_id=trial['id'], fire_at=trial_datetime + offset))
+
+    ScheduledAction.objects.bulk_create(actions, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0015_scheduledaction'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_scheduled_actions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0016_backfill_scheduled_actions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('new', 'Yangi'), ('contacted', 'Aloqa qilindi'), ('interested', 'Qiziqmoqda'), ('trial_registered', 'Sinovga yozildi'), ('trial_attended', 'Sinovga keldi'), ('trial_not_attended', 'Sinovga kelmadi'), ('offer_sent', 'Sotuv taklifi'), ('enrolled', 'Kursga yozildi'), ('lost', "Yo'qotilgan lid"), ('reactivation', 'Qayta aloqa lid')], help_text="Bo'sh - lid yaratilgan", max_length=20)),
+                ('to_status', models.CharField(choices=[('new', 'Yangi'), ('contacted', 'Aloqa qilindi'), ('interested', 'Qiziqmoqda'), ('trial_registered', 'Sinovga yozildi'), ('trial_attended', 'Sinovga keldi'), ('trial_not_attended', 'Sinovga kelmadi'), ('offer_sent', 'Sotuv taklifi'), ('enrolled', 'Kursga yozildi'), ('lost', "Yo'qotilgan lid"), ('reactivation', 'Qayta aloqa lid')], max_length=20)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='crm_app.lead')),
+                ('sales', models.ForeignKey(blank=True, help_text="O'zgarish vaqtidagi sotuvchi", null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lead_status_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['at'],
+                'indexes': [models.Index(fields=['sales', 'at'], name='status_event_sales_at_idx'), models.Index(fields=['to_status', 'at'], name='status_event_to_at_idx'), models.Index(fields=['lead', 'at'], name='status_event_lead_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:48
+
+from django.db import migrations
+
+
+def backfill_lead_status_events(apps, schema_editor):
+    """
+    Mavjud lidlar uchun taxminiy tarix: yaratilish hodisasi va joriy statusga o'tish
+    (o'tish vaqti - enrolled_at / lost_at, bo'lmasa updated_at)
+    """
+    Lead = apps.get_model('crm_app', 'Lead')
+    LeadStatusEvent = apps.get_model('crm_app', 'LeadStatusEvent')
+
+    events = []
+    for lead in Lead.objects.values(
+        'id', 'status', 'assigned_sales_id', 'created_at', 'updated_at', 'enrolled_at', 'lost_at'
+    ).iterator():
+        events.append(LeadStatusEvent(
+            lead_id=lead['id'], from_status='', to_status='new',
+            sales_id=lead['assigned_sales_id'], at=lead['created_at']
+        ))
+        if lead['status'] != 'new':
+            if lead['status'] == 'enrolled' and lead['enrolled_at']:
+                at = lead['enrolled_at']
+            elif lead['status'] == 'lost' and lead['lost_at']:
+                at = lead['lost_at']
+            else:
+                at = lead['updated_at']
+            events.append(LeadStatusEvent(
+                lead_id=lead['id'], from_status='new', to_status=lead['status'],
+                sales_id=lead['assigned_sales_id'], at=max(at, lead['created_at'])
+            ))
+        if len(events) >= 1000:
+            LeadStatusEvent.objects.bulk_create(events)
+            events = []
+    LeadStatusEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0017_leadstatusevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_lead_status_events, migrations.RunPython.noop),
+    ]
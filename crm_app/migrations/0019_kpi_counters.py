@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0018_backfill_lead_status_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kpi',
+            name='followups_completed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='kpi',
+            name='leads_assigned',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='kpi',
+            name='reconcile_delta',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='kpi',
+            name='reconciled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='kpi',
+            name='response_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='kpi',
+            name='response_time_total',
+            field=models.FloatField(default=0.0, help_text="Javob vaqtlari yig'indisi (daqiqa)"),
+        ),
+    ]
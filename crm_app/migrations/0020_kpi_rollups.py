@@ -0,0 +1,76 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0019_kpi_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='kpi',
+            name='in_rollup',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='KPIWeekly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('days', models.IntegerField(default=0, help_text='Davrdagi kunlik KPI qatorlari soni')),
+                ('daily_contacts', models.IntegerField(default=0)),
+                ('daily_followups', models.IntegerField(default=0)),
+                ('followups_completed', models.IntegerField(default=0)),
+                ('followup_completion_rate', models.FloatField(default=0.0, help_text="Kunlik foizlar yig'indisi")),
+                ('trials_registered', models.IntegerField(default=0)),
+                ('trials_to_sales', models.IntegerField(default=0)),
+                ('leads_assigned', models.IntegerField(default=0)),
+                ('conversion_rate', models.FloatField(default=0.0, help_text="Kunlik foizlar yig'indisi")),
+                ('response_count', models.IntegerField(default=0)),
+                ('response_time_total', models.FloatField(default=0.0)),
+                ('response_time_minutes', models.FloatField(default=0.0, help_text="Kunlik o'rtachalar yig'indisi")),
+                ('overdue_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sales', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kpi_weekly', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['period_start', 'sales'], name='kpi_weekly_period_idx')],
+                'unique_together': {('sales', 'period_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='KPIMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('days', models.IntegerField(default=0, help_text='Davrdagi kunlik KPI qatorlari soni')),
+                ('daily_contacts', models.IntegerField(default=0)),
+                ('daily_followups', models.IntegerField(default=0)),
+                ('followups_completed', models.IntegerField(default=0)),
+                ('followup_completion_rate', models.FloatField(default=0.0, help_text="Kunlik foizlar yig'indisi")),
+                ('trials_registered', models.IntegerField(default=0)),
+                ('trials_to_sales', models.IntegerField(default=0)),
+                ('leads_assigned', models.IntegerField(default=0)),
+                ('conversion_rate', models.FloatField(default=0.0, help_text="Kunlik foizlar yig'indisi")),
+                ('response_count', models.IntegerField(default=0)),
+                ('response_time_total', models.FloatField(default=0.0)),
+                ('response_time_minutes', models.FloatField(default=0.0, help_text="Kunlik o'rtachalar yig'indisi")),
+                ('overdue_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('sales', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kpi_monthly', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['period_start', 'sales'], name='kpi_monthly_period_idx')],
+                'unique_together': {('sales', 'period_start')},
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:59
+
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+
+ROLLUP_FIELDS = [
+    'daily_contacts', 'daily_followups', 'followups_completed', 'followup_completion_rate',
+    'trials_registered', 'trials_to_sales', 'leads_assigned', 'conversion_rate',
+    'response_count', 'response_time_total', 'response_time_minutes', 'overdue_count',
+]
+
+
+def backfill_kpi_rollups(apps, schema_editor):
+    """Mavjud kunlik KPI qatorlaridan haftalik va oylik yig'indilarni qurish"""
+    KPI = apps.get_model('crm_app', 'KPI')
+    KPIWeekly = apps.get_model('crm_app', 'KPIWeekly')
+    KPIMonthly = apps.get_model('crm_app', 'KPIMonthly')
+
+    # Kelajak sanali qatorlar o'z kuni kelganda qo'shiladi
+    rows = KPI.objects.filter(date__lte=timezone.localdate())
+    weekly, monthly = {}, {}
+    for row in rows.values('sales_id', 'date', *ROLLUP_FIELDS).iterator():
+        date = row['date']
+        for rollups, period_start in (
+            (weekly, date - timedelta(days=date.weekday())),
+            (monthly, date.replace(day=1)),
+        ):
+            totals = rollups.setdefault((row['sales_id'], period_start), dict.fromkeys(ROLLUP_FIELDS, 0))
+            totals['days'] = totals.get('days', 0) + 1
+            for field in ROLLUP_FIELDS:
+                totals[field] += row[field] or 0
+
+    for model, rollups in ((KPIWeekly, weekly), (KPIMonthly, monthly)):
+        model.objects.bulk_create([
+            model(sales_id=sales_id, period_start=period_start, **totals)
+            for (sales_id, period_start), totals in rollups.items()
+        ], batch_size=500)
+    rows.update(in_rollup=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0020_kpi_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_kpi_rollups, migrations.RunPython.noop),
+    ]
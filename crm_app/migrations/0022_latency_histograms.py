@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0021_backfill_kpi_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatencyHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('metric', models.CharField(choices=[('first_response', 'Yangi → aloqa'), ('contact_to_trial', 'Aloqa → sinovga yozildi'), ('trial_to_enrolled', 'Sinovga keldi → kursga yozildi'), ('followup_completion', 'Qayta aloqa muddati → bajarildi')], max_length=30)),
+                ('count', models.IntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0.0)),
+                ('buckets', models.BinaryField()),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='latency_histograms', to='crm_app.course')),
+                ('sales', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='latency_histograms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date', 'metric'], name='latency_date_metric_idx'), models.Index(fields=['sales', 'date'], name='latency_sales_date_idx')],
+            },
+        ),
+    ]
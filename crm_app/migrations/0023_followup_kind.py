@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0022_latency_histograms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='followup',
+            name='kind',
+            field=models.CharField(blank=True, choices=[('', "Qo'lda / boshqa"), ('new_lead', 'Yangi lid'), ('contacted_seq_1', 'Contacted - 24 soat'), ('contacted_seq_2', 'Contacted - 3 kun'), ('contacted_seq_3', 'Contacted - 7 kun'), ('interested_day_1', 'Interested - 1-kun'), ('interested_day_3', 'Interested - 3-kun'), ('interested_day_5', 'Interested - 5-kun'), ('interested_day_7', 'Interested - 7-kun'), ('trial_reminder_1d', 'Sinovdan 1 kun oldin'), ('trial_reminder_2h', 'Sinovdan 2 soat oldin'), ('trial_no_show_30m', 'Sinovga kelmadi - 30 daqiqa'), ('trial_no_show_24h', 'Sinovga kelmadi - 24 soat'), ('trial_no_show_3d', 'Sinovga kelmadi - 3 kun'), ('trial_end', 'Sinov darsi tugadi'), ('trial_plus_24h', 'Sinovdan keyin 24 soat'), ('trial_plus_3d', 'Sinovdan keyin 3-kun'), ('trial_plus_7d', 'Sinovdan keyin 7-kun'), ('trial_plus_14d', 'Sinovdan keyin 14-kun')], default='', help_text="Avtomatik follow-up turi (bo'sh - qo'lda yaratilgan)", max_length=30),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:18
+
+from django.db import migrations
+
+
+# (notes boshlanishi, kind) - tartib muhim: aniqroq prefikslar oldin
+NOTES_PREFIXES = [
+    ("Yangi lid - darhol aloqa", 'new_lead'),
+    ("Contacted - 24 soatdan keyin", 'contacted_seq_1'),
+    ("Contacted - 3 kundan keyin", 'contacted_seq_2'),
+    ("Contacted - 7 kundan keyin", 'contacted_seq_3'),
+    ("Interested - 1 kundan keyin", 'interested_day_1'),
+    ("Interested - 3 kundan keyin", 'interested_day_3'),
+    ("Interested - 5 kundan keyin", 'interested_day_5'),
+    ("Interested - 7 kundan keyin", 'interested_day_7'),
+    ("Sinovdan 1 kun oldin", 'trial_reminder_1d'),
+    ("Sinovdan 2 soat oldin", 'trial_reminder_2h'),
+    ("Sinovga kelmadi - 30 daqiqadan keyin", 'trial_no_show_30m'),
+    ("Sinovga kelmadi - 24 soatdan keyin", 'trial_no_show_24h'),
+    ("Sinovga kelmadi - 3 kundan keyin", 'trial_no_show_3d'),
+    ("Sinov darsi tugadi", 'trial_end'),
+    ("Sinovdan keyin 24 soat", 'trial_plus_24h'),
+    ("Sinovdan keyin 3-kun", 'trial_plus_3d'),
+    ("Sinovdan keyin 7-kun", 'trial_plus_7d'),
+    ("Sinovdan keyin 14-kun", 'trial_plus_14d'),
+]
+CONTACTED_SEQUENCE_KINDS = {1: 'contacted_seq_1', 2: 'contacted_seq_2', 3: 'contacted_seq_3'}
+
+
+def parse_kind(notes, followup_sequence):
+    """Avtomatik yaratilgan follow-up turini notes matnidan aniqlash ('' - qo'lda/boshqa)"""
+    notes = notes or ''
+    if notes.startswith("Contacted - ") and followup_sequence in CONTACTED_SEQUENCE_KINDS:
+        return CONTACTED_SEQUENCE_KINDS[followup_sequence]
+    for prefix, kind in NOTES_PREFIXES:
+        if notes.startswith(prefix):
+            return kind
+    return ''
+
+
+def backfill_followup_kind(apps, schema_editor):
+    """
+    Mavjud follow-up'lar uchun kind ni notes bo'yicha to'ldirish.
+    Bir lidda bir turdagi bir nechta ochiq follow-up bo'lsa, eng birinchisi (due_date) kind oladi,
+    qolganlari '' bo'lib qoladi - keyingi migratsiyadagi unique indeks uchun.
+    """
+    FollowUp = apps.get_model('crm_app', 'FollowUp')
+
+    by_kind = {}
+    open_keys = set()
+    for followup in FollowUp.objects.order_by('due_date', 'id').values(
+        'id', 'lead_id', 'notes', 'followup_sequence', 'completed'
+    ).iterator():
+        kind = parse_kind(followup['notes'], followup['followup_sequence'])
+        if not kind:
+            continue
+        if not followup['completed']:
+            key = (followup['lead_id'], kind)
+            if key in open_keys:
+                continue
+            open_keys.add(key)
+        by_kind.setdefault(kind, []).append(followup['id'])
+
+    for kind, ids in by_kind.items():
+        for start in range(0, len(ids), 500):
+            FollowUp.objects.filter(id__in=ids[start:start + 500]).update(kind=kind)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0023_followup_kind'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_followup_kind, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0024_backfill_followup_kind'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='followup',
+            constraint=models.UniqueConstraint(condition=models.Q(('completed', False), models.Q(('kind', ''), _negated=True)), fields=('lead', 'kind'), name='followup_open_lead_kind_uniq'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0025_followup_open_lead_kind_uniq'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationledger',
+            name='kind',
+            field=models.CharField(choices=[('overdue_followup', 'Overdue follow-up'), ('overdue_manager', 'Overdue - manager ogohlantirishi'), ('followup_reminder', 'Follow-up eslatmasi'), ('trial_reminder', 'Sinov eslatmasi'), ('post_trial_reminder', 'Sinovdan keyingi sotuv eslatmasi')], max_length=30),
+        ),
+        migrations.AlterField(
+            model_name='notificationledger',
+            name='object_id',
+            field=models.PositiveIntegerField(help_text='FollowUp, TrialLesson yoki sotuvchi (overdue_manager) ID'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0026_notificationledger_overdue_manager'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegramoutbox',
+            name='receipt_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='telegramoutbox',
+            name='receipt_kind',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm_app', '0027_telegramoutbox_receipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegramoutbox',
+            name='claimed_by',
+            field=models.CharField(blank=True, help_text='Qatorni olgan sender partiyasi tokeni', max_length=32),
+        ),
+    ]
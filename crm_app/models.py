@@ -4,6 +4,74 @@ from django.utils import timezone
 from datetime import timedelta
 
 
+class FieldTrackerMixin:
+    """
+    Maydon o'zgarishlarini qo'shimcha SELECT siz kuzatish.
+    tracked_fields qiymatlari from_db() da (bazadan o'qilganda) va har save() dan keyin
+    eslab qolinadi; has_changed() va old_value() shu nusxa bilan solishtiradi.
+    post_save signallari hali eski nusxani ko'radi (nusxa save() tugagandan keyin yangilanadi).
+    ForeignKey maydonlari uchun id qiymati saqlanadi (masalan old_value('assigned_sales') -> id).
+    """
+    
+    tracked_fields = ()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._store_tracked()
+        return instance
+    
+    def _tracked_attnames(self, names=None):
+        names = self.tracked_fields if names is None else [name for name in self.tracked_fields if name in names]
+        return {name: self._meta.get_field(name).attname for name in names}
+    
+    def _store_tracked(self, names=None):
+        """Joriy qiymatlarni eslab qolish (kechiktirilgan - deferred maydonlar o'tkazib yuboriladi)"""
+        if '_tracked_values' not in self.__dict__:
+            self._tracked_values = {}
+        for name, attname in self._tracked_attnames(names).items():
+            if attname in self.__dict__:
+                self._tracked_values[name] = self.__dict__[attname]
+    
+    def _load_tracked(self):
+        """Eski qiymati noma'lum maydonlarni bazadan bir marta o'qish (deferred yoki qo'lda yaratilgan obyekt)"""
+        missing = [name for name in self.tracked_fields if name not in self.__dict__.get('_tracked_values', {})]
+        if not missing or self.pk is None:
+            return
+        attnames = self._tracked_attnames(missing)
+        row = type(self)._base_manager.using(self._state.db or 'default').filter(
+            pk=self.pk
+        ).values(*attnames.values()).first()
+        if row is not None:
+            if '_tracked_values' not in self.__dict__:
+                self._tracked_values = {}
+            for name, attname in attnames.items():
+                self._tracked_values[name] = row[attname]
+    
+    def old_value(self, name):
+        """Bazadagi (oxirgi o'qilgan/saqlangan) qiymat; yangi obyekt uchun None"""
+        if self._state.adding:
+            return None
+        if name not in self.__dict__.get('_tracked_values', {}):
+            self._load_tracked()
+        return self.__dict__.get('_tracked_values', {}).get(name)
+    
+    def has_changed(self, name):
+        """Maydon oxirgi o'qish/saqlashdan keyin o'zgarganmi (yangi obyekt - har doim True)"""
+        if self._state.adding:
+            return True
+        return self.old_value(name) != getattr(self, self._meta.get_field(name).attname)
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._store_tracked(None if update_fields is None else set(update_fields))
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._store_tracked(None if fields is None else set(fields))
+
+
 class User(AbstractUser):
     ROLE_CHOICES = [
         ('admin', 'Admin'),
@@ -215,7 +283,7 @@ class Group(models.Model):
         return self.current_students + self.trial_students.count()
 
 
-class Lead(models.Model):
+class Lead(FieldTrackerMixin, models.Model):
     STATUS_CHOICES = [
         ('new', 'Yangi'),
         ('contacted', 'Aloqa qilindi'),
@@ -263,20 +331,23 @@ class Lead(models.Model):
             models.Index(fields=['assigned_sales', 'status'], name='lead_sales_status_idx'),
         ]
     
+    # Eski qiymatlar save() va signallar uchun (FieldTrackerMixin - qo'shimcha SELECT siz)
+    tracked_fields = ('status', 'assigned_sales', 'enrolled_group')
+    
     def __str__(self):
         return f"{self.name} - {self.phone}"
     
     def save(self, *args, **kwargs):
-        # Eski statusni saqlash (signals uchun)
-        old_status = None
+        # Eski status va guruh - bazadan qayta o'qilmaydi (FieldTrackerMixin)
+        old_status = self.old_value('status')
         old_enrolled_group = None
-        if self.pk:
-            try:
-                old_instance = Lead.objects.get(pk=self.pk)
-                old_status = old_instance.status
-                old_enrolled_group = old_instance.enrolled_group
-            except Lead.DoesNotExist:
-                pass
+        old_enrolled_group_id = self.old_value('enrolled_group')
+        if old_enrolled_group_id and (
+            (old_status == 'enrolled' and self.status != 'enrolled')
+            or (self.status == 'enrolled' and not self.enrolled_at and old_enrolled_group_id != self.enrolled_group_id)
+        ):
+            # Guruh faqat o'quvchilar sonini o'zgartirish kerak bo'lganda o'qiladi
+            old_enrolled_group = Group.objects.filter(pk=old_enrolled_group_id).first()
         
         if self.status == 'lost' and not self.lost_at:
             self.lost_at = timezone.now()
@@ -312,7 +383,33 @@ class Lead(models.Model):
         super().save(*args, **kwargs)
 
 
-class FollowUp(models.Model):
+class FollowUp(FieldTrackerMixin, models.Model):
+    # KPI hisoblagichlari uchun eski holat (signals.update_followup_kpi)
+    tracked_fields = ('sales', 'due_date', 'completed')
+    
+    # Avtomatik follow-up turi - dublikatni notes matni o'rniga shu maydon bo'yicha aniqlash
+    KIND_CHOICES = [
+        ('', "Qo'lda / boshqa"),
+        ('new_lead', 'Yangi lid'),
+        ('contacted_seq_1', 'Contacted - 24 soat'),
+        ('contacted_seq_2', 'Contacted - 3 kun'),
+        ('contacted_seq_3', 'Contacted - 7 kun'),
+        ('interested_day_1', 'Interested - 1-kun'),
+        ('interested_day_3', 'Interested - 3-kun'),
+        ('interested_day_5', 'Interested - 5-kun'),
+        ('interested_day_7', 'Interested - 7-kun'),
+        ('trial_reminder_1d', 'Sinovdan 1 kun oldin'),
+        ('trial_reminder_2h', 'Sinovdan 2 soat oldin'),
+        ('trial_no_show_30m', 'Sinovga kelmadi - 30 daqiqa'),
+        ('trial_no_show_24h', 'Sinovga kelmadi - 24 soat'),
+        ('trial_no_show_3d', 'Sinovga kelmadi - 3 kun'),
+        ('trial_end', 'Sinov darsi tugadi'),
+        ('trial_plus_24h', 'Sinovdan keyin 24 soat'),
+        ('trial_plus_3d', 'Sinovdan keyin 3-kun'),
+        ('trial_plus_7d', 'Sinovdan keyin 7-kun'),
+        ('trial_plus_14d', 'Sinovdan keyin 14-kun'),
+    ]
+    
     lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='followups')
     sales = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followups')
     due_date = models.DateTimeField()
@@ -322,6 +419,10 @@ class FollowUp(models.Model):
     is_overdue = models.BooleanField(default=False)
     reminder_sent = models.BooleanField(default=False)  # Follow-up eslatmasi yuborilganligi
     followup_sequence = models.IntegerField(null=True, blank=True, help_text='Ketma-ketlik raqami (contacted status uchun)')
+    kind = models.CharField(
+        max_length=30, choices=KIND_CHOICES, blank=True, default='',
+        help_text="Avtomatik follow-up turi (bo'sh - qo'lda yaratilgan)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -333,18 +434,31 @@ class FollowUp(models.Model):
             models.Index(fields=['is_overdue', 'completed'], name='followup_overdue_completed_idx'),
             models.Index(fields=['due_date'], name='followup_due_date_idx'),
         ]
+        constraints = [
+            # Har bir lid uchun bir turdagi faqat bitta ochiq avtomatik follow-up
+            models.UniqueConstraint(
+                fields=['lead', 'kind'],
+                condition=models.Q(completed=False) & ~models.Q(kind=''),
+                name='followup_open_lead_kind_uniq',
+            ),
+        ]
     
     def __str__(self):
         return f"Follow-up: {self.lead.name} - {self.due_date}"
     
-    def mark_completed(self, check_work_hours=True):
+    def mark_completed(self, check_work_hours=True, availability=None):
         """
         Follow-up'ni bajarilgan deb belgilash
         check_work_hours: Agar True bo'lsa, ish vaqti va ruxsat tekshiriladi
+        availability: ixtiyoriy AvailabilitySnapshot (ko'p follow-up'lar uchun ruxsat so'rovisiz tekshirish)
         """
         if check_work_hours:
             # Ish vaqti va ruxsat tekshirish
-            if not self.sales.is_available_for_leads:
+            if availability is not None:
+                is_available = availability.is_available(self.sales_id)
+            else:
+                is_available = self.sales.is_available_for_leads
+            if not is_available:
                 from django.core.exceptions import ValidationError
                 raise ValidationError(
                     "Siz hozir ish vaqtida emassiz yoki ruxsat olgansiz. "
@@ -356,6 +470,28 @@ class FollowUp(models.Model):
         self.save()
 
 
+class LeadStatusEvent(models.Model):
+    """Lid statusi o'zgarishlari jurnali (faqat qo'shiladi - KPI'lar shu jadvaldan hisoblanadi)"""
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='status_events')
+    from_status = models.CharField(max_length=20, choices=Lead.STATUS_CHOICES, blank=True,
+                                   help_text="Bo'sh - lid yaratilgan")
+    to_status = models.CharField(max_length=20, choices=Lead.STATUS_CHOICES)
+    sales = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='lead_status_events', help_text="O'zgarish vaqtidagi sotuvchi")
+    at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['at']
+        indexes = [
+            models.Index(fields=['sales', 'at'], name='status_event_sales_at_idx'),
+            models.Index(fields=['to_status', 'at'], name='status_event_to_at_idx'),
+            models.Index(fields=['lead', 'at'], name='status_event_lead_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.lead_id}: {self.from_status or '-'} -> {self.to_status} ({self.at})"
+
+
 class TrialLesson(models.Model):
     RESULT_CHOICES = [
         ('attended', 'Keldi'),
@@ -451,6 +587,16 @@ class KPI(models.Model):
     conversion_rate = models.FloatField(default=0.0)
     response_time_minutes = models.FloatField(default=0.0)
     overdue_count = models.IntegerField(default=0)
+    # Yozish vaqtida yangilanadigan hisoblagichlar (rate'lar shulardan hisoblanadi)
+    leads_assigned = models.IntegerField(default=0)
+    followups_completed = models.IntegerField(default=0)
+    response_count = models.IntegerField(default=0)
+    response_time_total = models.FloatField(default=0.0, help_text="Javob vaqtlari yig'indisi (daqiqa)")
+    # Tungi tekshiruv: hisoblagichlar va to'liq hisob orasidagi farq
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+    reconcile_delta = models.IntegerField(null=True, blank=True)
+    # Haftalik/oylik yig'indiga qo'shilganmi (kelajak sanali qatorlar o'z kuni kelganda qo'shiladi)
+    in_rollup = models.BooleanField(default=False)
     
     class Meta:
         unique_together = ['sales', 'date']
@@ -464,6 +610,94 @@ class KPI(models.Model):
         return f"KPI: {self.sales.username} - {self.date}"
 
 
+class KPIRollup(models.Model):
+    """
+    Kunlik KPI qatorlarining davr bo'yicha yig'indisi (hafta/oy).
+    Har bir maydon - davr ichidagi kunlik qiymatlar yig'indisi; o'rtacha = maydon / days.
+    """
+    period_start = models.DateField()
+    days = models.IntegerField(default=0, help_text="Davrdagi kunlik KPI qatorlari soni")
+    daily_contacts = models.IntegerField(default=0)
+    daily_followups = models.IntegerField(default=0)
+    followups_completed = models.IntegerField(default=0)
+    followup_completion_rate = models.FloatField(default=0.0, help_text="Kunlik foizlar yig'indisi")
+    trials_registered = models.IntegerField(default=0)
+    trials_to_sales = models.IntegerField(default=0)
+    leads_assigned = models.IntegerField(default=0)
+    conversion_rate = models.FloatField(default=0.0, help_text="Kunlik foizlar yig'indisi")
+    response_count = models.IntegerField(default=0)
+    response_time_total = models.FloatField(default=0.0)
+    response_time_minutes = models.FloatField(default=0.0, help_text="Kunlik o'rtachalar yig'indisi")
+    overdue_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        abstract = True
+        ordering = ['-period_start']
+
+
+class KPIWeekly(KPIRollup):
+    """Haftalik KPI (period_start - dushanba)"""
+    sales = models.ForeignKey(User, on_delete=models.CASCADE, related_name='kpi_weekly')
+    
+    class Meta(KPIRollup.Meta):
+        unique_together = ['sales', 'period_start']
+        indexes = [
+            models.Index(fields=['period_start', 'sales'], name='kpi_weekly_period_idx'),
+        ]
+    
+    def __str__(self):
+        return f"KPI hafta: {self.sales.username} - {self.period_start}"
+
+
+class KPIMonthly(KPIRollup):
+    """Oylik KPI (period_start - oyning 1-kuni)"""
+    sales = models.ForeignKey(User, on_delete=models.CASCADE, related_name='kpi_monthly')
+    
+    class Meta(KPIRollup.Meta):
+        unique_together = ['sales', 'period_start']
+        indexes = [
+            models.Index(fields=['period_start', 'sales'], name='kpi_monthly_period_idx'),
+        ]
+    
+    def __str__(self):
+        return f"KPI oy: {self.sales.username} - {self.period_start}"
+
+
+class LatencyHistogram(models.Model):
+    """
+    Kunlik o'tish vaqtlari gistogrammasi (sotuvchi x kurs x ko'rsatkich).
+    buckets - log-bucket hisoblagichlari (LogHistogram.to_bytes); davrlar uchun
+    kunlik qatorlar qo'shib yuboriladi - tarix qayta o'qilmaydi.
+    """
+    METRIC_CHOICES = [
+        ('first_response', 'Yangi → aloqa'),
+        ('contact_to_trial', 'Aloqa → sinovga yozildi'),
+        ('trial_to_enrolled', 'Sinovga keldi → kursga yozildi'),
+        ('followup_completion', 'Qayta aloqa muddati → bajarildi'),
+    ]
+    
+    date = models.DateField()
+    metric = models.CharField(max_length=30, choices=METRIC_CHOICES)
+    sales = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                              related_name='latency_histograms')
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='latency_histograms')
+    count = models.IntegerField(default=0)
+    total_seconds = models.FloatField(default=0.0)
+    buckets = models.BinaryField()
+    
+    class Meta:
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'metric'], name='latency_date_metric_idx'),
+            models.Index(fields=['sales', 'date'], name='latency_sales_date_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_metric_display()}: {self.sales_id or '-'} / {self.course_id or '-'} - {self.date} ({self.count})"
+
+
 class Reactivation(models.Model):
     lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='reactivations')
     days_since_lost = models.IntegerField()
@@ -597,3 +831,103 @@ class Offer(models.Model):
             return False
         return True
 
+
+class NotificationLedger(models.Model):
+    """Yuborilgan takroriy eslatmalar jurnali (bir xil eslatmani qayta-qayta yubormaslik uchun)"""
+    KIND_CHOICES = [
+        ('overdue_followup', 'Overdue follow-up'),
+        ('overdue_manager', "Overdue - manager ogohlantirishi"),
+        ('followup_reminder', 'Follow-up eslatmasi'),
+        ('trial_reminder', 'Sinov eslatmasi'),
+        ('post_trial_reminder', 'Sinovdan keyingi sotuv eslatmasi'),
+    ]
+    
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField(help_text="FollowUp, TrialLesson yoki sotuvchi (overdue_manager) ID")
+    chat_id = models.CharField(max_length=100)
+    last_sent_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['kind', 'object_id', 'chat_id']
+        indexes = [
+            models.Index(fields=['kind', 'last_sent_at'], name='ledger_kind_sent_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: #{self.object_id} -> {self.chat_id}"
+
+
+class TelegramOutbox(models.Model):
+    """Yuborilishi kerak bo'lgan Telegram xabarlari navbati (run_telegram_sender tomonidan yuboriladi)"""
+    STATUS_CHOICES = [
+        ('pending', 'Kutilmoqda'),
+        ('sending', 'Yuborilmoqda'),
+        ('sent', 'Yuborildi'),
+        ('failed', 'Xatolik'),
+    ]
+    
+    chat_id = models.CharField(max_length=100)
+    text = models.TextField()
+    parse_mode = models.CharField(max_length=20, blank=True, default='HTML')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, help_text="Keyingi urinish vaqti (backoff)")
+    last_error = models.TextField(blank=True)
+    claimed_by = models.CharField(max_length=32, blank=True, help_text="Qatorni olgan sender partiyasi tokeni")
+    latency_ms = models.IntegerField(null=True, blank=True, help_text="Navbatga qo'shilgandan yetkazilgunicha (ms)")
+    # Xabar qaysi eslatmalarni "yuborildi" deb belgilagan (NotificationLedger turi va obyekt ID lari) -
+    # xabar yakuniy xatolik bilan tugasa, belgilar bekor qilinadi (NotificationLedgerService.release)
+    receipt_kind = models.CharField(max_length=30, blank=True)
+    receipt_ids = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+            models.Index(fields=['status', 'sent_at'], name='outbox_status_sent_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Telegram -> {self.chat_id} ({self.get_status_display()})"
+
+
+class ScheduledAction(models.Model):
+    """
+    Vaqti kelganda bajariladigan amallar (dispatch_scheduled_actions_task tomonidan bajariladi)
+    Amal hodisa yuz berganda yoziladi (follow-up yaratildi, sinov natijasi kiritildi va h.k.)
+    """
+    KIND_CHOICES = [
+        ('followup_reminder', 'Follow-up eslatmasi'),
+        ('trial_end_followup', 'Sinov tugagandan keyin follow-up'),
+        ('post_trial_reminder', 'Sinovdan keyingi sotuv eslatmasi'),
+        ('trial_followup_1d', 'Sinovdan keyin 24 soat follow-up'),
+        ('trial_followup_3d', 'Sinovdan keyin 3-kun follow-up'),
+        ('trial_followup_7d', 'Sinovdan keyin 7-kun follow-up'),
+        ('trial_followup_14d', 'Sinovdan keyin 14-kun follow-up'),
+    ]
+    STATE_CHOICES = [
+        ('pending', 'Kutilmoqda'),
+        ('running', 'Bajarilmoqda'),
+        ('done', 'Bajarildi'),
+        ('failed', 'Xatolik'),
+    ]
+    
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField(help_text="FollowUp yoki TrialLesson ID")
+    fire_at = models.DateTimeField(help_text="Bajarish vaqti (running holatida - lease tugash vaqti)")
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['state', 'fire_at'], name='action_state_fire_idx'),
+            models.Index(fields=['kind', 'object_id'], name='action_kind_object_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: #{self.object_id} ({self.fire_at})"
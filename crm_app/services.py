@@ -1,12 +1,20 @@
 from django.utils import timezone
 from django.db import models
 from datetime import timedelta
-from .models import User, Lead, FollowUp, Group, TrialLesson, KPI, Reactivation, Offer,Course
+from .models import User, Lead, FollowUp, Group, TrialLesson, KPI, Reactivation, Offer,Course, NotificationLedger, ScheduledAction, LeadStatusEvent, KPIWeekly, KPIMonthly, LatencyHistogram
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
 
 
 class LeadDistributionService:
     """Lid taqsimlash xizmati"""
     
+    # Sotuvchi yukini hisoblashda "ochiq" deb hisoblanadigan statuslar
+    OPEN_LEAD_STATUSES = ['new', 'contacted', 'interested', 'trial_registered']
+    
     @staticmethod
     def _extract_sheet_name_from_notes(notes):
         """Lid notes'idan sheet nomini olish"""
@@ -54,125 +62,564 @@ class LeadDistributionService:
             print(f"Sheet nomidan kurs topishda xatolik: {e}")
             return None
     
+    @staticmethod
+    def _load_open_lead_counts(sales_ids):
+        """Sotuvchilarning ochiq lidlar sonini bitta GROUP BY so'rov bilan olish"""
+        from django.db.models import Count
+        
+        counts = {sales_id: 0 for sales_id in sales_ids}
+        rows = Lead.objects.filter(
+            assigned_sales_id__in=sales_ids,
+            status__in=LeadDistributionService.OPEN_LEAD_STATUSES
+        ).values('assigned_sales_id').annotate(count=Count('id'))
+        for row in rows:
+            counts[row['assigned_sales_id']] = row['count']
+        return counts
+    
     @staticmethod
     def distribute_leads(leads):
         """
-        Lidlarni kurs bo'yicha taqsimlash
+        Lidlarni kurs bo'yicha taqsimlash (batch rejimi)
         MUHIM: Sotuvchilar faqat o'zlariga biriktirilgan kurslar bo'yicha lidlarni qabul qiladi
         Agar kurs aniqlanmasa, lid eng kam lidi bor sotuvchiga biriktiriladi
+        
+        Ochiq lidlar soni butun batch uchun bitta so'rov bilan olinadi va xotiradagi
+        min-heap (open_count, sales_id) orqali yangilanib boriladi.
         """
-        from .tasks import send_new_lead_notification
+        import time
+        from .deferred_writes import deferred_side_effects
+        
+        started = time.perf_counter()
         
-        # Faqat mavjud va ishda bo'lgan sotuvchilarni olish
-        active_sales = [sales for sales in User.objects.filter(role='sales', is_active_sales=True) 
-                       if sales.is_available_for_leads]
+        # Faqat mavjud va ishda bo'lgan sotuvchilarni olish (ruxsatlar bitta so'rov bilan)
+        availability = AvailabilitySnapshot(
+            users=User.objects.filter(role='sales', is_active_sales=True).prefetch_related('assigned_courses')
+        )
+        active_sales = availability.available_users()
         
         if not active_sales:
             return None
         
-        # Lidlarni taqsimlash
-        for lead in leads:
-            # Eski assigned_sales ni saqlash (notification uchun)
-            old_assigned_sales_id = lead.assigned_sales_id if lead.pk else None
-            was_new_lead = not lead.pk  # Lid yangi ekanligini tekshirish
-            
-            assigned_sales = None
-            
-            # 1. AVVAL: Sheet nomidan kursni aniqlash (Google Sheets import uchun)
-            sheet_name = LeadDistributionService._extract_sheet_name_from_notes(lead.notes)
-            course_from_sheet = None
-            
-            if sheet_name:
-                course_from_sheet = LeadDistributionService._get_course_from_sheet_name(sheet_name)
-                if course_from_sheet:
-                    print(f"Sheet '{sheet_name}' dan kurs topildi: {course_from_sheet.name}")
-            
-            # 2. Kursni aniqlash: avval sheet nomidan, keyin interested_course dan
-            target_course = course_from_sheet or lead.interested_course
-            
-            # 3. Agar kurs topilgan bo'lsa, kurs bo'yicha taqsimlash
-            if target_course:
-                # Ushbu kursga biriktirilgan sotuvchilarni topish
-                course_sales = [
-                    sales for sales in active_sales 
-                    if target_course in sales.assigned_courses.all()
-                ]
+        sales_by_id = {sales.id: sales for sales in active_sales}
+        all_sales_ids = tuple(sales_by_id)
+        
+        # Kurs -> shu kursga biriktirilgan sotuvchilar (prefetch'dan, qo'shimcha so'rovsiz)
+        course_sales_ids = {}
+        for sales in active_sales:
+            for course in sales.assigned_courses.all():
+                course_sales_ids.setdefault(course.id, []).append(sales.id)
+        
+        balancer = LeadBalancer(LeadDistributionService._load_open_lead_counts(all_sales_ids))
+        sheet_courses = {}  # Batch ichida sheet nomi -> kurs (har bir lid uchun qayta qidirmaslik)
+        assigned_count = 0
+        
+        # Lidlarni taqsimlash - yangi lidlar bitta bulk INSERT, signallar va xabarlar partiya
+        # oxirida birgalikda (deferred_side_effects, har bir sotuvchiga bitta digest)
+        with deferred_side_effects() as batch:
+            for lead in leads:
+                # Eski assigned_sales ni saqlash (notification uchun)
+                old_assigned_sales_id = lead.assigned_sales_id if lead.pk else None
+                was_new_lead = not lead.pk  # Lid yangi ekanligini tekshirish
                 
-                if course_sales:
-                    # Kursga biriktirilgan sotuvchilar bor, ular orasida teng taqsimlash
-                    # (eng kam lidga ega bo'lganiga)
-                    sales_lead_counts = {}
-                    for sales in course_sales:
-                        sales_lead_counts[sales.id] = Lead.objects.filter(
-                            assigned_sales=sales,
-                            status__in=['new', 'contacted', 'interested', 'trial_registered']
-                        ).count()
-                    
-                    if sales_lead_counts:
-                        min_sales_id = min(sales_lead_counts.items(), key=lambda x: x[1])[0]
-                        assigned_sales = User.objects.get(id=min_sales_id)
-                        print(f"Lid '{lead.name}' '{target_course.name}' kursiga biriktirilgan sotuvchiga taqsimlandi: {assigned_sales.username}")
-                else:
-                    # Kursga biriktirilgan sotuvchi yo'q - eng kam lidi bor sotuvchiga biriktirish
-                    print(f"⚠️ Lid '{lead.name}' uchun '{target_course.name}' kursiga biriktirilgan faol sotuvchi topilmadi. Eng kam lidi bor sotuvchiga biriktirilmoqda...")
-                    # Oddiy teng taqsimlash (eng kam lidi bor sotuvchiga)
-                    sales_lead_counts = {}
-                    for sales in active_sales:
-                        sales_lead_counts[sales.id] = Lead.objects.filter(
-                            assigned_sales=sales,
-                            status__in=['new', 'contacted', 'interested', 'trial_registered']
-                        ).count()
-                    
-                    if sales_lead_counts:
-                        min_sales_id = min(sales_lead_counts.items(), key=lambda x: x[1])[0]
-                        assigned_sales = User.objects.get(id=min_sales_id)
+                # 1. AVVAL: Sheet nomidan kursni aniqlash (Google Sheets import uchun)
+                sheet_name = LeadDistributionService._extract_sheet_name_from_notes(lead.notes)
+                course_from_sheet = None
+                
+                if sheet_name:
+                    if sheet_name not in sheet_courses:
+                        sheet_courses[sheet_name] = LeadDistributionService._get_course_from_sheet_name(sheet_name)
+                    course_from_sheet = sheet_courses[sheet_name]
+                    if course_from_sheet:
+                        print(f"Sheet '{sheet_name}' dan kurs topildi: {course_from_sheet.name}")
+                
+                # 2. Kursni aniqlash: avval sheet nomidan, keyin interested_course dan
+                target_course = course_from_sheet or lead.interested_course
+                
+                # 3. Nomzodlar: kursga biriktirilgan sotuvchilar, bo'lmasa barcha faol sotuvchilar
+                candidates = None
+                if target_course:
+                    candidates = course_sales_ids.get(target_course.id)
+                    if candidates:
+                        candidates = tuple(candidates)
                     else:
-                        # Agar barcha sotuvchilar ishda bo'lmasa, eng kam lidga ega bo'lganiga berish
-                        all_sales = User.objects.filter(role='sales', is_active_sales=True)
-                        if all_sales:
-                            assigned_sales = min(all_sales, key=lambda s: Lead.objects.filter(
-                                assigned_sales=s,
-                                status__in=['new', 'contacted', 'interested', 'trial_registered']
-                            ).count())
-            else:
-                # Kurs aniqlanmadi - eng kam lidi bor sotuvchiga biriktirish
-                print(f"⚠️ Lid '{lead.name}' uchun kurs aniqlanmadi (sheet nomi ham, interested_course ham yo'q). Eng kam lidi bor sotuvchiga biriktirilmoqda...")
-                # Oddiy teng taqsimlash (eng kam lidi bor sotuvchiga)
-                sales_lead_counts = {}
-                for sales in active_sales:
-                    sales_lead_counts[sales.id] = Lead.objects.filter(
-                        assigned_sales=sales,
-                        status__in=['new', 'contacted', 'interested', 'trial_registered']
-                    ).count()
+                        # Kursga biriktirilgan sotuvchi yo'q - eng kam lidi bor sotuvchiga biriktirish
+                        print(f"⚠️ Lid '{lead.name}' uchun '{target_course.name}' kursiga biriktirilgan faol sotuvchi topilmadi. Eng kam lidi bor sotuvchiga biriktirilmoqda...")
+                else:
+                    # Kurs aniqlanmadi - eng kam lidi bor sotuvchiga biriktirish
+                    print(f"⚠️ Lid '{lead.name}' uchun kurs aniqlanmadi (sheet nomi ham, interested_course ham yo'q). Eng kam lidi bor sotuvchiga biriktirilmoqda...")
                 
-                if sales_lead_counts:
-                    min_sales_id = min(sales_lead_counts.items(), key=lambda x: x[1])[0]
-                    assigned_sales = User.objects.get(id=min_sales_id)
+                assigned_sales_id = balancer.pick(candidates or all_sales_ids)
+                assigned_sales = sales_by_id.get(assigned_sales_id)
+                
+                # 4. Lidni biriktirish va saqlash
+                if assigned_sales:
+                    if candidates:
+                        print(f"Lid '{lead.name}' '{target_course.name}' kursiga biriktirilgan sotuvchiga taqsimlandi: {assigned_sales.username}")
+                    lead.assigned_sales = assigned_sales
+                    # Agar sheet nomidan kurs topilgan bo'lsa va interested_course bo'sh bo'lsa, yangilash
+                    if course_from_sheet and not lead.interested_course:
+                        lead.interested_course = course_from_sheet
+                    batch.save_lead(lead)
+                    
+                    # Heap'ni yangilash (lid ochiq statusda bo'lsa, yangi sotuvchi yuki oshadi,
+                    # avvalgi sotuvchiniki kamayadi - u lid boshlang'ich counts ga kirgan)
+                    if lead.status in LeadDistributionService.OPEN_LEAD_STATUSES and old_assigned_sales_id != assigned_sales.id:
+                        balancer.assign(assigned_sales.id)
+                        if old_assigned_sales_id:
+                            balancer.release(old_assigned_sales_id)
+                    assigned_count += 1
+                    
+                    # Notification yuborish
+                    if was_new_lead or (not old_assigned_sales_id or old_assigned_sales_id != assigned_sales.id):
+                        batch.notify_new_lead(lead)
                 else:
-                    # Agar barcha sotuvchilar ishda bo'lmasa, eng kam lidga ega bo'lganiga berish
-                    all_sales = User.objects.filter(role='sales', is_active_sales=True)
-                    if all_sales:
-                        assigned_sales = min(all_sales, key=lambda s: Lead.objects.filter(
-                            assigned_sales=s,
-                            status__in=['new', 'contacted', 'interested', 'trial_registered']
-                        ).count())
+                    # Agar hech kimga biriktirilmasa (juda kam ehtimol)
+                    print(f"❌ Lid '{lead.name}' hech kimga biriktirilmadi - faol sotuvchilar yo'q")
+        
+        elapsed = time.perf_counter() - started
+        print(
+            f"[distribute_leads] {assigned_count}/{len(leads)} ta lid {len(active_sales)} ta sotuvchiga "
+            f"{elapsed:.3f} s da taqsimlandi"
+        )
+        
+        return len(active_sales)
+
+
+class LeadBalancer:
+    """
+    Batch taqsimlash uchun min-heap: (open_count, sales_id).
+    
+    Har bir nomzodlar to'plami (masalan, bitta kurs sotuvchilari) uchun alohida heap
+    saqlanadi. Lid biriktirilganda faqat counts yangilanadi; boshqa heap'lardagi eskirgan
+    yozuvlar tepaga chiqqanda tuzatiladi, shuning uchun har bir lid O(log n).
+    Count kamayganda (release) eskirgan yozuv tepaga chiqmasligi mumkin - shuning uchun
+    sotuvchi bor heap'larga yangi yozuv qo'shiladi.
+    """
+    
+    def __init__(self, counts):
+        self.counts = counts
+        self._heaps = {}
+    
+    def pick(self, sales_ids):
+        """Nomzodlar orasidan eng kam ochiq lidi bor sotuvchi ID sini qaytarish"""
+        import heapq
+        
+        heap = self._heaps.get(sales_ids)
+        if heap is None:
+            heap = [(self.counts[sales_id], sales_id) for sales_id in sales_ids]
+            heapq.heapify(heap)
+            self._heaps[sales_ids] = heap
+        
+        while heap:
+            count, sales_id = heap[0]
+            current = self.counts[sales_id]
+            if count == current:
+                return sales_id
+            heapq.heapreplace(heap, (current, sales_id))
+        return None
+    
+    def assign(self, sales_id):
+        """Sotuvchiga bitta lid biriktirilganini qayd qilish"""
+        self.counts[sales_id] += 1
+    
+    def release(self, sales_id):
+        """Sotuvchidan bitta lid olinganini qayd qilish (boshqa sotuvchiga o'tkazildi)"""
+        import heapq
+        
+        if sales_id not in self.counts:
+            return  # Faol bo'lmagan sotuvchi - heap'larda yo'q
+        self.counts[sales_id] -= 1
+        for sales_ids, heap in self._heaps.items():
+            if sales_id in sales_ids:
+                heapq.heappush(heap, (self.counts[sales_id], sales_id))
+
+
+class AvailabilitySnapshot:
+    """
+    Sotuvchilar mavjudligining xotiradagi surati.
+    
+    Vaqt oralig'ini kesib o'tuvchi tasdiqlangan ruxsatlar va sotuvchilarning ish kunlari/soatlari
+    ikki so'rov bilan yuklanadi. Keyin "X sotuvchi T vaqtda mavjudmi" savoliga istalgan
+    miqdordagi sotuvchi va vaqt uchun DB ga murojaat qilmasdan javob beriladi.
+    Sana va vaqtlar local timezone'da tekshiriladi (User.is_working_at_time kabi).
+    """
+    
+    def __init__(self, start=None, end=None, users=None):
+        """
+        start, end: tekshiriladigan vaqt oralig'i (bo'sh bo'lsa hozirgi vaqt)
+        users: sotuvchilar queryset'i (bo'sh bo'lsa barcha sotuvchilar)
+        """
+        from .models import LeaveRequest
+        
+        start = start or timezone.now()
+        end = end or start
+        if users is None:
+            users = User.objects.filter(role='sales')
+        
+        self.users = {user.id: user for user in users}
+        self._leaves = {}
+        
+        leaves = LeaveRequest.objects.filter(
+            sales_id__in=list(self.users),
+            status='approved',
+            start_date__lte=self._local(end).date(),
+            end_date__gte=self._local(start).date()
+        ).values_list('sales_id', 'start_date', 'end_date', 'start_time', 'end_time')
+        for sales_id, start_date, end_date, start_time, end_time in leaves:
+            self._leaves.setdefault(sales_id, []).append((start_date, end_date, start_time, end_time))
+    
+    @staticmethod
+    def _local(check_time):
+        """Timezone-aware datetime ni local timezone'ga o'tkazish"""
+        return timezone.localtime(check_time) if timezone.is_aware(check_time) else check_time
+    
+    def is_on_leave(self, user_id, at):
+        """Belgilangan vaqtda tasdiqlangan ruxsatda ekanligini tekshirish"""
+        local_time = self._local(at)
+        check_date = local_time.date()
+        check_time = local_time.time()
+        
+        for start_date, end_date, start_time, end_time in self._leaves.get(user_id, ()):
+            if not (start_date <= check_date <= end_date):
+                continue
+            if start_time and end_time:
+                if start_time <= check_time <= end_time:
+                    return True
+            else:
+                # Butun kun ruxsat
+                return True
+        return False
+    
+    def is_available(self, user, at=None):
+        """
+        Sotuvchi belgilangan vaqtda lidlar uchun mavjudligini tekshirish
+        (User.is_available_for_leads bilan bir xil qoidalar, lekin so'rovsiz)
+        user: User obyekti yoki ID
+        """
+        user_id = getattr(user, 'id', user)
+        sales = self.users.get(user_id)
+        if sales is None:
+            # Snapshot'ga kirmagan sotuvchi - oddiy tekshiruv
+            if isinstance(user, User):
+                return user.is_available_for_leads
+            return False
+        
+        if not sales.is_active_sales:
+            return False
+        
+        at = at or timezone.now()
+        
+        if self.is_on_leave(user_id, at):
+            return False
+        
+        # Manager tomonidan belgilangan ishda emaslik
+        if sales.is_absent:
+            if sales.absent_from and sales.absent_until:
+                if sales.absent_from <= at <= sales.absent_until:
+                    return False
+            else:
+                return False
+        
+        # Ish vaqtini tekshirish
+        return sales.is_working_at_time(at)
+    
+    def available_users(self, at=None):
+        """Belgilangan vaqtda mavjud sotuvchilar ro'yxati"""
+        return [sales for sales in self.users.values() if self.is_available(sales, at)]
+
+
+class WorkCalendar:
+    """
+    Sotuvchining kompilyatsiya qilingan ish kalendari.
+    
+    Bugundan boshlab HORIZON_DAYS kun uchun ish vaqti oraliqlari (local timezone) tuziladi,
+    tasdiqlangan ruxsatlar ulardan ayirib tashlanadi va natija tartiblangan ro'yxat sifatida
+    saqlanadi. Follow-up vaqtini topish - bisect, DB so'rovisiz.
+    
+    Kalendar jarayon ichida keshlanadi va quyidagilarda qayta quriladi:
+    - sotuvchining ish kunlari/soatlari o'zgarsa (fingerprint)
+    - ruxsatlar o'zgarsa (Django cache'dagi versiya kaliti, signals orqali yangilanadi)
+    - yangi kun boshlansa yoki REBUILD_SECONDS o'tsa (locmem cache jarayonlararo emas)
+    """
+    
+    HORIZON_DAYS = 60
+    REBUILD_SECONDS = 300
+    VERSION_KEY = 'work_calendar_version_{sales_id}'
+    
+    _cache = {}  # sales_id -> WorkCalendar
+    
+    def __init__(self, sales, version=None):
+        from .models import LeaveRequest
+        
+        self.sales_id = sales.id
+        self.fingerprint = self.get_fingerprint(sales)
+        self.version = version
+        self.built_at = timezone.now()
+        self.first_date = timezone.localdate()
+        self.last_date = self.first_date + timedelta(days=self.HORIZON_DAYS)
+        
+        # Ruxsatlarni kunlar bo'yicha yoyish: None - butun kun, (start, end) - soatlar bilan
+        leaves_by_date = {}
+        leaves = LeaveRequest.objects.filter(
+            sales_id=sales.id,
+            status='approved',
+            start_date__lte=self.last_date,
+            end_date__gte=self.first_date
+        ).values_list('start_date', 'end_date', 'start_time', 'end_time')
+        for start_date, end_date, start_time, end_time in leaves:
+            day = max(start_date, self.first_date)
+            while day <= min(end_date, self.last_date):
+                leaves_by_date.setdefault(day, []).append(
+                    (start_time, end_time) if start_time and end_time else None
+                )
+                day += timedelta(days=1)
+        
+        work_days = self.fingerprint[3:]
+        self.starts = []
+        self.ends = []
+        self._start_epochs = None  # resolve_many uchun NumPy massivlari (kerak bo'lganda quriladi)
+        self._end_epochs = None
+        
+        for day_offset in range(self.HORIZON_DAYS + 1):
+            day = self.first_date + timedelta(days=day_offset)
+            if not work_days[day.weekday()]:
+                continue
             
-            # 4. Lidni biriktirish va saqlash
-            if assigned_sales:
-                lead.assigned_sales = assigned_sales
-                # Agar sheet nomidan kurs topilgan bo'lsa va interested_course bo'sh bo'lsa, yangilash
-                if course_from_sheet and not lead.interested_course:
-                    lead.interested_course = course_from_sheet
-                lead.save()
-                
-                # Notification yuborish
-                if was_new_lead or (not old_assigned_sales_id or old_assigned_sales_id != assigned_sales.id):
-                    send_new_lead_notification.delay(lead.id)
+            day_leaves = leaves_by_date.get(day, [])
+            if None in day_leaves:
+                # Butun kun ruxsat
+                continue
+            
+            pieces = [(self._at(day, sales.work_start_time), self._at(day, sales.work_end_time))]
+            # Soatli ruxsatni ayirish: [start_time, end_time) ish vaqtidan chiqariladi
+            for leave_start, leave_end in day_leaves:
+                leave_start = self._at(day, leave_start)
+                leave_end = self._at(day, leave_end)
+                remaining = []
+                for start, end in pieces:
+                    if leave_end <= start or leave_start > end:
+                        remaining.append((start, end))
+                        continue
+                    if start < leave_start:
+                        remaining.append((start, leave_start))
+                    if leave_end <= end:
+                        remaining.append((leave_end, end))
+                pieces = remaining
+            
+            for start, end in sorted(pieces):
+                self.starts.append(start)
+                self.ends.append(end)
+    
+    @staticmethod
+    def _at(day, time_value):
+        """Local sana va vaqtdan timezone-aware datetime"""
+        return timezone.make_aware(timezone.datetime.combine(day, time_value))
+    
+    @staticmethod
+    def get_fingerprint(sales):
+        """Kalendarga ta'sir qiluvchi sotuvchi maydonlari"""
+        return (
+            sales.is_active_sales,
+            sales.work_start_time,
+            sales.work_end_time,
+            sales.work_monday,
+            sales.work_tuesday,
+            sales.work_wednesday,
+            sales.work_thursday,
+            sales.work_friday,
+            sales.work_saturday,
+            sales.work_sunday,
+        )
+    
+    @classmethod
+    def for_sales(cls, sales):
+        """Sotuvchi uchun keshlangan (kerak bo'lsa qayta qurilgan) kalendar"""
+        import time
+        from django.core.cache import cache
+        
+        version_key = cls.VERSION_KEY.format(sales_id=sales.id)
+        version = cache.get(version_key)
+        if version is None:
+            version = time.time_ns()
+            cache.add(version_key, version, None)
+            version = cache.get(version_key, version)
+        
+        calendar = cls._cache.get(sales.id)
+        if (
+            calendar is None
+            or calendar.version != version
+            or calendar.fingerprint != cls.get_fingerprint(sales)
+            or calendar.first_date != timezone.localdate()
+            or (timezone.now() - calendar.built_at).total_seconds() > cls.REBUILD_SECONDS
+        ):
+            calendar = cls(sales, version)
+            cls._cache[sales.id] = calendar
+        return calendar
+    
+    @classmethod
+    def invalidate(cls, sales_id):
+        """Sotuvchi kalendarini eskirgan deb belgilash (ruxsatlar o'zgarganda)"""
+        import time
+        from django.core.cache import cache
+        
+        cache.set(cls.VERSION_KEY.format(sales_id=sales_id), time.time_ns(), None)
+        cls._cache.pop(sales_id, None)
+    
+    def resolve(self, at):
+        """
+        at dan keyingi (yoki at ning o'zi) birinchi ish vaqtini topish.
+        Kalendar oralig'idan tashqarida bo'lsa None qaytaradi.
+        """
+        from bisect import bisect_right
+        
+        if timezone.localtime(at).date() > self.last_date:
+            return None
+        
+        index = bisect_right(self.starts, at) - 1
+        if index >= 0 and at <= self.ends[index]:
+            return at
+        if index + 1 < len(self.starts):
+            return self.starts[index + 1]
+        return None
+    
+    def resolve_many(self, times):
+        """
+        resolve() ning ko'p vaqt uchun varianti: NumPy mavjud bo'lsa barcha vaqtlar
+        interval boshlanish/tugash epoch'lari ustida bitta searchsorted bilan topiladi.
+        """
+        if not NUMPY_AVAILABLE or not self.starts:
+            return [self.resolve(at) for at in times]
+        
+        if self._start_epochs is None:
+            self._start_epochs = np.array([start.timestamp() for start in self.starts], dtype='float64')
+            self._end_epochs = np.array([end.timestamp() for end in self.ends], dtype='float64')
+        
+        horizon_end = self._at(
+            self.last_date + timedelta(days=1), timezone.datetime.min.time()
+        ).timestamp()
+        epochs = np.array([at.timestamp() for at in times], dtype='float64')
+        indexes = np.searchsorted(self._start_epochs, epochs, side='right') - 1
+        inside = (indexes >= 0) & (epochs <= self._end_epochs[np.maximum(indexes, 0)])
+        
+        results = []
+        for at, epoch, index, is_inside in zip(times, epochs.tolist(), indexes.tolist(), inside.tolist()):
+            if epoch >= horizon_end:
+                results.append(None)
+            elif is_inside:
+                results.append(at)
+            elif index + 1 < len(self.starts):
+                results.append(self.starts[index + 1])
             else:
-                # Agar hech kimga biriktirilmasa (juda kam ehtimol)
-                print(f"❌ Lid '{lead.name}' hech kimga biriktirilmadi - faol sotuvchilar yo'q")
+                results.append(None)
+        return results
+
+
+class OverdueMatrix:
+    """
+    Overdue follow-up'lar matritsasi: har bir sotuvchi uchun barcha yosh bucketlari.
+    
+    Bitta shartli agregatsiya so'rovi (Count(..., filter=Q(...)) GROUP BY sales_id) bilan
+    quriladi. get_overdue_statistics, get_sales_overdue_summary, check_sales_blocked,
+    dashboard, analytics va Telegram buyruqlari shu obyektdan foydalanadi.
+    """
+    
+    CACHE_KEY = 'overdue_matrix'
+    CACHE_TIMEOUT = 60  # 1 daqiqa
+    
+    def __init__(self, grace_period_hours=2, now=None):
+        from django.db.models import Count, Q
+        
+        self.now = now or timezone.now()
+        grace_threshold = self.now - timedelta(hours=grace_period_hours)
+        hour_ago = self.now - timedelta(hours=1)
+        six_hours_ago = self.now - timedelta(hours=6)
+        day_ago = self.now - timedelta(days=1)
+        
+        overdue = Q(due_date__lt=grace_threshold)
+        rows = FollowUp.objects.filter(completed=False).values(
+            'sales_id', 'sales__username', 'sales__role', 'sales__is_active_sales'
+        ).annotate(
+            active=Count('id'),
+            total=Count('id', filter=overdue),
+            lt_1h=Count('id', filter=overdue & Q(due_date__gte=hour_ago)),
+            h_1_6=Count('id', filter=overdue & Q(due_date__lt=hour_ago, due_date__gte=six_hours_ago)),
+            h_6_24=Count('id', filter=overdue & Q(due_date__lt=six_hours_ago, due_date__gte=day_ago)),
+            gt_24h=Count('id', filter=overdue & Q(due_date__lt=day_ago)),
+        ).order_by('sales_id')
+        
+        self.rows = {row['sales_id']: row for row in rows}
+    
+    @classmethod
+    def current(cls):
+        """Keshlangan matritsa (CACHE_TIMEOUT davomida barcha sahifalar uchun umumiy)"""
+        from django.core.cache import cache
         
-        return len(active_sales)
+        matrix = cache.get(cls.CACHE_KEY)
+        if matrix is None:
+            matrix = cls()
+            cache.set(cls.CACHE_KEY, matrix, cls.CACHE_TIMEOUT)
+        return matrix
+    
+    @classmethod
+    def invalidate(cls):
+        """Keshlangan matritsani o'chirish"""
+        from django.core.cache import cache
+        
+        cache.delete(cls.CACHE_KEY)
+    
+    def _value(self, field, sales=None):
+        """Bitta sotuvchi (yoki barcha follow-up'lar) uchun ustun qiymati"""
+        if sales is not None:
+            row = self.rows.get(getattr(sales, 'id', sales))
+            return row[field] if row else 0
+        return sum(row[field] for row in self.rows.values())
+    
+    def overdue_count(self, sales=None):
+        """Overdue follow-up'lar soni (grace period bilan)"""
+        return self._value('total', sales)
+    
+    def threshold(self, sales):
+        """Dinamik threshold: umumiy yukning 20% yoki minimum 8 ta"""
+        return max(8, int(self._value('active', sales) * 0.2))
+    
+    def is_blocked(self, sales):
+        """Sotuvchi bloklanganligini tekshirish"""
+        return self.overdue_count(sales) >= self.threshold(sales)
+    
+    def statistics(self, sales=None):
+        """FollowUpService.get_overdue_statistics formatidagi statistika"""
+        stats = {
+            'total': self.overdue_count(sales),
+            'by_age': {
+                '< 1 hour': self._value('lt_1h', sales),
+                '1-6 hours': self._value('h_1_6', sales),
+                '6-24 hours': self._value('h_6_24', sales),
+                '> 24 hours': self._value('gt_24h', sales),
+            },
+            'by_sales': {}
+        }
+        
+        # Har bir faol sotuvchi uchun overdue soni
+        if not sales:
+            for row in self.rows.values():
+                if row['sales__role'] == 'sales' and row['sales__is_active_sales'] and row['total'] > 0:
+                    stats['by_sales'][row['sales__username']] = row['total']
+        
+        return stats
+    
+    def summary(self, sales):
+        """FollowUpService.get_sales_overdue_summary formatidagi xulosa"""
+        return {
+            'total': self.overdue_count(sales),
+            'by_urgency': {
+                'critical': self._value('gt_24h', sales),
+                'high': self._value('h_6_24', sales),
+                'medium': self._value('h_1_6', sales),
+                'low': self._value('lt_1h', sales),
+            },
+            'is_blocked': self.is_blocked(sales),
+            'threshold': self.threshold(sales),
+        }
 
 
 class FollowUpService:
@@ -185,6 +632,80 @@ class FollowUpService:
         Ruxsat so'rovlarini ham inobatga oladi
         MUHIM: Agar hisoblangan vaqt o'tgan bo'lsa, keyingi ish vaqtiga o'tkazadi
         
+        Sotuvchining kompilyatsiya qilingan WorkCalendar'i orqali ishlaydi (DB so'rovisiz).
+        Kalendar oralig'idan tashqaridagi vaqtlar uchun calculate_work_hours_due_date_db ishlatiladi.
+        
+        Args:
+            sales: User model instance (sotuvchi)
+            base_time: datetime - boshlang'ich vaqt
+            delay: timedelta - kechikish (masalan, timedelta(hours=24))
+        
+        Returns:
+            datetime - ish vaqtiga moslashtirilgan follow-up vaqti (hech qachon o'tmagan bo'lmaydi)
+        """
+        now = timezone.now()
+        
+        # Sotuvchi yo'q, faol emas yoki ish vaqtlari belgilanmagan - oddiy hisoblash
+        if not sales or not sales.is_active_sales or not sales.work_start_time or not sales.work_end_time:
+            return max(base_time + delay, now)
+        
+        # Hisoblangan vaqt (o'tgan bo'lsa, hozirgi vaqtdan boshlash)
+        calculated_time = base_time + delay
+        if calculated_time < now:
+            calculated_time = now + delay
+        
+        due_date = WorkCalendar.for_sales(sales).resolve(calculated_time)
+        if due_date is None:
+            return FollowUpService.calculate_work_hours_due_date_db(sales, base_time, delay)
+        return due_date
+    
+    @staticmethod
+    def calculate_due_dates_bulk(items):
+        """
+        Ko'p follow-up uchun ish vaqtiga moslashtirilgan vaqtlarni bir o'tishda hisoblash
+        Kirishlar sotuvchi bo'yicha guruhlanadi va har bir guruh o'sha sotuvchining
+        WorkCalendar'i ustida bitta vektorlashtirilgan qidiruv bilan hal qilinadi.
+        
+        Args:
+            items: [(sales_id, base_time, delay), ...]
+        
+        Returns:
+            list[datetime] - items tartibida (calculate_work_hours_due_date bilan bir xil natija)
+        """
+        now = timezone.now()
+        sales_by_id = User.objects.in_bulk({sales_id for sales_id, _, _ in items if sales_id})
+        
+        results = [None] * len(items)
+        groups = {}  # sales_id -> [(index, calculated_time), ...]
+        for index, (sales_id, base_time, delay) in enumerate(items):
+            sales = sales_by_id.get(sales_id)
+            if not sales or not sales.is_active_sales or not sales.work_start_time or not sales.work_end_time:
+                results[index] = max(base_time + delay, now)
+                continue
+            
+            calculated_time = base_time + delay
+            if calculated_time < now:
+                calculated_time = now + delay
+            groups.setdefault(sales_id, []).append((index, calculated_time))
+        
+        for sales_id, entries in groups.items():
+            sales = sales_by_id[sales_id]
+            resolved = WorkCalendar.for_sales(sales).resolve_many([calculated for _, calculated in entries])
+            for (index, _), due_date in zip(entries, resolved):
+                if due_date is None:
+                    # Kalendar oralig'idan tashqarida - eski (DB) hisoblash
+                    _, base_time, delay = items[index]
+                    due_date = FollowUpService.calculate_work_hours_due_date_db(sales, base_time, delay)
+                results[index] = due_date
+        
+        return results
+    
+    @staticmethod
+    def calculate_work_hours_due_date_db(sales, base_time, delay):
+        """
+        Follow-up vaqtini ish vaqtlariga moslashtirish (eski usul - har bir kun uchun ruxsat so'rovi)
+        WorkCalendar oralig'idan tashqaridagi vaqtlar va benchmark_due_dates uchun saqlangan
+        
         Args:
             sales: User model instance (sotuvchi)
             base_time: datetime - boshlang'ich vaqt
@@ -309,6 +830,78 @@ class FollowUpService:
         # Agar ish kuni topilmasa, hozirgi vaqtga delay qo'shish
         return max(now + delay, now)
     
+    NEW_LEAD_NOTES = "Yangi lid - darhol aloqa qilish kerak (yuklanish: {current_followups} follow-up, bugungi yangi: {today_new_leads})"
+    
+    @staticmethod
+    def new_lead_delay(today_new_leads, current_followups):
+        """
+        Yangi lid follow-up'i uchun dinamik kechikish (15-30 daqiqa)
+        today_new_leads: sotuvchining bugungi yangi lidlari (shu lid bilan)
+        current_followups: keyingi 24 soatdagi ochiq follow-up'lari
+        """
+        # Bugun ko'p yangi lidlar bo'lsa, delay oshadi
+        if today_new_leads <= 5:
+            delay_minutes = 15
+        elif today_new_leads <= 10:
+            delay_minutes = 20
+        elif today_new_leads <= 20:
+            delay_minutes = 25
+        else:
+            delay_minutes = 30
+        
+        # Sotuvchining hozirgi follow-up yuki ko'p bo'lsa, delay'ni yanada oshirish
+        if current_followups > 20:
+            delay_minutes = min(30, delay_minutes + 5)
+        elif current_followups > 10:
+            delay_minutes = min(30, delay_minutes + 3)
+        
+        # Batch import uchun vaqt bo'yicha tarqatish - har bir lid uchun 5 daqiqa oraliq
+        if today_new_leads > 10:
+            delay_minutes = min(30, delay_minutes + (today_new_leads - 10) * 5)
+        return timedelta(minutes=delay_minutes)
+    
+    @staticmethod
+    def create_once(lead, kind, sales, due_date, notes, **fields):
+        """
+        Avtomatik follow-up'ni (lead, kind) bo'yicha bir marta yaratish - INSERT ... ON CONFLICT DO NOTHING kabi.
+        Oldindan notes bo'yicha qidirilmaydi: ochiq (lead, kind) allaqachon bo'lsa
+        followup_open_lead_kind_uniq indeksi rad etadi va None qaytadi.
+        """
+        from django.db import IntegrityError, transaction
+        
+        try:
+            with transaction.atomic():
+                return FollowUp.objects.create(
+                    lead=lead, sales=sales, due_date=due_date, notes=notes, kind=kind, **fields
+                )
+        except IntegrityError:
+            return None
+    
+    @staticmethod
+    def bulk_create_once(followups):
+        """
+        Bir nechta avtomatik follow-up'ni bitta INSERT bilan yaratish (bulk_create - signalsiz).
+        Ochiq (lead, kind) bilan to'qnashuv bo'lsa, faqat shu qatorlar tashlab yuboriladi.
+        Returns: yaratilgan follow-up'lar ro'yxati (id bilan)
+        """
+        from django.db import IntegrityError, transaction
+        
+        if not followups:
+            return []
+        try:
+            with transaction.atomic():
+                return FollowUp.objects.bulk_create(followups)
+        except IntegrityError:
+            # Kam uchraydigan holat (parallel yaratish) - qatorma-qator
+            created = []
+            for followup in followups:
+                try:
+                    with transaction.atomic():
+                        created.extend(FollowUp.objects.bulk_create([followup]))
+                except IntegrityError:
+                    pass
+            return created
+    
     @staticmethod
     def get_today_followups(sales=None):
         """Bugungi va o'tgan barcha bajarilmagan follow-uplarni olish"""
@@ -352,6 +945,26 @@ class FollowUpService:
         
         return queryset.order_by('due_date')
     
+    @staticmethod
+    def flag_overdue(threshold=None, grace_period_hours=2):
+        """
+        Overdue follow-up'larni bitta UPDATE bilan belgilash (save() va signallarsiz)
+        
+        Args:
+            threshold: datetime - shundan oldingi due_date'lar overdue (default: now - grace period)
+        
+        Returns:
+            int - yangi belgilangan follow-up'lar soni
+        """
+        if threshold is None:
+            threshold = timezone.now() - timedelta(hours=grace_period_hours)
+        
+        return FollowUp.objects.filter(
+            due_date__lt=threshold,
+            completed=False,
+            is_overdue=False
+        ).update(is_overdue=True)
+    
     @staticmethod
     def check_sales_blocked(sales):
         """
@@ -360,18 +973,7 @@ class FollowUpService:
         Threshold dinamik: umumiy follow-up yukining 20% dan ko'p bo'lsa
         yoki minimum 8 ta overdue bo'lsa
         """
-        overdue_count = FollowUpService.get_overdue_followups(sales).count()
-        
-        # Sotuvchining umumiy follow-up yukini hisoblash
-        total_active_followups = FollowUp.objects.filter(
-            sales=sales,
-            completed=False
-        ).count()
-        
-        # Threshold dinamik: umumiy yukning 20% dan ko'p bo'lsa yoki minimum 8 ta
-        dynamic_threshold = max(8, int(total_active_followups * 0.2))
-        
-        return overdue_count >= dynamic_threshold
+        return OverdueMatrix.current().is_blocked(sales)
     
     @staticmethod
     def get_overdue_followups_prioritized(sales=None):
@@ -417,6 +1019,51 @@ class FollowUpService:
         
         return True
     
+    @staticmethod
+    def auto_reschedule_overdue_bulk(followups, hours_ahead=2):
+        """
+        Bir nechta overdue follow-up'ni qayta rejalashtirish
+        Vaqtlar calculate_due_dates_bulk bilan hisoblanadi. Bir xil boshlang'ich vaqtdan
+        hisoblangani uchun natijalar bir nechta qiymatga to'planadi - har bir qiymat uchun
+        bitta UPDATE bajariladi.
+        
+        Returns:
+            int - qayta rejalashtirilgan follow-up'lar soni
+        """
+        followups = [followup for followup in followups if not followup.completed]
+        if not followups:
+            return 0
+        
+        now = timezone.now()
+        due_dates = FollowUpService.calculate_due_dates_bulk([
+            (followup.sales_id, now, timedelta(hours=hours_ahead)) for followup in followups
+        ])
+        
+        old_states = [KPICounters.followup_state(followup) for followup in followups]
+        ids_by_due_date = {}
+        for followup, due_date in zip(followups, due_dates):
+            followup.due_date = due_date
+            followup.is_overdue = False
+            ids_by_due_date.setdefault(due_date, []).append(followup.id)
+        
+        for due_date, ids in ids_by_due_date.items():
+            for offset in range(0, len(ids), 500):
+                FollowUp.objects.filter(id__in=ids[offset:offset + 500]).update(
+                    due_date=due_date,
+                    is_overdue=False
+                )
+                # Kutilayotgan eslatmalar ham yangi vaqtga ko'chiriladi (update() signal chaqirmaydi)
+                ScheduledAction.objects.filter(
+                    kind='followup_reminder',
+                    object_id__in=ids[offset:offset + 500],
+                    state='pending'
+                ).update(fire_at=due_date)
+        KPICounters.followups_changed([
+            (old_state, KPICounters.followup_state(followup))
+            for old_state, followup in zip(old_states, followups)
+        ])
+        return len(followups)
+    
     @staticmethod
     def escalate_overdue_followup(followup):
         """Overdue follow-up'ni manager'ga ko'tarish"""
@@ -455,9 +1102,10 @@ class FollowUpService:
         """Overdue follow-up'ni boshqa sotuvchiga o'tkazish"""
         if new_sales is None:
             # Eng kam overdue'ga ega sotuvchini topish
+            matrix = OverdueMatrix()
             sales_overdue = {}
             for sales in User.objects.filter(role='sales', is_active_sales=True):
-                sales_overdue[sales] = FollowUpService.get_overdue_followups(sales).count()
+                sales_overdue[sales] = matrix.overdue_count(sales)
             
             if not sales_overdue:
                 return None
@@ -471,49 +1119,8 @@ class FollowUpService:
     
     @staticmethod
     def get_overdue_statistics(sales=None, days=7):
-        """Overdue statistikasi"""
-        overdue = FollowUpService.get_overdue_followups(sales)
-        now = timezone.now()
-        
-        from django.core.cache import cache
-        
-        # Cache key
-        cache_key = f'overdue_stats_{sales.id if sales else "all"}'
-        stats = cache.get(cache_key)
-        
-        if stats is None:
-            stats = {
-                'total': overdue.count(),
-                'by_age': {
-                    '< 1 hour': overdue.filter(
-                        due_date__gte=now - timedelta(hours=1)
-                    ).count(),
-                    '1-6 hours': overdue.filter(
-                        due_date__lt=now - timedelta(hours=1),
-                        due_date__gte=now - timedelta(hours=6)
-                    ).count(),
-                    '6-24 hours': overdue.filter(
-                        due_date__lt=now - timedelta(hours=6),
-                        due_date__gte=now - timedelta(days=1)
-                    ).count(),
-                    '> 24 hours': overdue.filter(
-                        due_date__lt=now - timedelta(days=1)
-                    ).count(),
-                },
-                'by_sales': {}
-            }
-            
-            # Har bir sotuvchi uchun overdue soni
-            if not sales:
-                for sales_user in User.objects.filter(role='sales', is_active_sales=True):
-                    count = FollowUpService.get_overdue_followups(sales_user).count()
-                    if count > 0:
-                        stats['by_sales'][sales_user.username] = count
-            
-            # Cache for 5 minutes
-            cache.set(cache_key, stats, 300)
-        
-        return stats
+        """Overdue statistikasi (OverdueMatrix asosida)"""
+        return OverdueMatrix.current().statistics(sales)
     
     @staticmethod
     def get_sales_overdue_summary(sales):
@@ -533,57 +1140,449 @@ class FollowUpService:
                 'threshold': int,    # Dinamik threshold
             }
         """
-        overdue = FollowUpService.get_overdue_followups(sales)
-        now = timezone.now()
-        
-        # Grace period threshold (1 soat)
-        grace_threshold = now - timedelta(hours=1)
+        return OverdueMatrix.current().summary(sales)
+
+
+class FollowUpSequence:
+    """
+    Status o'tishidagi follow-up ketma-ketliklari (deklarativ ta'rif).
+    
+    status -> {
+        'anchor': 'transition' - bosqich o'tish vaqtidan offset keyin;
+                  'trial' - lidning navbatdagi sinovi vaqtidan offset oldin (o'tib ketganlari tashlab yuboriladi),
+        'one_per_day': bir kunga ikkita ochiq follow-up to'g'ri kelsa, keyingisi yaratilmaydi,
+        'steps': [(kind, offset, notes shabloni, followup_sequence), ...],
+    }
+    materialize() o'tishni barcha follow-up qatorlariga bitta bulk INSERT bilan ochadi:
+    vaqtlar calculate_due_dates_bulk bilan birga hisoblanadi, xabarlar - bitta job.
+    """
+    
+    SEQUENCES = {
+        'contacted': {
+            'anchor': 'transition',
+            'one_per_day': False,
+            'steps': [
+                ('contacted_seq_1', timedelta(hours=24), "Contacted - 24 soatdan keyin aloqa (ko'proq ma'lumot, kurs narxi, jadval, guruhlar)", 1),
+                ('contacted_seq_2', timedelta(hours=72), "Contacted - 3 kundan keyin aloqa (qo'shimcha ma'lumot, bonuslar, chegirmalar)", 2),
+                ('contacted_seq_3', timedelta(hours=168), "Contacted - 7 kundan keyin aloqa (yakuniy taklif, qaror qabul qilish)", 3),
+            ],
+        },
+        'interested': {
+            'anchor': 'transition',
+            'one_per_day': True,
+            'steps': [
+                ('interested_day_1', timedelta(days=1), "Interested - 1 kundan keyin: Qo'shimcha ma'lumot", None),
+                ('interested_day_3', timedelta(days=3), "Interested - 3 kundan keyin: Guruhlar bandligi haqida xabar", None),
+                ('interested_day_5', timedelta(days=5), "Interested - 5 kundan keyin: Oxirgi joylar haqida eslatma", None),
+                ('interested_day_7', timedelta(days=7), "Interested - 7 kundan keyin: Qaror qilishga yordam berish", None),
+            ],
+        },
+        'trial_registered': {
+            'anchor': 'trial',
+            'one_per_day': False,
+            'steps': [
+                ('trial_reminder_1d', timedelta(days=1), "Sinovdan 1 kun oldin eslatma (Trial ID: {trial_id})", None),
+                ('trial_reminder_2h', timedelta(hours=2), "Sinovdan 2 soat oldin eslatma + lokatsiya (Trial ID: {trial_id})", None),
+            ],
+        },
+        'trial_not_attended': {
+            'anchor': 'transition',
+            'one_per_day': True,
+            'steps': [
+                ('trial_no_show_30m', timedelta(minutes=30), "Sinovga kelmadi - 30 daqiqadan keyin qayta yozish", None),
+                ('trial_no_show_24h', timedelta(hours=24), "Sinovga kelmadi - 24 soatdan keyin qayta taklif", None),
+                ('trial_no_show_3d', timedelta(days=3), "Sinovga kelmadi - 3 kundan keyin uzr va qayta imkon taklifi", None),
+            ],
+        },
+    }
+    
+    @staticmethod
+    def _plan(lead, sequence, now):
+        """
+        Bosqichlar uchun (kind, base_time, delay, notes, followup_sequence) ro'yxati
+        (calculate_work_hours_due_date(sales, base_time, delay) kabi)
+        """
+        if sequence['anchor'] == 'trial':
+            trial = lead.trials.filter(result__in=['', 'attended', 'not_attended']).order_by('date', 'time').first()
+            if not trial:
+                return []
+            trial_datetime = timezone.make_aware(timezone.datetime.combine(trial.date, trial.time))
+            return [
+                (kind, trial_datetime - offset, timedelta(0), notes.format(trial_id=trial.id), followup_sequence)
+                for kind, offset, notes, followup_sequence in sequence['steps']
+                if trial_datetime - offset > now
+            ]
+        return [
+            (kind, now, offset, notes, followup_sequence)
+            for kind, offset, notes, followup_sequence in sequence['steps']
+        ]
+    
+    @staticmethod
+    def materialize(lead, status=None):
+        """
+        Lid statusi uchun ketma-ketlikni ochish (allaqachon ochiq bosqichlar o'tkazib yuboriladi)
+        So'rovlar: ochiq bosqichlar (1), sotuvchi (1), bitta INSERT, KPI va eslatmalar.
+        Returns: yaratilgan follow-up'lar
+        """
+        from .tasks import send_followups_created_notifications
         
-        summary = {
-            'total': overdue.count(),
-            'by_urgency': {
-                'critical': overdue.filter(
-                    due_date__lt=now - timedelta(hours=24)
-                ).count(),
-                'high': overdue.filter(
-                    due_date__gte=now - timedelta(hours=24),
-                    due_date__lt=now - timedelta(hours=6)
-                ).count(),
-                'medium': overdue.filter(
-                    due_date__gte=now - timedelta(hours=6),
-                    due_date__lt=grace_threshold
-                ).count(),
-                'low': overdue.filter(
-                    due_date__gte=grace_threshold
-                ).count(),
-            },
-            'is_blocked': FollowUpService.check_sales_blocked(sales),
-        }
+        sequence = FollowUpSequence.SEQUENCES.get(status or lead.status)
+        if not sequence or not lead.assigned_sales_id:
+            return []
         
-        # Dinamik threshold'ni hisoblash
-        total_active_followups = FollowUp.objects.filter(
-            sales=sales,
+        now = timezone.now()
+        plan = FollowUpSequence._plan(lead, sequence, now)
+        if not plan:
+            return []
+        
+        # Shu ketma-ketlikning ochiq bosqichlari va ularning kunlari - bitta so'rov
+        open_kinds = set()
+        busy_dates = set()
+        for kind, due_date in FollowUp.objects.filter(
+            lead=lead,
+            kind__in=[step[0] for step in sequence['steps']],
             completed=False
-        ).count()
-        summary['threshold'] = max(8, int(total_active_followups * 0.2))
-        
-        return summary
+        ).values_list('kind', 'due_date'):
+            open_kinds.add(kind)
+            busy_dates.add(timezone.localtime(due_date).date())
+        plan = [step for step in plan if step[0] not in open_kinds]
+        if not plan:
+            return []
+        
+        due_dates = FollowUpService.calculate_due_dates_bulk([
+            (lead.assigned_sales_id, base_time, delay) for _, base_time, delay, _, _ in plan
+        ])
+        followups = []
+        for (kind, _, _, notes, followup_sequence), due_date in zip(plan, due_dates):
+            if sequence['one_per_day']:
+                # Xuddi shu kunda shu ketma-ketlikning boshqa follow-up'i bo'lsa, yaratmaymiz
+                due_day = timezone.localtime(due_date).date()
+                if due_day in busy_dates:
+                    continue
+                busy_dates.add(due_day)
+            followups.append(FollowUp(
+                lead=lead,
+                sales_id=lead.assigned_sales_id,
+                due_date=due_date,
+                is_overdue=due_date < now,
+                notes=notes,
+                kind=kind,
+                followup_sequence=followup_sequence,
+            ))
+        
+        followups = FollowUpService.bulk_create_once(followups)
+        if not followups:
+            return []
+        # bulk_create post_save signalini chaqirmaydi - KPI va eslatmalar shu yerda
+        KPICounters.followups_created(followups)
+        ScheduledActionService.schedule_many('followup_reminder', [
+            (followup.id, followup.due_date) for followup in followups
+        ])
+        send_followups_created_notifications.delay([followup.id for followup in followups])
+        return followups
 
 
-class GroupService:
-    """Guruh xizmatlari"""
+class NotificationLedgerService:
+    """
+    Takroriy eslatmalar jurnali (NotificationLedger)
+    Bir xil (kind, object_id, chat_id) eslatmasi settings.NOTIFICATION_RENOTIFY_INTERVALS
+    dagi oraliqdan tez-tez yuborilmaydi (None - faqat bir marta).
+    """
+    
+    BATCH_SIZE = 500
     
     @staticmethod
-    def get_available_groups(course=None, days=None, time=None):
-        """Mavjud guruhlarni olish"""
-        queryset = Group.objects.filter(is_active=True)
+    def get_interval(kind):
+        """Qayta eslatish oralig'i (timedelta yoki None)"""
+        from django.conf import settings
         
-        if course:
-            queryset = queryset.filter(course=course)
-        if days:
-            queryset = queryset.filter(days=days)
-        if time:
-            queryset = queryset.filter(time=time)
+        seconds = getattr(settings, 'NOTIFICATION_RENOTIFY_INTERVALS', {}).get(kind)
+        return timedelta(seconds=seconds) if seconds is not None else None
+    
+    @staticmethod
+    def filter_due(kind, candidates, now=None):
+        """
+        Hozir yuborish mumkin bo'lgan eslatmalarni ajratish
+        Bitta tick'dagi barcha nomzodlar BATCH_SIZE tadan bitta so'rov bilan tekshiriladi
+        
+        Args:
+            candidates: [(object_id, chat_id), ...]
+        
+        Returns:
+            set - yuborish mumkin bo'lgan (object_id, chat_id) lar
+        """
+        candidates = {(object_id, str(chat_id)) for object_id, chat_id in candidates}
+        if not candidates:
+            return set()
+        
+        now = now or timezone.now()
+        ledger = NotificationLedger.objects.filter(kind=kind)
+        interval = NotificationLedgerService.get_interval(kind)
+        if interval is not None:
+            ledger = ledger.filter(last_sent_at__gt=now - interval)
+        
+        object_ids = sorted({object_id for object_id, _ in candidates})
+        recently_sent = set()
+        for offset in range(0, len(object_ids), NotificationLedgerService.BATCH_SIZE):
+            recently_sent.update(ledger.filter(
+                object_id__in=object_ids[offset:offset + NotificationLedgerService.BATCH_SIZE]
+            ).values_list('object_id', 'chat_id'))
+        
+        return candidates - recently_sent
+    
+    @staticmethod
+    def record(kind, keys, now=None):
+        """Yuborilgan eslatmalarni jurnalga yozish (bitta upsert)"""
+        keys = {(object_id, str(chat_id)) for object_id, chat_id in keys}
+        if not keys:
+            return
+        
+        now = now or timezone.now()
+        NotificationLedger.objects.bulk_create(
+            [
+                NotificationLedger(kind=kind, object_id=object_id, chat_id=chat_id, last_sent_at=now)
+                for object_id, chat_id in keys
+            ],
+            batch_size=NotificationLedgerService.BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['kind', 'object_id', 'chat_id'],
+            update_fields=['last_sent_at'],
+        )
+    
+    @staticmethod
+    def release(kind, object_ids, chat_id, retry=True):
+        """
+        Yetkazilmagan xabar belgilarini bekor qilish (TelegramOutbox yakuniy xatolik bilan tugadi)
+        Jurnal yozuvi o'chiriladi va "yuborildi" bayroqlari qaytariladi - keyingi tick qayta yuboradi.
+        retry: vaqtinchalik xatolik (urinishlar tugadi) - bir martalik eslatmalar qayta rejalashtiriladi;
+        doimiy xatolikda (chat topilmadi, bot bloklangan) faqat belgilar bekor qilinadi.
+        """
+        object_ids = list(object_ids)
+        if not kind or not object_ids:
+            return
+        
+        NotificationLedger.objects.filter(kind=kind, object_id__in=object_ids, chat_id=str(chat_id)).delete()
+        now = timezone.now()
+        if kind == 'followup_reminder':
+            open_ids = list(FollowUp.objects.filter(id__in=object_ids, completed=False).values_list('id', flat=True))
+            FollowUp.objects.filter(id__in=open_ids).update(reminder_sent=False)
+            if retry:
+                ScheduledActionService.schedule_many(kind, [(followup_id, now) for followup_id in open_ids])
+        elif kind == 'post_trial_reminder':
+            TrialLesson.objects.filter(id__in=object_ids).update(sales_reminder_sent=False)
+            if retry:
+                ScheduledActionService.schedule_many(kind, [(trial_id, now) for trial_id in object_ids])
+        elif kind == 'trial_reminder':
+            TrialLesson.objects.filter(id__in=object_ids).update(reminder_sent=False)
+        # overdue_followup / overdue_manager - jurnal yozuvi o'chirilgani yetarli (har tick tekshiriladi)
+
+
+class ScheduledActionService:
+    """
+    Rejalashtirilgan amallar (ScheduledAction)
+    Hodisa yuz berganda amal yoziladi; dispatcher faqat vaqti kelgan qatorlarni
+    (state, fire_at) indeksi orqali oladi - ish hajmi jadval hajmiga bog'liq emas.
+    """
+    
+    BATCH_SIZE = 200
+    LEASE_SECONDS = 5 * 60  # running holatidagi amal shu vaqtdan keyin qayta olinadi
+    MAX_ATTEMPTS = 5
+    
+    TRIAL_LESSON_DURATION = timedelta(minutes=90)
+    # Sinovga kelgan, lekin yozilmagan lid uchun follow-up bosqichlari: kind -> (sinovdan keyin, izoh)
+    TRIAL_FOLLOWUP_STAGES = {
+        'trial_followup_1d': (timedelta(hours=24), "Sinovdan keyin 24 soat - qayta aloqa"),
+        'trial_followup_3d': (timedelta(days=3), "Sinovdan keyin 3-kun - yakuniy follow-up"),
+        'trial_followup_7d': (timedelta(days=7), "Sinovdan keyin 7-kun - qayta muloqot"),
+        'trial_followup_14d': (timedelta(days=14), "Sinovdan keyin 14-kun - re-engagement"),
+    }
+    # Amal turi -> yaratiladigan FollowUp.kind
+    TRIAL_FOLLOWUP_KINDS = {
+        'trial_followup_1d': 'trial_plus_24h',
+        'trial_followup_3d': 'trial_plus_3d',
+        'trial_followup_7d': 'trial_plus_7d',
+        'trial_followup_14d': 'trial_plus_14d',
+    }
+    # Kechikib kiritilgan natija uchun shu muddatdan eski bosqichlar rejalashtirilmaydi
+    TRIAL_FOLLOWUP_GRACE = timedelta(hours=1)
+    
+    @staticmethod
+    def schedule(kind, object_id, fire_at):
+        """Bitta amalni rejalashtirish (kutilayotgan bo'lsa vaqtini yangilash)"""
+        ScheduledActionService.schedule_many(kind, [(object_id, fire_at)])
+    
+    @staticmethod
+    def schedule_many(kind, items):
+        """
+        Amallarni rejalashtirish
+        Bir xil (kind, object_id) uchun kutilayotgan amal bo'lsa, yangisi yaratilmaydi -
+        faqat fire_at yangilanadi.
+        
+        Args:
+            items: [(object_id, fire_at), ...]
+        """
+        fire_at_by_object = dict(items)
+        if not fire_at_by_object:
+            return
+        
+        now = timezone.now()
+        object_ids = sorted(fire_at_by_object)
+        batch_size = ScheduledActionService.BATCH_SIZE
+        for offset in range(0, len(object_ids), batch_size):
+            chunk = object_ids[offset:offset + batch_size]
+            existing = ScheduledAction.objects.filter(
+                kind=kind,
+                object_id__in=chunk,
+                state='pending'
+            ).values_list('id', 'object_id', 'fire_at')
+            
+            # Vaqti o'zgarganlarni fire_at bo'yicha guruhlab yangilash
+            ids_by_fire_at = {}
+            scheduled = set()
+            for action_id, object_id, fire_at in existing:
+                scheduled.add(object_id)
+                if fire_at != fire_at_by_object[object_id]:
+                    ids_by_fire_at.setdefault(fire_at_by_object[object_id], []).append(action_id)
+            for fire_at, ids in ids_by_fire_at.items():
+                ScheduledAction.objects.filter(id__in=ids).update(fire_at=fire_at, updated_at=now)
+            
+            ScheduledAction.objects.bulk_create([
+                ScheduledAction(kind=kind, object_id=object_id, fire_at=fire_at_by_object[object_id])
+                for object_id in chunk
+                if object_id not in scheduled
+            ])
+    
+    @staticmethod
+    def schedule_for_trial(trial, now=None):
+        """
+        Sinov bo'yicha amallarni rejalashtirish (TrialLesson saqlanganda)
+        - natija kiritilmagan: dars tugagach follow-up
+        - 'attended': sotuv taklifi eslatmasi va 1/3/7/14-kun follow-up'lari
+        """
+        now = now or timezone.now()
+        trial_datetime = timezone.make_aware(
+            timezone.datetime.combine(trial.date, trial.time)
+        )
+        
+        if not trial.result:
+            ScheduledActionService.schedule(
+                'trial_end_followup', trial.id, trial_datetime + ScheduledActionService.TRIAL_LESSON_DURATION
+            )
+        elif trial.result == 'attended':
+            if not trial.sales_reminder_sent:
+                ScheduledActionService.schedule('post_trial_reminder', trial.id, now)
+            for kind, (offset, _) in ScheduledActionService.TRIAL_FOLLOWUP_STAGES.items():
+                fire_at = trial_datetime + offset
+                if fire_at > now - ScheduledActionService.TRIAL_FOLLOWUP_GRACE:
+                    ScheduledActionService.schedule(kind, trial.id, fire_at)
+    
+    @staticmethod
+    def cancel(kind, object_ids):
+        """Kutilayotgan amallarni o'chirish"""
+        return ScheduledAction.objects.filter(
+            kind=kind,
+            object_id__in=list(object_ids),
+            state='pending'
+        ).delete()[0]
+    
+    @staticmethod
+    def claim_due(now=None, batch_size=None):
+        """
+        Vaqti kelgan amallarni olish (lease bilan)
+        Backend qo'llab-quvvatlasa select_for_update(skip_locked) ishlatiladi - bir nechta
+        dispatcher bir xil qatorni olmaydi.
+        Lease'i tugagan (worker o'lgan/osilib qolgan) amal MAX_ATTEMPTS ga yetgan bo'lsa,
+        qayta olinmaydi - 'failed' deb belgilanadi.
+        """
+        from django.db import connection, transaction
+        
+        now = now or timezone.now()
+        with transaction.atomic():
+            queryset = ScheduledAction.objects.filter(
+                state__in=['pending', 'running'],
+                fire_at__lte=now
+            ).order_by('fire_at')
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            actions = list(queryset[:batch_size or ScheduledActionService.BATCH_SIZE])
+            exhausted = [
+                action.id for action in actions
+                if action.state == 'running' and action.attempts >= ScheduledActionService.MAX_ATTEMPTS
+            ]
+            if exhausted:
+                ScheduledAction.objects.filter(id__in=exhausted).update(
+                    state='failed',
+                    last_error=f"Lease {ScheduledActionService.MAX_ATTEMPTS} marta tugadi (handler yakunlanmadi)",
+                    updated_at=now
+                )
+                actions = [action for action in actions if action.id not in exhausted]
+            if actions:
+                ScheduledAction.objects.filter(id__in=[action.id for action in actions]).update(
+                    state='running',
+                    fire_at=now + timedelta(seconds=ScheduledActionService.LEASE_SECONDS),
+                    attempts=models.F('attempts') + 1,
+                    updated_at=now
+                )
+        return actions
+    
+    @staticmethod
+    def complete(action_ids):
+        """Bajarilgan amallarni belgilash"""
+        if action_ids:
+            ScheduledAction.objects.filter(id__in=list(action_ids)).update(
+                state='done',
+                last_error='',
+                updated_at=timezone.now()
+            )
+    
+    @staticmethod
+    def reschedule(fire_at_by_action):
+        """
+        Amallarni keyinroqqa qoldirish (masalan, sotuvchi ish vaqtida emas)
+        
+        Args:
+            fire_at_by_action: {action_id: fire_at}
+        """
+        ids_by_fire_at = {}
+        for action_id, fire_at in fire_at_by_action.items():
+            ids_by_fire_at.setdefault(fire_at, []).append(action_id)
+        now = timezone.now()
+        for fire_at, ids in ids_by_fire_at.items():
+            # Handler muvaffaqiyatli ishladi, amal faqat qoldirildi - urinishlar hisobi yangidan
+            ScheduledAction.objects.filter(id__in=ids).update(
+                state='pending',
+                fire_at=fire_at,
+                attempts=0,
+                updated_at=now
+            )
+    
+    @staticmethod
+    def fail(actions, error):
+        """Xatolikda eksponensial backoff; MAX_ATTEMPTS dan keyin 'failed'"""
+        now = timezone.now()
+        for action in actions:
+            attempts = action.attempts + 1
+            if attempts >= ScheduledActionService.MAX_ATTEMPTS:
+                values = {'state': 'failed'}
+            else:
+                values = {'state': 'pending', 'fire_at': now + timedelta(minutes=2 ** attempts)}
+            ScheduledAction.objects.filter(id=action.id).update(last_error=error, updated_at=now, **values)
+
+
+class GroupService:
+    """Guruh xizmatlari"""
+    
+    @staticmethod
+    def get_available_groups(course=None, days=None, time=None):
+        """Mavjud guruhlarni olish"""
+        queryset = Group.objects.filter(is_active=True)
+        
+        if course:
+            queryset = queryset.filter(course=course)
+        if days:
+            queryset = queryset.filter(days=days)
+        if time:
+            queryset = queryset.filter(time=time)
         
         # Faqat to'liq bo'lmagan guruhlarni qaytarish
         available = queryset.filter(current_students__lt=models.F('capacity'))
@@ -592,278 +1591,1515 @@ class GroupService:
         if not available.exists() and queryset.exists():
             return queryset.order_by('name')
         
-        return available.order_by('name')
+        return available.order_by('name')
+    
+    @staticmethod
+    def get_room_occupancy(room, date_obj, time_slot):
+        """Xona bandligini olish"""
+        # Bu yerda dars jadvali asosida hisoblash kerak
+        # Soddalashtirilgan versiya
+        groups = Group.objects.filter(room=room, time=time_slot, is_active=True)
+        total_students = sum(group.current_students for group in groups)
+        total_capacity = sum(group.capacity for group in groups)
+        
+        if total_capacity == 0:
+            return 0
+        
+        return (total_students / total_capacity) * 100
+    
+    @staticmethod
+    def can_enroll_to_group(group):
+        """Guruhga yozish mumkinligini tekshirish"""
+        return not group.is_full
+
+
+class Leaderboard:
+    """
+    Sotuvchilar reytingi: (period, metric) bo'yicha barcha sotuvchilar uchun
+    bitta agregat so'rov (Avg GROUP BY sales, oy uchun KPIMonthly) + Window(Rank()) bilan
+    hisoblanadi; o'rtacha, eng yaxshi va eng yomon qiymat shu natijadan olinadi.
+    
+    Natija CACHE_TIMEOUT (10 daqiqa) keshlanadi. Jonli hisoblagichlar (KPICounters) keshni
+    yangilamaydi - reyting shu muddatgacha eskirishi mumkin; invalidate() faqat to'liq KPI
+    yozilganda (tungi reconcile, backfill) va sotuvchilar tarkibi o'zgarganda chaqiriladi.
+    Versiya kaliti cache'da: boshqa jarayonlarga (Celery -> gunicorn) faqat umumiy cache
+    (Redis CACHES) bilan yetib boradi; LocMem'da har jarayon TTL bo'yicha yangilanadi.
+    """
+    
+    METRICS = ['conversion_rate', 'daily_contacts', 'trials_to_sales', 'followup_completion_rate']
+    CACHE_KEY = 'leaderboard:{version}:{period}:{metric}:{today}'
+    VERSION_KEY = 'leaderboard_version'
+    CACHE_TIMEOUT = 10 * 60
+    
+    def __init__(self, period='month', metric='conversion_rate', today=None):
+        from django.db.models import Avg, Max, Q, F, FloatField, Value, Window
+        from django.db.models.functions import Cast, Coalesce, NullIf, Rank
+        
+        self.period = period
+        self.metric = metric
+        self.today = today or timezone.localdate()
+        self.start_date, self.end_date = self.get_period_range(period, self.today)
+        
+        if metric in self.METRICS and period == 'month':
+            # Oy boshidan - KPIMonthly yig'indisidan (kunlik qatorlar yig'ilmaydi)
+            value = Coalesce(
+                Max(
+                    Cast(F(f'kpi_monthly__{metric}'), FloatField()) / NullIf(F('kpi_monthly__days'), 0),
+                    filter=Q(kpi_monthly__period_start=self.start_date),
+                    output_field=FloatField()
+                ),
+                Value(0.0)
+            )
+        elif metric in self.METRICS:
+            value = Coalesce(
+                Avg(
+                    f'kpis__{metric}',
+                    filter=Q(kpis__date__gte=self.start_date, kpis__date__lte=self.end_date),
+                    output_field=FloatField()
+                ),
+                Value(0.0)
+            )
+        else:
+            value = Value(0.0)
+        
+        rows = User.objects.filter(role='sales', is_active_sales=True).values('id').annotate(
+            value=value,
+        ).annotate(
+            rank=Window(Rank(), order_by=F('value').desc()),
+        ).order_by('rank', 'id')
+        
+        self.rows = {row['id']: row for row in rows}
+        self.total_sales = len(self.rows)
+        values = [row['value'] for row in self.rows.values()]
+        self.average = sum(values) / len(values) if values else 0
+        self.best = max(values) if values else 0
+        self.worst = min(values) if values else 0
+    
+    @staticmethod
+    def get_period_range(period, today):
+        """Period bo'yicha sana oralig'i (start, end)"""
+        from datetime import datetime
+        
+        if period == 'day':
+            return today, today
+        if period == 'week':
+            return today - timedelta(days=7), today
+        if period == 'month':
+            return datetime(today.year, today.month, 1).date(), today
+        return today - timedelta(days=30), today
+    
+    @classmethod
+    def get(cls, period='month', metric='conversion_rate'):
+        """Keshlangan reyting (barcha sahifalar va sotuvchilar uchun umumiy)"""
+        from django.core.cache import cache
+        
+        version = cache.get(cls.VERSION_KEY, 0)
+        key = cls.CACHE_KEY.format(version=version, period=period, metric=metric, today=timezone.localdate())
+        leaderboard = cache.get(key)
+        if leaderboard is None:
+            leaderboard = cls(period, metric)
+            cache.set(key, leaderboard, cls.CACHE_TIMEOUT)
+        return leaderboard
+    
+    @classmethod
+    def invalidate(cls):
+        """Barcha keshlangan reytinglarni eskirgan deb belgilash"""
+        import time
+        from django.core.cache import cache
+        
+        cache.set(cls.VERSION_KEY, time.time_ns(), None)
+    
+    def ranking(self, sales):
+        """KPIService.get_sales_ranking formatidagi natija"""
+        row = self.rows.get(getattr(sales, 'id', sales))
+        rank = row['rank'] if row else 1
+        
+        if rank <= self.total_sales * 0.33:
+            position = 'top'
+        elif rank <= self.total_sales * 0.67:
+            position = 'middle'
+        else:
+            position = 'bottom'
+        
+        return {
+            'rank': rank,
+            'total_sales': self.total_sales,
+            'position': position,
+            'value': row['value'] if row else 0,
+            'average': self.average,
+            'best': self.best,
+            'worst': self.worst,
+        }
+
+
+class DailyReport:
+    """
+    Kunlik sotuv hisoboti (Telegram): barcha faol sotuvchilar uchun ma'lumot
+    sotuvchilar sonidan qat'i nazar bir nechta guruhlangan so'rovda yig'iladi
+    (lidlar, follow-up'lar, status o'zgarishlari - har biri GROUP BY sales),
+    matn esa xotiradagi qatorlardan yasaladi.
+    
+    get_message() tayyor matnni sana bo'yicha keshlaydi - bir nechta chat/guruhga
+    yuborishda hisobot qayta yig'ilmaydi.
+    """
+    
+    STATUS_ORDER = [
+        'new', 'contacted', 'interested', 'trial_registered',
+        'trial_attended', 'trial_not_attended', 'offer_sent', 'enrolled', 'lost', 'reactivation'
+    ]
+    TOTAL_FIELDS = [
+        ('leads_received', 'leads_received'),
+        ('tasks_created', 'tasks_created'),
+        ('follow_ups_completed', 'follow_ups_completed'),
+        ('follow_ups_planned', 'follow_ups_planned'),
+        ('contacts', 'contacts'),
+        ('trials', 'trials_registered'),
+        ('sales', 'sales_count'),
+        ('overdue', 'overdue_count'),
+        ('overdue_24h', 'overdue_24h'),
+        ('new_not_contacted', 'new_not_contacted'),
+    ]
+    CACHE_KEY = 'daily_report:{date}'
+    CACHE_TIMEOUT = 15 * 60
+    
+    def __init__(self, date=None, sales_users=None):
+        self.date = date or timezone.now().date()
+        if sales_users is None:
+            sales_users = User.objects.filter(role='sales', is_active_sales=True)
+        self.sales_users = list(sales_users)
+        self.stats = self.collect(self.date, [sales.id for sales in self.sales_users])
+    
+    @staticmethod
+    def empty_stats():
+        """Bitta sotuvchi uchun bo'sh ko'rsatkichlar (KPIService.get_daily_report_stats formati)"""
+        return {
+            'leads_received': 0,
+            'tasks_created': 0,
+            'follow_ups_completed': 0,
+            'follow_ups_planned': 0,
+            'contacts': 0,
+            'trials_registered': 0,
+            'sales_count': 0,
+            'overdue_count': 0,
+            'overdue_24h': 0,
+            'new_not_contacted': 0,
+            'by_status': dict.fromkeys(DailyReport.STATUS_ORDER, 0),
+        }
+    
+    @staticmethod
+    def collect(date, sales_ids):
+        """
+        Barcha sotuvchilar uchun kunlik ko'rsatkichlar - 3 ta guruhlangan so'rov
+        Returns: {sales_id: get_daily_report_stats formatidagi dict}
+        """
+        from datetime import datetime, time as dt_time
+        from django.db.models import Count, Q
+        
+        stats = {sales_id: DailyReport.empty_stats() for sales_id in sales_ids}
+        if not stats:
+            return stats
+        
+        date_start = timezone.make_aware(datetime.combine(date, dt_time.min))
+        date_end = date_start + timedelta(days=1)
+        day = Q(created_at__gte=date_start, created_at__lt=date_end)
+        
+        # Lidlar: (sotuvchi, status) bo'yicha - pipeline, shu kuni tushgan va aloqa qilinmaganlar
+        lead_rows = Lead.objects.filter(assigned_sales_id__in=sales_ids).values(
+            'assigned_sales_id', 'status'
+        ).annotate(
+            count=Count('id'),
+            received=Count('id', filter=day),
+        ).order_by()
+        for row in lead_rows:
+            st = stats[row['assigned_sales_id']]
+            st['leads_received'] += row['received']
+            if row['status'] == 'new':
+                st['new_not_contacted'] += row['received']
+            if row['status'] in st['by_status']:
+                st['by_status'][row['status']] += row['count']
+        
+        # Follow-up'lar: yaratilgan, bajarilgan, rejalashtirilgan va muddati o'tganlar
+        now = timezone.now()
+        overdue = Q(completed=False, due_date__lt=now - timedelta(hours=2))
+        overdue_24h = Q(completed=False, due_date__lt=now - timedelta(hours=24))
+        completed = Q(completed=True, completed_at__gte=date_start, completed_at__lt=date_end)
+        planned = Q(due_date__gte=date_start, due_date__lt=date_end)
+        followup_rows = FollowUp.objects.filter(
+            Q(sales_id__in=sales_ids) & (day | completed | planned | overdue)
+        ).values('sales_id').annotate(
+            tasks_created=Count('id', filter=day),
+            follow_ups_completed=Count('id', filter=completed),
+            follow_ups_planned=Count('id', filter=planned),
+            overdue_count=Count('id', filter=overdue),
+            overdue_24h=Count('id', filter=overdue_24h),
+        ).order_by()
+        for row in followup_rows:
+            sales_id = row.pop('sales_id')
+            stats[sales_id].update(row)
+        
+        # Aloqa, sinovga yozilganlar va sotuv - shu kungi status o'zgarishlari
+        event_counts = KPIService.get_status_event_counts(date_start, date_end, sales_ids)
+        for sales_id, counts in event_counts.items():
+            stats[sales_id]['contacts'] = counts['contacts']
+            stats[sales_id]['trials_registered'] = counts['trials_registered']
+            stats[sales_id]['sales_count'] = counts['enrolled']
+        
+        return stats
+    
+    def render(self):
+        """Hisobot matni (HTML formatda)"""
+        totals = {key: 0 for key, _ in self.TOTAL_FIELDS}
+        per_sales_lines = []
+        for sales in self.sales_users:
+            st = self.stats[sales.id]
+            for key, field in self.TOTAL_FIELDS:
+                totals[key] += st[field]
+            line1 = (
+                f"• <b>{sales.username}</b>\n"
+                f"  Yangi lidlar: {st['leads_received']} | Vazifa: {st['tasks_created']} | "
+                f"Qayta aloqa: {st['follow_ups_completed']}/{st['follow_ups_planned']} | "
+                f"Aloqa qilindi: {st['contacts']} | Sinovga yoz.: {st['trials_registered']} | "
+                f"Kursga yoz.: {st['sales_count']} | Muddati o'tgan: {st['overdue_count']}"
+            )
+            if st['new_not_contacted'] > 0 or st['overdue_24h'] > 0:
+                line1 += f"\n  ⚠️ Yangi aloqa qilinmagan: {st['new_not_contacted']} | 24 soatdan ortiq kechikkan: {st['overdue_24h']}"
+            per_sales_lines.append(line1)
+            bs = st['by_status']
+            status_line = (
+                f"  Lidlar holati: yangi {bs['new']}, aloqa qilindi {bs['contacted']}, qiziqmoqda {bs['interested']}, "
+                f"sinovga yoz. {bs['trial_registered']}, kursga yoz. {bs['enrolled']}, yo'qotilgan {bs['lost']}"
+            )
+            per_sales_lines.append(status_line)
+        header = f"📊 <b>Kunlik sotuv hisobot</b> ({self.date.strftime('%d.%m.%Y')})"
+        totals_line = (
+            f"Jami: Yangi lidlar {totals['leads_received']} | Vazifa {totals['tasks_created']} | "
+            f"Qayta aloqa {totals['follow_ups_completed']}/{totals['follow_ups_planned']} | "
+            f"Aloqa {totals['contacts']} | Sinov {totals['trials']} | Kursga yoz. {totals['sales']} | "
+            f"Muddati o'tgan {totals['overdue']}"
+        )
+        if totals['new_not_contacted'] > 0 or totals['overdue_24h'] > 0:
+            totals_line += f"\n⚠️ Yangi aloqa qilinmagan: {totals['new_not_contacted']} | 24 soatdan ortiq kechikkan: {totals['overdue_24h']}"
+        body = "\n".join(per_sales_lines) if per_sales_lines else "Ma'lumot topilmadi."
+        return f"{header}\n{totals_line}\n\n{body}"
+    
+    @classmethod
+    def get_message(cls, date=None):
+        """Sana bo'yicha keshlangan hisobot matni (yuborish uchun)"""
+        from django.core.cache import cache
+        
+        date = date or timezone.now().date()
+        key = cls.CACHE_KEY.format(date=date.isoformat())
+        message = cache.get(key)
+        if message is None:
+            message = cls(date).render()
+            cache.set(key, message, cls.CACHE_TIMEOUT)
+        return message
+
+
+class KPIRollups:
+    """
+    Haftalik (KPIWeekly) va oylik (KPIMonthly) KPI yig'indilari
+    Kunlik KPI qatori o'zgarganda (KPICounters, KPI upsert) eski va yangi qiymatlar farqi
+    tegishli hafta va oy qatorlariga F() bilan qo'shiladi - davr qayta yig'ilmaydi.
+    
+    Kelajak sanali qatorlar (rejalashtirilgan follow-up'lar) o'z kuni kelgandan keyingi birinchi
+    yozuvda to'liq qo'shiladi (KPI.in_rollup); tungi reconcile davrni rebuild() bilan tuzatadi.
+    """
+    
+    ROLLUP_FIELDS = [
+        'daily_contacts', 'daily_followups', 'followups_completed', 'followup_completion_rate',
+        'trials_registered', 'trials_to_sales', 'leads_assigned', 'conversion_rate',
+        'response_count', 'response_time_total', 'response_time_minutes', 'overdue_count',
+    ]
+    
+    @staticmethod
+    def week_start(date):
+        return date - timedelta(days=date.weekday())
+    
+    @staticmethod
+    def month_start(date):
+        return date.replace(day=1)
+    
+    @staticmethod
+    def apply(changes):
+        """
+        Kunlik qatorlar o'zgarishini yig'indilarga qo'shish
+        Args:
+            changes: [(sales_id, date, eski qiymatlar yoki None, yangi qiymatlar), ...]
+        """
+        from django.db.models import F
+        
+        today = timezone.localdate()
+        deltas = {}  # (model, sales_id, period_start) -> {field: delta}
+        for sales_id, date, old_values, new_values in changes:
+            if date > today:
+                continue
+            if not (old_values or {}).get('in_rollup'):
+                # Qator hali yig'indida yo'q - to'liq qo'shiladi (faqat bitta yozuvchi belgilaydi)
+                if KPI.objects.filter(sales_id=sales_id, date=date, in_rollup=False).update(in_rollup=True):
+                    old_values = None
+            row_deltas = {
+                field: (new_values.get(field) or 0) - ((old_values or {}).get(field) or 0)
+                for field in KPIRollups.ROLLUP_FIELDS
+            }
+            if old_values is None:
+                row_deltas['days'] = 1
+            for model, period_start in (
+                (KPIWeekly, KPIRollups.week_start(date)),
+                (KPIMonthly, KPIRollups.month_start(date)),
+            ):
+                totals = deltas.setdefault((model, sales_id, period_start), {})
+                for field, delta in row_deltas.items():
+                    totals[field] = totals.get(field, 0) + delta
+        
+        for (model, sales_id, period_start), totals in deltas.items():
+            updates = {field: F(field) + delta for field, delta in totals.items() if delta}
+            if not updates:
+                continue
+            if not model.objects.filter(sales_id=sales_id, period_start=period_start).update(**updates):
+                model.objects.bulk_create([model(sales_id=sales_id, period_start=period_start)], ignore_conflicts=True)
+                model.objects.filter(sales_id=sales_id, period_start=period_start).update(**updates)
+    
+    @staticmethod
+    def rebuild(date):
+        """date tushgan hafta va oy yig'indilarini kunlik qatorlardan qayta qurish"""
+        from django.db import transaction
+        from django.db.models import Sum, Count
+        from calendar import monthrange
+        
+        today = timezone.localdate()
+        month_start = KPIRollups.month_start(date)
+        for model, start, end in (
+            (KPIWeekly, KPIRollups.week_start(date), KPIRollups.week_start(date) + timedelta(days=6)),
+            (KPIMonthly, month_start, month_start.replace(day=monthrange(date.year, date.month)[1])),
+        ):
+            rows = KPI.objects.filter(date__gte=start, date__lte=min(end, today))
+            totals = rows.values('sales_id').annotate(
+                days=Count('id'),
+                **{field: Sum(field) for field in KPIRollups.ROLLUP_FIELDS}
+            )
+            with transaction.atomic():
+                model.objects.filter(period_start=start).delete()
+                model.objects.bulk_create([model(period_start=start, **row) for row in totals])
+                rows.filter(in_rollup=False).update(in_rollup=True)
+    
+    @staticmethod
+    def get_rows(model, period_start, sales_ids=None):
+        """Davr uchun barcha sotuvchilar yig'indilari - bitta so'rov; {sales_id: qator}"""
+        queryset = model.objects.filter(period_start=period_start)
+        if sales_ids is not None:
+            queryset = queryset.filter(sales_id__in=list(sales_ids))
+        return {row.sales_id: row for row in queryset}
+    
+    @staticmethod
+    def get_range_totals(start_date, end_date, sales_ids=None):
+        """
+        Ixtiyoriy sana oralig'i uchun yig'indilar: to'liq oylar - KPIMonthly, to'liq haftalar -
+        KPIWeekly, qolgan chekka kunlar (har tomonda 6 tagacha) - kunlik KPI qatorlari.
+        Yig'indilar kabi bugundan keyingi sanalar kirmaydi. Ko'pi bilan 3 ta so'rov.
+        Returns: {sales_id: ROLLUP_FIELDS + 'days' kalitli dict} (summarize() uchun)
+        """
+        from django.db.models import Sum, Count, Q
+        from calendar import monthrange
+        
+        end_date = min(end_date, timezone.localdate())
+        months, weeks, day_ranges = [], [], []
+        
+        def split_weeks(start, end):
+            # Oraliqni to'liq haftalar va chekka kunlarga bo'lish
+            first_monday = start + timedelta(days=(7 - start.weekday()) % 7)
+            if first_monday + timedelta(days=6) > end:
+                day_ranges.append((start, end))
+                return
+            if first_monday > start:
+                day_ranges.append((start, first_monday - timedelta(days=1)))
+            week = first_monday
+            while week + timedelta(days=6) <= end:
+                weeks.append(week)
+                week += timedelta(days=7)
+            if week <= end:
+                day_ranges.append((week, end))
+        
+        # To'liq oylar; qolgan qismlar (ketma-ketlari birlashtiriladi) haftalarga bo'linadi
+        segments = []
+        cursor = start_date
+        while cursor <= end_date:
+            month_end = cursor.replace(day=monthrange(cursor.year, cursor.month)[1])
+            segment_end = min(month_end, end_date)
+            if cursor.day == 1 and segment_end == month_end:
+                months.append(cursor)
+            elif segments and segments[-1][1] + timedelta(days=1) == cursor:
+                segments[-1] = (segments[-1][0], segment_end)
+            else:
+                segments.append((cursor, segment_end))
+            cursor = segment_end + timedelta(days=1)
+        for start, end in segments:
+            split_weeks(start, end)
+        
+        totals = {}
+        
+        def add(sales_id, values):
+            row = totals.setdefault(sales_id, dict.fromkeys(KPIRollups.ROLLUP_FIELDS + ['days'], 0))
+            for field in row:
+                row[field] += values.get(field) or 0
+        
+        for model, period_starts in ((KPIMonthly, months), (KPIWeekly, weeks)):
+            if not period_starts:
+                continue
+            queryset = model.objects.filter(period_start__in=period_starts)
+            if sales_ids is not None:
+                queryset = queryset.filter(sales_id__in=list(sales_ids))
+            for row in queryset.values('sales_id', 'days', *KPIRollups.ROLLUP_FIELDS):
+                add(row['sales_id'], row)
+        
+        if day_ranges:
+            date_filter = Q()
+            for start, end in day_ranges:
+                date_filter |= Q(date__gte=start, date__lte=end)
+            queryset = KPI.objects.filter(date_filter)
+            if sales_ids is not None:
+                queryset = queryset.filter(sales_id__in=list(sales_ids))
+            rows = queryset.values('sales_id').annotate(
+                days=Count('id'),
+                **{field: Sum(field) for field in KPIRollups.ROLLUP_FIELDS}
+            )
+            for row in rows:
+                add(row['sales_id'], row)
+        return totals
+    
+    @staticmethod
+    def summarize(rollup):
+        """
+        Yig'indi qatoridan xulosa (get_weekly_kpi_summary formatida)
+        rollup - KPIWeekly/KPIMonthly, ROLLUP_FIELDS + 'days' kalitli dict yoki None
+        """
+        if rollup is None:
+            rollup = {}
+        elif not isinstance(rollup, dict):
+            rollup = {field: getattr(rollup, field) for field in KPIRollups.ROLLUP_FIELDS + ['days']}
+        
+        def total(field):
+            return rollup.get(field) or 0
+        
+        days = total('days')
+        
+        def average(field):
+            return total(field) / days if days else 0
+        
+        assigned = total('leads_assigned')
+        return {
+            'days': days,
+            'total_contacts': total('daily_contacts'),
+            'total_followups': total('daily_followups'),
+            'total_trials': total('trials_registered'),
+            'total_sales': total('trials_to_sales'),
+            'total_assigned': assigned,
+            'avg_contacts': average('daily_contacts'),
+            'avg_completion_rate': average('followup_completion_rate'),
+            'avg_conversion_rate': average('conversion_rate'),
+            'avg_trials_to_sales': average('trials_to_sales'),
+            'avg_response_time': average('response_time_minutes'),
+            'avg_overdue': average('overdue_count'),
+            # Davr konversiyasi: sotuvlar / berilgan lidlar
+            'conversion_rate': total('trials_to_sales') / assigned * 100 if assigned else 0,
+        }
+    
+    @staticmethod
+    def get_period_summaries(period, today=None, sales_ids=None):
+        """
+        Barcha sotuvchilar uchun davr xulosasi
+        'month' - KPIMonthly dan bitta o'qish; boshqa davrlar - kunlik qatorlardan bitta GROUP BY.
+        Returns: {sales_id: summarize() natijasi}
+        """
+        from django.db.models import Sum, Count
+        
+        today = today or timezone.localdate()
+        if period == 'month':
+            rows = KPIRollups.get_rows(KPIMonthly, KPIRollups.month_start(today), sales_ids)
+            return {sales_id: KPIRollups.summarize(row) for sales_id, row in rows.items()}
+        
+        start_date, end_date = Leaderboard.get_period_range(period, today)
+        queryset = KPI.objects.filter(date__gte=start_date, date__lte=end_date)
+        if sales_ids is not None:
+            queryset = queryset.filter(sales_id__in=list(sales_ids))
+        rows = queryset.values('sales_id').annotate(
+            days=Count('id'),
+            **{field: Sum(field) for field in KPIRollups.ROLLUP_FIELDS}
+        )
+        return {row['sales_id']: KPIRollups.summarize(row) for row in rows}
+
+
+class KPICounters:
+    """
+    Kunlik KPI hisoblagichlarini yozish vaqtida yangilash (atomik F() increment)
+    Status o'zgarishi, follow-up yaratish/bajarish va lid biriktirish tegishli kunning KPI
+    qatoriga delta qo'shadi; rate'lar o'sha UPDATE ichida qayta hisoblanadi.
+    Tungi KPIService.reconcile_daily_kpi hisoblagichlarni to'liq hisob bilan tuzatadi.
+    """
+    
+    COUNTER_FIELDS = [
+        'daily_contacts', 'daily_followups', 'followups_completed', 'trials_registered',
+        'trials_to_sales', 'leads_assigned', 'response_count',
+    ]
+    
+    @staticmethod
+    def local_date(at):
+        return timezone.localtime(at).date()
+    
+    @staticmethod
+    def _ratio(numerator, denominator, scale):
+        """numerator / denominator * scale (denominator 0 bo'lsa 0)"""
+        from django.db.models import Case, When, Value, FloatField, ExpressionWrapper
+        from django.db.models.functions import Cast
+        from django.db.models.lookups import GreaterThan
+        
+        return Case(
+            When(GreaterThan(denominator, 0), then=ExpressionWrapper(
+                Cast(numerator, FloatField()) * scale / denominator, output_field=FloatField()
+            )),
+            default=Value(0.0),
+            output_field=FloatField()
+        )
+    
+    @staticmethod
+    def _update_expressions(deltas):
+        """F() increment va ulardan kelib chiqadigan rate'lar"""
+        from django.db.models import F
+        
+        def value(field):
+            return F(field) + deltas[field] if field in deltas else F(field)
+        
+        updates = {field: value(field) for field in deltas}
+        if {'followups_completed', 'daily_followups'} & deltas.keys():
+            updates['followup_completion_rate'] = KPICounters._ratio(
+                value('followups_completed'), value('daily_followups'), 100
+            )
+        if {'trials_to_sales', 'leads_assigned'} & deltas.keys():
+            updates['conversion_rate'] = KPICounters._ratio(
+                value('trials_to_sales'), value('leads_assigned'), 100
+            )
+        if {'response_time_total', 'response_count'} & deltas.keys():
+            updates['response_time_minutes'] = KPICounters._ratio(
+                value('response_time_total'), value('response_count'), 1
+            )
+        return updates
+    
+    @staticmethod
+    def apply_many(deltas_by_row):
+        """
+        Deltalarni qo'llash
+        Args:
+            deltas_by_row: {(sales_id, date): {field: delta}}
+        """
+        from django.db import transaction
+        
+        changes = []
+        for (sales_id, date), deltas in deltas_by_row.items():
+            deltas = {field: delta for field, delta in deltas.items() if delta}
+            if not sales_id or not deltas:
+                continue
+            updates = KPICounters._update_expressions(deltas)
+            row = KPI.objects.filter(sales_id=sales_id, date=date)
+            with transaction.atomic():
+                # Eski/yangi qiymatlar - haftalik va oylik yig'indilar uchun
+                old_values = row.select_for_update().values(*KPIRollups.ROLLUP_FIELDS, 'in_rollup').first()
+                if old_values is None:
+                    # Kunning birinchi hodisasi - qatorni yaratib yangilash
+                    KPI.objects.bulk_create([KPI(sales_id=sales_id, date=date)], ignore_conflicts=True)
+                row.update(**updates)
+                changes.append((sales_id, date, old_values, row.values(*KPIRollups.ROLLUP_FIELDS).first()))
+        if changes:
+            KPIRollups.apply(changes)
+            # Reyting keshi yangilanmaydi - Leaderboard.CACHE_TIMEOUT bo'yicha eskiradi
+    
+    @staticmethod
+    def _add(deltas_by_row, sales_id, date, field, delta):
+        if sales_id:
+            row = deltas_by_row.setdefault((sales_id, date), {})
+            row[field] = row.get(field, 0) + delta
+    
+    @staticmethod
+    def followup_state(followup):
+        """KPI uchun follow-up holati: (sales_id, due kuni, completed)"""
+        if not followup.sales_id or not followup.due_date:
+            return None
+        return (followup.sales_id, KPICounters.local_date(followup.due_date), bool(followup.completed))
+    
+    @staticmethod
+    def followups_changed(changes):
+        """
+        Follow-up'lar o'zgarishi (yaratish, ko'chirish, bajarish, o'chirish)
+        Args:
+            changes: [(eski holat yoki None, yangi holat yoki None), ...]
+        """
+        deltas_by_row = {}
+        for old_state, new_state in changes:
+            if old_state == new_state:
+                continue
+            for state, sign in ((old_state, -1), (new_state, 1)):
+                if state:
+                    sales_id, date, completed = state
+                    KPICounters._add(deltas_by_row, sales_id, date, 'daily_followups', sign)
+                    if completed:
+                        KPICounters._add(deltas_by_row, sales_id, date, 'followups_completed', sign)
+        KPICounters.apply_many(deltas_by_row)
+        # Sotuvchi yuklanishi (yangi lid follow-up kechikishi uchun) - cache'da
+        SalesLoadCounters.followups_changed(changes)
+    
+    @staticmethod
+    def followups_created(followups):
+        """bulk_create qilingan follow-up'lar (signal chaqirilmaydi)"""
+        KPICounters.followups_changed([(None, KPICounters.followup_state(followup)) for followup in followups])
+    
+    @staticmethod
+    def lead_assignment_changed(lead, old_sales_id):
+        """
+        Lid biriktirilishi - yaratilgan kunning 'berilgan lidlar' soni
+        Birinchi javob vaqti ham lidning hozirgi sotuvchisiga ko'chadi.
+        """
+        if old_sales_id == lead.assigned_sales_id:
+            return
+        date = KPICounters.local_date(lead.created_at)
+        moves = [(old_sales_id, -1), (lead.assigned_sales_id, 1)]
+        deltas_by_row = {}
+        for sales_id, sign in moves:
+            KPICounters._add(deltas_by_row, sales_id, date, 'leads_assigned', sign)
+        
+        first_response = KPIService.get_first_response_times([lead.id]).get(lead.id) if old_sales_id else None
+        if first_response:
+            response_time = (first_response - lead.created_at).total_seconds() / 60
+            if response_time >= 0:
+                for sales_id, sign in moves:
+                    KPICounters._add(deltas_by_row, sales_id, date, 'response_count', sign)
+                    KPICounters._add(deltas_by_row, sales_id, date, 'response_time_total', sign * response_time)
+        KPICounters.apply_many(deltas_by_row)
+    
+    @staticmethod
+    def leads_created(events):
+        """
+        Ommaviy yaratilgan lidlar (signal chaqirilmaydi) - bitta apply_many
+        Har bir lid uchun lead_assignment_changed(lead, None) + status_changed(event, lead) bilan bir xil:
+        yangi lidda oldingi hodisalar va birinchi javob yo'q.
+        Args:
+            events: yangi lidlarning boshlang'ich LeadStatusEvent'lari (event.lead o'rnatilgan)
+        """
+        deltas_by_row = {}
+        for event in events:
+            KPICounters._add(deltas_by_row, event.lead.assigned_sales_id, KPICounters.local_date(event.lead.created_at), 'leads_assigned', 1)
+            date = KPICounters.local_date(event.at)
+            if event.to_status in KPIService.CONTACT_STATUSES:
+                KPICounters._add(deltas_by_row, event.sales_id, date, 'daily_contacts', 1)
+            if event.to_status == 'trial_registered':
+                KPICounters._add(deltas_by_row, event.sales_id, date, 'trials_registered', 1)
+            if event.to_status == 'enrolled':
+                KPICounters._add(deltas_by_row, event.sales_id, date, 'trials_to_sales', 1)
+        KPICounters.apply_many(deltas_by_row)
+    
+    @staticmethod
+    def status_changed(event, lead):
+        """
+        LeadStatusEvent yozilgandan keyin: aloqa, sinov, sotuv va birinchi javob vaqti
+        Bir lid bir kunda bir marta sanaladi (KPIService.get_status_event_counts kabi).
+        """
+        date = KPICounters.local_date(event.at)
+        day_start = timezone.make_aware(timezone.datetime.combine(date, timezone.datetime.min.time()))
+        earlier = list(LeadStatusEvent.objects.filter(
+            lead_id=event.lead_id,
+            id__lt=event.id
+        ).values_list('from_status', 'to_status', 'at', 'sales_id'))
+        # Sotuvchi bo'yicha sanaladi - lid boshqa sotuvchiga o'tgan bo'lsa, u uchun yangi
+        today_statuses = {
+            to_status for _, to_status, at, sales_id in earlier
+            if at >= day_start and sales_id == event.sales_id
+        }
+        
+        deltas_by_row = {}
+        if event.to_status in KPIService.CONTACT_STATUSES and not today_statuses & set(KPIService.CONTACT_STATUSES):
+            KPICounters._add(deltas_by_row, event.sales_id, date, 'daily_contacts', 1)
+        if event.to_status == 'trial_registered' and 'trial_registered' not in today_statuses:
+            KPICounters._add(deltas_by_row, event.sales_id, date, 'trials_registered', 1)
+        if event.to_status == 'enrolled' and 'enrolled' not in today_statuses:
+            KPICounters._add(deltas_by_row, event.sales_id, date, 'trials_to_sales', 1)
+        
+        # Birinchi javob - lid yaratilgan kunning KPI'siga
+        is_response = event.from_status != '' and event.to_status != 'new'
+        if is_response and not any(from_status != '' and to_status != 'new' for from_status, to_status, _, _ in earlier):
+            response_time = (event.at - lead.created_at).total_seconds() / 60
+            if response_time >= 0:
+                created_date = KPICounters.local_date(lead.created_at)
+                KPICounters._add(deltas_by_row, lead.assigned_sales_id, created_date, 'response_count', 1)
+                KPICounters._add(deltas_by_row, lead.assigned_sales_id, created_date, 'response_time_total', response_time)
+        KPICounters.apply_many(deltas_by_row)
+
+
+class SalesLoadCounters:
+    """
+    Sotuvchi yuklanishi hisoblagichlari - yangi lid follow-up kechikishi (FollowUpService.new_lead_delay) uchun.
+    
+    Cache'da atomik incr/decr bilan yuritiladi (sotuvchiga ikkita kalit, ikkalasi ham bugungi sana bilan):
+    - new_leads:{sales_id}:{sana} - bugun yaratilgan, hali 'new' statusdagi lidlar
+    - due_soon:{sales_id}:{sana} - ochiq follow-up'lar, due kuni ertagacha (muddati o'tgan, bugungi, ertangi)
+    
+    Yuklanish = due_soon ("keyingi 24 soat" so'rovining kun bo'yicha yaqinlashuvi); indin va undan
+    keyingi follow-up'lar sanalmaydi. Kun almashganda kalitlar yangilanadi - birinchi o'qish DB dan quradi.
+    O'qish - bitta get_many; kalit yo'q bo'lsa sotuvchi kalitlari DB dan qayta quriladi.
+    incr yo'q kalitni o'tkazib yuboradi (keyingi o'qishda DB dan olinadi); rollback yoki
+    queryset.update() sababli siljish TIMEOUT bilan cheklanadi.
+    
+    Hisoblagichlar faqat umumiy cache'da (Redis, settings.CACHE_REDIS_URL) ma'noli - LocMem'da har bir
+    jarayon boshqa jarayonlarning o'zgarishlarini ko'rmaydi, shuning uchun u holda har o'qish DB dan.
+    """
+    
+    TIMEOUT = 60 * 60
+    
+    @staticmethod
+    def _new_leads_key(sales_id, date):
+        return f'sales_load:new_leads:{sales_id}:{date.isoformat()}'
+    
+    @staticmethod
+    def _due_soon_key(sales_id, date):
+        return f'sales_load:due_soon:{sales_id}:{date.isoformat()}'
+    
+    @staticmethod
+    def _keys(sales_id, today):
+        return [SalesLoadCounters._new_leads_key(sales_id, today), SalesLoadCounters._due_soon_key(sales_id, today)]
+    
+    @staticmethod
+    def shared_cache():
+        """Cache jarayonlararo umumiymi (LocMem va Dummy - yo'q)"""
+        from django.core.cache import caches
+        from django.core.cache.backends.dummy import DummyCache
+        from django.core.cache.backends.locmem import LocMemCache
+        
+        return not isinstance(caches['default'], (LocMemCache, DummyCache))
+    
+    @staticmethod
+    def get_many(sales_ids):
+        """
+        Returns: {sales_id: (bugungi yangi lidlar, yuklanish - ertagacha ochiq follow-up'lar)}
+        Bitta cache get_many; yo'q kalitli sotuvchilar (yoki umumiy cache bo'lmasa) uchun ikkita GROUP BY so'rov.
+        """
+        from django.core.cache import cache
+        
+        today = timezone.localdate()
+        sales_ids = [sales_id for sales_id in dict.fromkeys(sales_ids) if sales_id]
+        if not sales_ids:
+            return {}
+        keys_by_sales = {sales_id: SalesLoadCounters._keys(sales_id, today) for sales_id in sales_ids}
+        if not SalesLoadCounters.shared_cache():
+            values = SalesLoadCounters.count(sales_ids, today)
+        else:
+            values = cache.get_many([key for keys in keys_by_sales.values() for key in keys])
+            missing = [
+                sales_id for sales_id, keys in keys_by_sales.items()
+                if any(key not in values for key in keys)
+            ]
+            if missing:
+                values.update(SalesLoadCounters.rebuild(missing, today))
+        
+        return {
+            sales_id: (values[new_leads_key], values[due_soon_key])
+            for sales_id, (new_leads_key, due_soon_key) in keys_by_sales.items()
+        }
+    
+    @staticmethod
+    def get(sales_id):
+        """Bitta sotuvchi: (bugungi yangi lidlar, yuklanish)"""
+        return SalesLoadCounters.get_many([sales_id]).get(sales_id, (0, 0))
+    
+    @staticmethod
+    def count(sales_ids, today=None):
+        """Sotuvchilar hisoblagichlari DB dan - {kalit: qiymat}"""
+        from django.db.models import Count
+        
+        today = today or timezone.localdate()
+        values = {}
+        for sales_id in sales_ids:
+            for key in SalesLoadCounters._keys(sales_id, today):
+                values[key] = 0
+        
+        for sales_id, count in Lead.objects.filter(
+            assigned_sales_id__in=sales_ids,
+            created_at__date=today,
+            status='new'
+        ).values_list('assigned_sales_id').annotate(count=Count('id')):
+            values[SalesLoadCounters._new_leads_key(sales_id, today)] = count
+        
+        for sales_id, count in FollowUp.objects.filter(
+            sales_id__in=sales_ids,
+            completed=False,
+            due_date__date__lte=today + timedelta(days=1)
+        ).values_list('sales_id').annotate(count=Count('id')):
+            values[SalesLoadCounters._due_soon_key(sales_id, today)] = count
+        return values
+    
+    @staticmethod
+    def rebuild(sales_ids, today=None):
+        """Sotuvchilar hisoblagichlarini DB dan qayta qurish (cache miss)"""
+        from django.core.cache import cache
+        
+        values = SalesLoadCounters.count(sales_ids, today)
+        cache.set_many(values, SalesLoadCounters.TIMEOUT)
+        return values
+    
+    @staticmethod
+    def _apply(deltas):
+        """{kalit: delta} - atomik incr/decr; yo'q kalit o'tkazib yuboriladi"""
+        from django.core.cache import cache
+        
+        if not SalesLoadCounters.shared_cache():
+            return  # LocMem - o'qish DB dan, hisoblagich yuritilmaydi
+        for key, delta in deltas.items():
+            if not delta:
+                continue
+            try:
+                if delta > 0:
+                    cache.incr(key, delta)
+                else:
+                    cache.decr(key, -delta)
+            except ValueError:
+                pass
+    
+    @staticmethod
+    def followups_changed(changes):
+        """
+        Follow-up holati o'zgarishlari (KPICounters.followups_changed bilan bir xil format)
+        changes: [(eski holat yoki None, yangi holat yoki None), ...], holat = (sales_id, due kuni, completed)
+        Faqat ertagacha bo'lgan ochiq follow-up'lar sanaladi.
+        """
+        today = timezone.localdate()
+        horizon = today + timedelta(days=1)
+        deltas = {}
+        for old_state, new_state in changes:
+            if old_state == new_state:
+                continue
+            for state, sign in ((old_state, -1), (new_state, 1)):
+                if state and state[0] and not state[2] and state[1] <= horizon:
+                    key = SalesLoadCounters._due_soon_key(state[0], today)
+                    deltas[key] = deltas.get(key, 0) + sign
+        SalesLoadCounters._apply(deltas)
+    
+    @staticmethod
+    def lead_changed(lead, created, old_status, old_sales_id):
+        """Lid yaratilishi, statusi yoki sotuvchisi o'zgarishi - bugungi yangi lidlar hisoblagichi"""
+        today = timezone.localdate()
+        if not lead.created_at or KPICounters.local_date(lead.created_at) != today:
+            return
+        deltas = {}
+        if not created and old_sales_id and old_status == 'new':
+            key = SalesLoadCounters._new_leads_key(old_sales_id, today)
+            deltas[key] = deltas.get(key, 0) - 1
+        if lead.assigned_sales_id and lead.status == 'new':
+            key = SalesLoadCounters._new_leads_key(lead.assigned_sales_id, today)
+            deltas[key] = deltas.get(key, 0) + 1
+        SalesLoadCounters._apply(deltas)
+    
+    @staticmethod
+    def leads_created(leads):
+        """Ommaviy yaratilgan lidlar (bulk_create - signal chaqirilmaydi)"""
+        for lead in leads:
+            SalesLoadCounters.lead_changed(lead, True, '', None)
+
+
+class LogHistogram:
+    """
+    Log-bucket gistogramma (soniyalar): 1 daqiqadan boshlab har bir bucket oldingisidan
+    2^(1/4) marta keng, kvantil xatosi ~9% dan oshmaydi. Bir nechta kun/sotuvchi
+    gistogrammalari hisoblagichlarni qo'shish orqali birlashtiriladi (merge).
+    """
+    
+    MIN_SECONDS = 60
+    GROWTH = 2 ** 0.25
+    BUCKETS = 80  # oxirgi bucket ~600 kundan ortiq
+    
+    def __init__(self, counts=None, total_seconds=0.0):
+        self.counts = list(counts or [])
+        self.counts += [0] * (self.BUCKETS - len(self.counts))
+        self.total_seconds = total_seconds
+    
+    @property
+    def count(self):
+        return sum(self.counts)
+    
+    @classmethod
+    def bucket_index(cls, seconds):
+        """Soniya -> bucket (0 - bir daqiqadan kam)"""
+        import math
+        
+        if seconds < cls.MIN_SECONDS:
+            return 0
+        return min(1 + int(math.log(seconds / cls.MIN_SECONDS, cls.GROWTH)), cls.BUCKETS - 1)
+    
+    @classmethod
+    def bucket_value(cls, index):
+        """Bucket vakili (soniya) - chegaralarning geometrik o'rtasi"""
+        if index == 0:
+            return cls.MIN_SECONDS / 2
+        return cls.MIN_SECONDS * cls.GROWTH ** (index - 1) * cls.GROWTH ** 0.5
+    
+    def add(self, seconds):
+        seconds = max(seconds, 0)
+        self.counts[self.bucket_index(seconds)] += 1
+        self.total_seconds += seconds
+    
+    def merge(self, other):
+        for index, value in enumerate(other.counts):
+            self.counts[index] += value
+        self.total_seconds += other.total_seconds
+        return self
+    
+    def quantile(self, q):
+        """q (0..1) kvantil, soniya (bo'sh bo'lsa None)"""
+        total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, value in enumerate(self.counts):
+            seen += value
+            if value and seen >= rank:
+                return self.bucket_value(index)
+        return self.bucket_value(self.BUCKETS - 1)
+    
+    def summary(self):
+        """{'count', 'mean', 'p50', 'p90', 'p99'} - daqiqalarda"""
+        total = self.count
+        
+        def minutes(seconds):
+            return seconds / 60 if seconds is not None else None
+        
+        return {
+            'count': total,
+            'mean': self.total_seconds / total / 60 if total else None,
+            'p50': minutes(self.quantile(0.5)),
+            'p90': minutes(self.quantile(0.9)),
+            'p99': minutes(self.quantile(0.99)),
+        }
+    
+    def to_bytes(self):
+        """Ixcham blob: uint32 hisoblagichlar (oxirgi nollar tashlanadi)"""
+        import struct
+        
+        size = len(self.counts)
+        while size and not self.counts[size - 1]:
+            size -= 1
+        return struct.pack(f'<{size}I', *self.counts[:size])
+    
+    @classmethod
+    def from_bytes(cls, data, total_seconds=0.0):
+        import struct
+        
+        data = bytes(data or b'')
+        return cls(struct.unpack(f'<{len(data) // 4}I', data), total_seconds)
+
+
+class LatencyStats:
+    """
+    O'tish vaqtlari taqsimoti (p50/p90/p99): yangi -> aloqa, aloqa -> sinov, sinovga keldi -> kursga
+    yozildi va qayta aloqa muddati -> bajarilgan vaqt, sotuvchi va kurs bo'yicha.
+    
+    rebuild_day() bitta kunda yakunlangan o'tishlarni (LatencyHistogram) qayta yozadi -
+    faqat shu kunning hodisalari o'qiladi; davr taqsimoti kunlik gistogrammalarni qo'shib olinadi.
+    """
+    
+    METRICS = [key for key, _ in LatencyHistogram.METRIC_CHOICES]
     
     @staticmethod
-    def get_room_occupancy(room, date_obj, time_slot):
-        """Xona bandligini olish"""
-        # Bu yerda dars jadvali asosida hisoblash kerak
-        # Soddalashtirilgan versiya
-        groups = Group.objects.filter(room=room, time=time_slot, is_active=True)
-        total_students = sum(group.current_students for group in groups)
-        total_capacity = sum(group.capacity for group in groups)
-        
-        if total_capacity == 0:
-            return 0
+    def collect_day(date):
+        """
+        Kun ichida yakunlangan o'tishlar
+        Returns: {(metric, sales_id, course_id): LogHistogram}
+        """
+        from datetime import datetime, time as dt_time
+        from django.db.models import Min
         
-        return (total_students / total_capacity) * 100
+        date_start = timezone.make_aware(datetime.combine(date, dt_time.min))
+        date_end = date_start + timedelta(days=1)
+        histograms = {}
+        
+        def add(metric, sales_id, course_id, seconds):
+            key = (metric, sales_id, course_id)
+            if key not in histograms:
+                histograms[key] = LogHistogram()
+            histograms[key].add(seconds)
+        
+        # Shu kungi status o'tishlari (lid yaratilishi hodisasidan tashqari)
+        events = list(LeadStatusEvent.objects.filter(
+            at__gte=date_start, at__lt=date_end
+        ).exclude(from_status='').exclude(to_status='new').values_list(
+            'lead_id', 'to_status', 'sales_id', 'at', 'lead__created_at', 'lead__interested_course_id'
+        ).order_by('at'))
+        
+        # Har bir lid uchun statuslarga birinchi o'tish vaqtlari (faqat shu kunda hodisasi bo'lgan lidlar)
+        firsts = {}
+        lead_ids = list({event[0] for event in events})
+        for offset in range(0, len(lead_ids), 500):
+            for lead_id, to_status, first_at in LeadStatusEvent.objects.filter(
+                lead_id__in=lead_ids[offset:offset + 500]
+            ).exclude(from_status='').values('lead_id', 'to_status').annotate(
+                first_at=Min('at')
+            ).values_list('lead_id', 'to_status', 'first_at').order_by():
+                firsts[(lead_id, to_status)] = first_at
+        
+        def first_of(lead_id, statuses):
+            times = [firsts[(lead_id, status)] for status in statuses if (lead_id, status) in firsts]
+            return min(times) if times else None
+        
+        contact_statuses = KPIService.CONTACT_STATUSES
+        responded_statuses = [key for key, _ in Lead.STATUS_CHOICES if key != 'new']
+        seen = set()
+        for lead_id, to_status, sales_id, at, created_at, course_id in events:
+            # Birinchi javob: lid yaratilgandan birinchi status o'zgarishigacha
+            if ('first_response', lead_id) not in seen and first_of(lead_id, responded_statuses) == at:
+                seen.add(('first_response', lead_id))
+                add('first_response', sales_id, course_id, (at - created_at).total_seconds())
+            # Aloqadan sinovga yozilishgacha (birinchi yozilish)
+            if to_status == 'trial_registered' and firsts.get((lead_id, to_status)) == at:
+                contacted_at = first_of(lead_id, contact_statuses)
+                if contacted_at and contacted_at <= at:
+                    add('contact_to_trial', sales_id, course_id, (at - contacted_at).total_seconds())
+            # Sinovga kelgandan kursga yozilishgacha
+            if to_status == 'enrolled' and firsts.get((lead_id, to_status)) == at:
+                attended_at = firsts.get((lead_id, 'trial_attended'))
+                if attended_at and attended_at <= at:
+                    add('trial_to_enrolled', sales_id, course_id, (at - attended_at).total_seconds())
+        
+        # Qayta aloqa: muddatdan bajarilgan vaqtgacha (muddatidan oldin bajarilgan - 0)
+        for sales_id, due_date, completed_at, course_id in FollowUp.objects.filter(
+            completed=True, completed_at__gte=date_start, completed_at__lt=date_end
+        ).values_list('sales_id', 'due_date', 'completed_at', 'lead__interested_course_id'):
+            add('followup_completion', sales_id, course_id, (completed_at - due_date).total_seconds())
+        
+        return histograms
     
     @staticmethod
-    def can_enroll_to_group(group):
-        """Guruhga yozish mumkinligini tekshirish"""
-        return not group.is_full
+    def rebuild_day(date):
+        """Kunlik gistogramma qatorlarini qayta yozish. Returns: qatorlar soni"""
+        from django.db import transaction
+        
+        histograms = LatencyStats.collect_day(date)
+        with transaction.atomic():
+            LatencyHistogram.objects.filter(date=date).delete()
+            LatencyHistogram.objects.bulk_create([
+                LatencyHistogram(
+                    date=date,
+                    metric=metric,
+                    sales_id=sales_id,
+                    course_id=course_id,
+                    count=histogram.count,
+                    total_seconds=histogram.total_seconds,
+                    buckets=histogram.to_bytes(),
+                )
+                for (metric, sales_id, course_id), histogram in histograms.items()
+            ])
+        return len(histograms)
+    
+    @staticmethod
+    def get_histograms(start_date, end_date, by=None, sales_ids=None):
+        """
+        Davr uchun birlashtirilgan gistogrammalar
+        by: None, 'sales' yoki 'course'
+        Returns: {(key, metric): LogHistogram} (by=None da key - None)
+        """
+        rows = LatencyHistogram.objects.filter(date__gte=start_date, date__lte=end_date)
+        if sales_ids is not None:
+            rows = rows.filter(sales_id__in=list(sales_ids))
+        merged = {}
+        for metric, sales_id, course_id, total_seconds, buckets in rows.values_list(
+            'metric', 'sales_id', 'course_id', 'total_seconds', 'buckets'
+        ).order_by():
+            key = {'sales': sales_id, 'course': course_id}.get(by)
+            histogram = LogHistogram.from_bytes(buckets, total_seconds)
+            if (key, metric) in merged:
+                merged[(key, metric)].merge(histogram)
+            else:
+                merged[(key, metric)] = histogram
+        return merged
+    
+    @staticmethod
+    def get_distributions(start_date, end_date, by=None, sales_ids=None):
+        """
+        Ko'rsatkichlar bo'yicha p50/p90/p99 (daqiqa)
+        Returns: {key: [{'metric', 'label', 'count', 'mean', 'p50', 'p90', 'p99'}, ...]}
+        """
+        labels = dict(LatencyHistogram.METRIC_CHOICES)
+        histograms = LatencyStats.get_histograms(start_date, end_date, by=by, sales_ids=sales_ids)
+        keys = {key for key, _ in histograms}
+        if by is None:
+            keys.add(None)
+        return {
+            key: [
+                dict(
+                    (histograms.get((key, metric)) or LogHistogram()).summary(),
+                    metric=metric,
+                    label=labels[metric],
+                )
+                for metric in LatencyStats.METRICS
+            ]
+            for key in keys
+        }
 
 
 class KPIService:
     """KPI hisoblash xizmati"""
     
+    KPI_FIELDS = [
+        'daily_contacts', 'daily_followups', 'followup_completion_rate', 'trials_registered',
+        'trials_to_sales', 'conversion_rate', 'response_time_minutes', 'overdue_count',
+        'leads_assigned', 'followups_completed', 'response_count', 'response_time_total',
+    ]
+    
+    # Kunlik 'aloqa' sifatida sanaladigan statuslar
+    CONTACT_STATUSES = ['contacted', 'interested']
+    
+    @staticmethod
+    def get_status_event_counts(start, end, sales_ids=None):
+        """
+        Oraliqdagi status o'zgarishlari (LeadStatusEvent) - sotuvchi bo'yicha
+        (sales, at) indeksi bo'yicha bitta range scan; bir lid bir necha marta sanalmaydi.
+        
+        Returns:
+            dict - {sales_id: {'contacts': int, 'trials_registered': int, 'enrolled': int}}
+        """
+        from django.db.models import Count, Q
+        
+        events = LeadStatusEvent.objects.filter(at__gte=start, at__lt=end, sales_id__isnull=False)
+        if sales_ids is not None:
+            events = events.filter(sales_id__in=list(sales_ids))
+        rows = events.values('sales_id').annotate(
+            contacts=Count('lead_id', distinct=True, filter=Q(to_status__in=KPIService.CONTACT_STATUSES)),
+            trials_registered=Count('lead_id', distinct=True, filter=Q(to_status='trial_registered')),
+            enrolled=Count('lead_id', distinct=True, filter=Q(to_status='enrolled')),
+        )
+        return {
+            row['sales_id']: {
+                'contacts': row['contacts'],
+                'trials_registered': row['trials_registered'],
+                'enrolled': row['enrolled'],
+            }
+            for row in rows
+        }
+    
+    @staticmethod
+    def get_first_response_times(lead_ids):
+        """
+        Lidlarning birinchi javob vaqti ('new' dan boshqa statusga birinchi o'tish)
+        Returns: {lead_id: datetime}
+        """
+        from django.db.models import Min
+        
+        lead_ids = list(lead_ids)
+        first_response = {}
+        for offset in range(0, len(lead_ids), 500):
+            first_response.update(LeadStatusEvent.objects.filter(
+                lead_id__in=lead_ids[offset:offset + 500]
+            ).exclude(from_status='').exclude(to_status='new').values('lead_id').annotate(
+                first_at=Min('at')
+            ).values_list('lead_id', 'first_at'))
+        return first_response
+    
     @staticmethod
     def calculate_daily_kpi(sales, date):
         """Kunlik KPI hisoblash (ishda bo'lmagan vaqtlarni hisobga o'tkazmaslik)"""
-        from django.db.models import Count, Avg, Q
+        return KPIService.calculate_daily_kpi_all(date, [sales])[sales.id]
+    
+    @staticmethod
+    def calculate_daily_kpi_all(date, sales_users=None):
+        """
+        Barcha sotuvchilar uchun kunlik KPI hisoblash
+        Har bir ko'rsatkich sotuvchi bo'yicha guruhlangan shartli agregatlar bilan hisoblanadi
+        (sotuvchilar soniga bog'liq bo'lmagan so'rovlar soni) va bitta upsert bilan yoziladi.
+        
+        Args:
+            date: Sana
+            sales_users: Sotuvchilar (None - barcha faol sotuvchilar)
+        
+        Returns:
+            dict - {sales_id: KPI}
+        """
+        sales_users, values = KPIService.compute_daily_kpi_values(date, sales_users)
+        return KPIService._save_daily_kpi_values(date, sales_users, values)
+    
+    @staticmethod
+    def _save_daily_kpi_values(date, sales_users, values, extra=None):
+        """Hisoblangan qiymatlarni bitta upsert bilan yozish; {sales_id: KPI} qaytaradi"""
+        extra = extra or {}
+        if not values:
+            return {}
+        update_fields = KPIService.KPI_FIELDS + sorted({field for row in extra.values() for field in row})
+        old_rows = {
+            row['sales_id']: row
+            for row in KPI.objects.filter(date=date, sales_id__in=list(values)).values(
+                'sales_id', 'in_rollup', *KPIRollups.ROLLUP_FIELDS
+            )
+        }
+        KPI.objects.bulk_create(
+            [
+                KPI(sales_id=sales_id, date=date, **kpi_values, **extra.get(sales_id, {}))
+                for sales_id, kpi_values in values.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['sales', 'date'],
+            update_fields=update_fields,
+        )
+        Leaderboard.invalidate()
+        
+        sales_by_id = {sales.id: sales for sales in sales_users}
+        kpis = {}
+        for kpi in KPI.objects.filter(date=date, sales_id__in=list(values)):
+            kpi.sales = sales_by_id[kpi.sales_id]
+            kpis[kpi.sales_id] = kpi
+        KPIRollups.apply([
+            (
+                sales_id, date, old_rows.get(sales_id),
+                {field: getattr(kpi, field) for field in KPIRollups.ROLLUP_FIELDS}
+            )
+            for sales_id, kpi in kpis.items()
+        ])
+        return kpis
+    
+    @staticmethod
+    def compute_daily_kpi_values(date, sales_users=None):
+        """
+        Kunlik KPI'ni noldan hisoblash (yozmasdan)
+        Returns: (sales_users, {sales_id: {field: value}})
+        """
+        from django.db.models import Count, Min, Q
         from datetime import datetime, time as dt_time
+        from .models import LeaveRequest
+        
+        if sales_users is None:
+            sales_users = User.objects.filter(role='sales', is_active_sales=True)
+        sales_users = list(sales_users)
+        if not sales_users:
+            return sales_users, {}
+        sales_ids = [sales.id for sales in sales_users]
         
-        # Sotuvchi o'sha kuni ishda bo'lganligini tekshirish
         date_start = timezone.make_aware(datetime.combine(date, dt_time.min))
         date_end = timezone.make_aware(datetime.combine(date, dt_time.max))
+        next_day_start = date_start + timedelta(days=1)
+        
+        # O'sha kuni ishda bo'lmagan sotuvchilar - KPI 0
+        on_leave_ids = set(LeaveRequest.objects.filter(
+            sales_id__in=[sales.id for sales in sales_users if sales.is_on_leave],
+            start_date__lte=date,
+            end_date__gte=date,
+            status='approved'
+        ).values_list('sales_id', flat=True)) if any(sales.is_on_leave for sales in sales_users) else set()
+        absent_ids = {
+            sales.id for sales in sales_users
+            if sales.is_absent and sales.absent_from and sales.absent_until
+            and sales.absent_from <= date_end and sales.absent_until >= date_start
+        }
+        inactive_ids = on_leave_ids | absent_ids
+        working_ids = [sales_id for sales_id in sales_ids if sales_id not in inactive_ids]
         
-        # Agar sotuvchi o'sha kuni ishda bo'lmagan bo'lsa, KPI'ni 0 qilib qaytaramiz
-        if sales.is_on_leave:
-            # Ruxsat so'rovlarini tekshirish
-            from .models import LeaveRequest
-            leave_request = LeaveRequest.objects.filter(
-                sales=sales,
-                start_date__lte=date,
-                end_date__gte=date,
-                status='approved'
-            ).first()
-            if leave_request:
-                # KPI'ni 0 qilib qaytaramiz
-                kpi, created = KPI.objects.update_or_create(
-                    sales=sales,
-                    date=date,
-                    defaults={
-                        'daily_contacts': 0,
-                        'daily_followups': 0,
-                        'followup_completion_rate': 0,
-                        'trials_registered': 0,
-                        'trials_to_sales': 0,
-                        'conversion_rate': 0,
-                        'response_time_minutes': 0,
-                        'overdue_count': 0,
-                    }
-                )
-                return kpi
-        
-        # Agar sotuvchi o'sha kuni ishda emas bo'lsa
-        if sales.is_absent and sales.absent_from and sales.absent_until:
-            if sales.absent_from <= date_end and sales.absent_until >= date_start:
-                # KPI'ni 0 qilib qaytaramiz
-                kpi, created = KPI.objects.update_or_create(
-                    sales=sales,
-                    date=date,
-                    defaults={
-                        'daily_contacts': 0,
-                        'daily_followups': 0,
-                        'followup_completion_rate': 0,
-                        'trials_registered': 0,
-                        'trials_to_sales': 0,
-                        'conversion_rate': 0,
-                        'response_time_minutes': 0,
-                        'overdue_count': 0,
-                    }
-                )
-                return kpi
-        
-        # Kunlik aloqa (faqat ishda bo'lgan vaqtlarda)
-        daily_contacts = Lead.objects.filter(
-            assigned_sales=sales,
-            updated_at__date=date,
-            status__in=['contacted', 'interested']
-        ).count()
-        
-        # Kunlik follow-up (faqat ishda bo'lgan vaqtlarda)
-        daily_followups = FollowUp.objects.filter(
-            sales=sales,
-            due_date__date=date
-        ).count()
-        
-        # Follow-up bajarilganligi
-        completed_followups = FollowUp.objects.filter(
-            sales=sales,
-            due_date__date=date,
-            completed=True
-        ).count()
-        followup_completion_rate = (completed_followups / daily_followups * 100) if daily_followups > 0 else 0
-        
-        # Sinovga yozilganlar
-        trials_registered = Lead.objects.filter(
-            assigned_sales=sales,
-            status='trial_registered',
-            updated_at__date=date
-        ).count()
-        
-        # Sinovdan sotuv
-        trials_to_sales = Lead.objects.filter(
-            assigned_sales=sales,
-            status='enrolled',
-            enrolled_at__date=date
-        ).count()
-        
-        # Kunlik konversiya: shu kunda enrolled bo'lganlar / shu kunda berilgan lidlar
-        total_assigned_today = Lead.objects.filter(
-            assigned_sales=sales,
-            created_at__date=date
-        ).count()
-        enrolled_today = Lead.objects.filter(
-            assigned_sales=sales,
-            status='enrolled',
-            enrolled_at__date=date
-        ).count()
-        conversion_rate = (enrolled_today / total_assigned_today * 100) if total_assigned_today > 0 else 0
-        
-        # Response time (o'rtacha) - lead yaratilgan vaqt va birinchi aloqa (contacted/interested) orasidagi vaqt
-        response_times = []
-        leads = Lead.objects.filter(assigned_sales=sales, created_at__date=date)
-        for lead in leads:
-            # Birinchi aloqa vaqtini topish (status contacted yoki interested bo'lgan vaqt)
-            # Lead history yoki updated_at orqali
-            if lead.status in ['contacted', 'interested']:
-                # Agar lead shu kunda contacted yoki interested bo'lgan bo'lsa
-                if lead.updated_at.date() == date:
-                    response_time = (lead.updated_at - lead.created_at).total_seconds() / 60
-                    # Faqat ijobiy response time (kelajakdagi vaqtlar emas)
-                    if response_time >= 0:
-                        response_times.append(response_time)
-            else:
-                # Agar hali contacted bo'lmagan bo'lsa, birinchi follow-up vaqtini olish
-                first_followup = FollowUp.objects.filter(lead=lead).order_by('due_date').first()
-                if first_followup:
-                    response_time = (first_followup.due_date - lead.created_at).total_seconds() / 60
+        values = {sales_id: dict.fromkeys(KPIService.KPI_FIELDS, 0) for sales_id in sales_ids}
+        
+        if working_ids:
+            # Aloqa, sinov va sotuv - status o'zgarishlari jurnalidan (Lead.updated_at emas)
+            event_counts = KPIService.get_status_event_counts(date_start, next_day_start, working_ids)
+            
+            # Shu kunda berilgan lidlar (created_at o'zgarmaydi)
+            new_leads = list(Lead.objects.filter(
+                created_at__gte=date_start,
+                created_at__lt=next_day_start,
+                assigned_sales_id__in=working_ids
+            ).values_list('id', 'assigned_sales_id', 'created_at'))
+            assigned = {}
+            for _, sales_id, _ in new_leads:
+                assigned[sales_id] = assigned.get(sales_id, 0) + 1
+            
+            due_today = Q(due_date__gte=date_start, due_date__lt=next_day_start)
+            overdue = Q(completed=False, due_date__lt=timezone.now() - timedelta(hours=2))
+            followup_rows = FollowUp.objects.filter(
+                due_today | overdue,
+                sales_id__in=working_ids
+            ).values('sales_id').annotate(
+                planned=Count('id', filter=due_today),
+                completed_count=Count('id', filter=due_today & Q(completed=True)),
+                overdue=Count('id', filter=overdue),
+            )
+            
+            for sales_id in working_ids:
+                counts = event_counts.get(sales_id, {})
+                kpi = values[sales_id]
+                kpi['daily_contacts'] = counts.get('contacts', 0)
+                kpi['trials_registered'] = counts.get('trials_registered', 0)
+                kpi['trials_to_sales'] = counts.get('enrolled', 0)
+                kpi['leads_assigned'] = assigned.get(sales_id, 0)
+                # Kunlik konversiya: shu kunda enrolled bo'lganlar / shu kunda berilgan lidlar
+                kpi['conversion_rate'] = (
+                    kpi['trials_to_sales'] / assigned[sales_id] * 100
+                ) if assigned.get(sales_id) else 0
+            
+            for row in followup_rows:
+                kpi = values[row['sales_id']]
+                kpi['daily_followups'] = row['planned']
+                kpi['followups_completed'] = row['completed_count']
+                kpi['followup_completion_rate'] = (
+                    row['completed_count'] / row['planned'] * 100
+                ) if row['planned'] > 0 else 0
+                kpi['overdue_count'] = row['overdue']
+            
+            # Response time (o'rtacha) - lid yaratilgan vaqt va birinchi status o'zgarishi orasidagi vaqt
+            # Hali javob berilmagan lidlar hisobga olinmaydi
+            first_response = KPIService.get_first_response_times(lead_id for lead_id, _, _ in new_leads)
+            response_times = {}
+            for lead_id, sales_id, created_at in new_leads:
+                if lead_id in first_response:
+                    response_time = (first_response[lead_id] - created_at).total_seconds() / 60
                     if response_time >= 0:
-                        response_times.append(response_time)
-        
-        response_time_minutes = sum(response_times) / len(response_times) if response_times else 0
-        
-        # Overdue soni (faqat shu kundagi overdue'lar, lekin umumiy overdue soni)
-        overdue_count = FollowUpService.get_overdue_followups(sales).count()
-        
-        # KPI yaratish yoki yangilash
-        kpi, created = KPI.objects.update_or_create(
-            sales=sales,
-            date=date,
-            defaults={
-                'daily_contacts': daily_contacts,
-                'daily_followups': daily_followups,
-                'followup_completion_rate': followup_completion_rate,
-                'trials_registered': trials_registered,
-                'trials_to_sales': trials_to_sales,
-                'conversion_rate': conversion_rate,
-                'response_time_minutes': response_time_minutes,
-                'overdue_count': overdue_count,
-            }
-        )
+                        response_times.setdefault(sales_id, []).append(response_time)
+            
+            for sales_id, times in response_times.items():
+                values[sales_id]['response_count'] = len(times)
+                values[sales_id]['response_time_total'] = sum(times)
+                values[sales_id]['response_time_minutes'] = sum(times) / len(times)
         
-        return kpi
+        return sales_users, values
     
     @staticmethod
-    def get_daily_report_stats(sales, date):
+    def reconcile_daily_kpi(date, sales_users=None):
         """
-        Kunlik hisobot uchun barcha ko'rsatkichlar (sotuvchi + sana).
-        Qaytaradi: lid qabul qilindi, task belgilandi, FU bajarildi, aloqa, trial, sotuv,
-        overdue, yangi aloqa qilinmagan, overdue 24+, status bo'yicha lidlar.
+        Yozish vaqtidagi hisoblagichlarni to'liq hisob bilan solishtirib tuzatish
+        Har bir qatorga reconcile_delta (hisoblagichlar farqi yig'indisi) yoziladi.
+        
+        Returns:
+            dict - {'date', 'rows', 'drifted_rows', 'total_delta', 'by_field'}
         """
-        from django.db.models import Count
+        sales_users, values = KPIService.compute_daily_kpi_values(date, sales_users)
+        stored = {
+            row['sales_id']: row
+            for row in KPI.objects.filter(date=date, sales_id__in=list(values)).values(
+                'sales_id', *KPICounters.COUNTER_FIELDS
+            )
+        }
         
-        # Shu kuni sotuvchiga tushgan lidlar
-        leads_received = Lead.objects.filter(
-            assigned_sales=sales,
-            created_at__date=date
-        ).count()
-        
-        # Shu kuni sotuvchi yaratgan follow-up'lar (task belgilangan)
-        tasks_created = FollowUp.objects.filter(
-            sales=sales,
-            created_at__date=date
-        ).count()
-        
-        # Shu kuni bajarilgan follow-up'lar (completed_at yoki due_date shu kun)
-        follow_ups_completed = FollowUp.objects.filter(
-            sales=sales,
-            completed=True,
-            completed_at__date=date
-        ).count()
-        
-        # Shu kunga rejalashtirilgan follow-up'lar soni
-        follow_ups_planned = FollowUp.objects.filter(
-            sales=sales,
-            due_date__date=date
-        ).count()
-        
-        # Aloqa (contacted/interested) - shu kuni yangilangan
-        contacts = Lead.objects.filter(
-            assigned_sales=sales,
-            updated_at__date=date,
-            status__in=['contacted', 'interested']
-        ).count()
-        
-        # Sinovga yozilganlar (shu kun)
-        trials_registered = Lead.objects.filter(
-            assigned_sales=sales,
-            status='trial_registered',
-            updated_at__date=date
-        ).count()
-        
-        # Sotuv (enrolled) - shu kun
-        sales_count = Lead.objects.filter(
-            assigned_sales=sales,
-            status='enrolled',
-            enrolled_at__date=date
-        ).count()
-        
-        # Overdue (umumiy)
-        overdue_count = FollowUpService.get_overdue_followups(sales).count()
-        
-        # Overdue 24+ soat (due_date 24 soatdan oldin o'tgan, hali bajarilmagan)
-        from datetime import timedelta
         now = timezone.now()
-        overdue_24h = FollowUp.objects.filter(
-            sales=sales,
-            completed=False,
-            due_date__lt=now - timedelta(hours=24)
-        ).count()
-        
-        # Bugun tushgan, hali new (aloqa qilinmagan) lidlar
-        new_not_contacted = Lead.objects.filter(
-            assigned_sales=sales,
-            status='new',
-            created_at__date=date
-        ).count()
-        
-        # Status bo'yicha lidlar (joriy pipeline - barcha sotuvchiga biriktirilgan)
-        status_counts = Lead.objects.filter(
-            assigned_sales=sales
-        ).values('status').annotate(count=Count('id'))
-        by_status_raw = {item['status']: item['count'] for item in status_counts}
-        status_order = [
-            'new', 'contacted', 'interested', 'trial_registered',
-            'trial_attended', 'trial_not_attended', 'offer_sent', 'enrolled', 'lost', 'reactivation'
-        ]
-        by_status = {s: by_status_raw.get(s, 0) for s in status_order}
+        extra = {}
+        by_field = dict.fromkeys(KPICounters.COUNTER_FIELDS, 0)
+        for sales_id, kpi_values in values.items():
+            delta = 0
+            for field in KPICounters.COUNTER_FIELDS:
+                field_delta = abs(kpi_values[field] - stored.get(sales_id, {}).get(field, 0))
+                by_field[field] += field_delta
+                delta += field_delta
+            extra[sales_id] = {'reconciled_at': now, 'reconcile_delta': delta}
+        KPIService._save_daily_kpi_values(date, sales_users, values, extra)
+        KPIRollups.rebuild(date)
         
         return {
-            'leads_received': leads_received,
-            'tasks_created': tasks_created,
-            'follow_ups_completed': follow_ups_completed,
-            'follow_ups_planned': follow_ups_planned,
-            'contacts': contacts,
-            'trials_registered': trials_registered,
-            'sales_count': sales_count,
-            'overdue_count': overdue_count,
-            'overdue_24h': overdue_24h,
-            'new_not_contacted': new_not_contacted,
-            'by_status': by_status,
+            'date': date,
+            'rows': len(values),
+            'drifted_rows': sum(1 for row in extra.values() if row['reconcile_delta']),
+            'total_delta': sum(row['reconcile_delta'] for row in extra.values()),
+            'by_field': {field: delta for field, delta in by_field.items() if delta},
+        }
+    
+    @staticmethod
+    def get_live_kpi(sales, date=None):
+        """
+        Hisoblagichlardan KPI o'qish (qayta hisoblamasdan)
+        overdue_count - joriy holat, OverdueMatrix dan olinadi.
+        """
+        date = date or timezone.localdate()
+        kpi = KPI.objects.filter(sales=sales, date=date).first() or KPI(sales=sales, date=date)
+        if date == timezone.localdate():
+            kpi.overdue_count = OverdueMatrix.current().overdue_count(sales)
+        return kpi
+    
+    @staticmethod
+    def get_live_kpis(date=None, sales_users=None):
+        """Barcha sotuvchilar uchun get_live_kpi - bitta so'rov; {sales_id: KPI}"""
+        date = date or timezone.localdate()
+        if sales_users is None:
+            sales_users = User.objects.filter(role='sales', is_active_sales=True)
+        sales_users = list(sales_users)
+        stored = {
+            kpi.sales_id: kpi
+            for kpi in KPI.objects.filter(date=date, sales_id__in=[sales.id for sales in sales_users])
         }
+        overdue_matrix = OverdueMatrix.current() if date == timezone.localdate() else None
+        kpis = {}
+        for sales in sales_users:
+            kpi = stored.get(sales.id) or KPI(sales_id=sales.id, date=date)
+            kpi.sales = sales
+            if overdue_matrix:
+                kpi.overdue_count = overdue_matrix.overdue_count(sales)
+            kpis[sales.id] = kpi
+        return kpis
+    
+    @staticmethod
+    def is_kpi_stale(kpi, today=None):
+        """
+        KPI qatori eskirganmi: o'tgan kunlar qatori kun tugagandan keyin to'liq hisob bilan
+        tekshirilmagan bo'lsa (bugungi qator hisoblagichlar orqali jonli yangilanadi)
+        """
+        today = today or timezone.localdate()
+        if kpi.date >= today:
+            return False
+        return kpi.reconciled_at is None or timezone.localtime(kpi.reconciled_at).date() <= kpi.date
+    
+    @staticmethod
+    def get_kpi_history(sales, days, today=None):
+        """
+        Oxirgi N kunlik KPI qatorlari - bitta so'rov, hisoblash yo'q
+        Qatori yo'q kunlar 'pending', eskirganlari 'stale' (oxirgi qiymati bilan) bo'ladi va
+        recompute_kpi_task ga (sotuvchi, sana) bo'yicha bir marta navbatga qo'yiladi.
+        
+        Returns:
+            list: [{'date': date, 'kpi': KPI yoki None, 'pending': bool, 'stale': bool}, ...] (yangi kundan eskiga)
+        """
+        from .kpi_backfill import schedule_recompute
+        
+        today = today or timezone.localdate()
+        dates = [today - timedelta(days=i) for i in range(days)]
+        kpis = {kpi.date: kpi for kpi in KPI.objects.filter(sales=sales, date__gte=dates[-1], date__lte=today)}
+        
+        history = [
+            {
+                'date': date,
+                'kpi': kpis.get(date),
+                'pending': date not in kpis,
+                'stale': date in kpis and KPIService.is_kpi_stale(kpis[date], today),
+            }
+            for date in dates
+        ]
+        outdated = [day['date'] for day in history if day['pending'] or day['stale']]
+        if outdated:
+            schedule_recompute(sales, outdated)
+        return history
+    
+    @staticmethod
+    def get_reconcile_status(sales=None):
+        """
+        Oxirgi tungi tekshiruv natijasi (hisoblagichlarga ishonch uchun)
+        Returns: {'date', 'reconciled_at', 'delta', 'rows'} yoki None
+        """
+        from django.db.models import Sum, Max, Count
+        
+        queryset = KPI.objects.filter(reconciled_at__isnull=False)
+        if sales is not None:
+            queryset = queryset.filter(sales=sales)
+        last_date = queryset.aggregate(last=Max('date'))['last']
+        if last_date is None:
+            return None
+        result = queryset.filter(date=last_date).aggregate(
+            delta=Sum('reconcile_delta'),
+            reconciled_at=Max('reconciled_at'),
+            rows=Count('id'),
+        )
+        return {'date': last_date, **result}
+    
+    @staticmethod
+    def get_daily_report_stats(sales, date):
+        """
+        Kunlik hisobot uchun barcha ko'rsatkichlar (sotuvchi + sana).
+        Qaytaradi: lid qabul qilindi, task belgilandi, FU bajarildi, aloqa, trial, sotuv,
+        overdue, yangi aloqa qilinmagan, overdue 24+, status bo'yicha lidlar.
+        """
+        return DailyReport.collect(date, [sales.id])[sales.id]
     
     @staticmethod
     def build_daily_report_message(date=None):
@@ -872,67 +3108,12 @@ class KPIService:
         date bo'lmasa bugungi sana ishlatiladi.
         Qaytaradi: str (HTML formatda xabar).
         """
-        if date is None:
-            date = timezone.now().date()
-        sales_users = User.objects.filter(role='sales', is_active_sales=True)
-        totals = {
-            'leads_received': 0,
-            'tasks_created': 0,
-            'follow_ups_completed': 0,
-            'follow_ups_planned': 0,
-            'contacts': 0,
-            'trials': 0,
-            'sales': 0,
-            'overdue': 0,
-            'overdue_24h': 0,
-            'new_not_contacted': 0,
-        }
-        per_sales_lines = []
-        for sales in sales_users:
-            KPIService.calculate_daily_kpi(sales, date)
-            st = KPIService.get_daily_report_stats(sales, date)
-            totals['leads_received'] += st['leads_received']
-            totals['tasks_created'] += st['tasks_created']
-            totals['follow_ups_completed'] += st['follow_ups_completed']
-            totals['follow_ups_planned'] += st['follow_ups_planned']
-            totals['contacts'] += st['contacts']
-            totals['trials'] += st['trials_registered']
-            totals['sales'] += st['sales_count']
-            totals['overdue'] += st['overdue_count']
-            totals['overdue_24h'] += st['overdue_24h']
-            totals['new_not_contacted'] += st['new_not_contacted']
-            line1 = (
-                f"• <b>{sales.username}</b>\n"
-                f"  Yangi lidlar: {st['leads_received']} | Vazifa: {st['tasks_created']} | "
-                f"Qayta aloqa: {st['follow_ups_completed']}/{st['follow_ups_planned']} | "
-                f"Aloqa qilindi: {st['contacts']} | Sinovga yoz.: {st['trials_registered']} | "
-                f"Kursga yoz.: {st['sales_count']} | Muddati o'tgan: {st['overdue_count']}"
-            )
-            if st['new_not_contacted'] > 0 or st['overdue_24h'] > 0:
-                line1 += f"\n  ⚠️ Yangi aloqa qilinmagan: {st['new_not_contacted']} | 24 soatdan ortiq kechikkan: {st['overdue_24h']}"
-            per_sales_lines.append(line1)
-            bs = st['by_status']
-            status_line = (
-                f"  Lidlar holati: yangi {bs['new']}, aloqa qilindi {bs['contacted']}, qiziqmoqda {bs['interested']}, "
-                f"sinovga yoz. {bs['trial_registered']}, kursga yoz. {bs['enrolled']}, yo'qotilgan {bs['lost']}"
-            )
-            per_sales_lines.append(status_line)
-        header = f"📊 <b>Kunlik sotuv hisobot</b> ({date.strftime('%d.%m.%Y')})"
-        totals_line = (
-            f"Jami: Yangi lidlar {totals['leads_received']} | Vazifa {totals['tasks_created']} | "
-            f"Qayta aloqa {totals['follow_ups_completed']}/{totals['follow_ups_planned']} | "
-            f"Aloqa {totals['contacts']} | Sinov {totals['trials']} | Kursga yoz. {totals['sales']} | "
-            f"Muddati o'tgan {totals['overdue']}"
-        )
-        if totals['new_not_contacted'] > 0 or totals['overdue_24h'] > 0:
-            totals_line += f"\n⚠️ Yangi aloqa qilinmagan: {totals['new_not_contacted']} | 24 soatdan ortiq kechikkan: {totals['overdue_24h']}"
-        body = "\n".join(per_sales_lines) if per_sales_lines else "Ma'lumot topilmadi."
-        return f"{header}\n{totals_line}\n\n{body}"
+        return DailyReport(date).render()
     
     @staticmethod
     def get_sales_ranking(sales, period='month', metric='conversion_rate'):
         """
-        Sotuvchi reytingini hisoblash
+        Sotuvchi reytingini hisoblash (keshlangan Leaderboard dan)
         
         Args:
             sales: Sotuvchi
@@ -950,112 +3131,7 @@ class KPIService:
                 'worst': float
             }
         """
-        from datetime import datetime, timedelta
-        from django.db.models import Avg, Max, Min
-        
-        today = timezone.now().date()
-        
-        # Period bo'yicha sana oralig'ini aniqlash
-        if period == 'day':
-            start_date = today
-            end_date = today
-        elif period == 'week':
-            start_date = today - timedelta(days=7)
-            end_date = today
-        elif period == 'month':
-            start_date = datetime(today.year, today.month, 1).date()
-            end_date = today
-        else:
-            start_date = today - timedelta(days=30)
-            end_date = today
-        
-        # Barcha faol sotuvchilar
-        all_sales = User.objects.filter(role='sales', is_active_sales=True)
-        
-        # Har bir sotuvchi uchun ko'rsatkichni hisoblash
-        sales_metrics = []
-        for s in all_sales:
-            if period == 'day':
-                kpi = KPI.objects.filter(sales=s, date=start_date).first()
-                if not kpi:
-                    kpi = KPIService.calculate_daily_kpi(s, start_date)
-            else:
-                # Period uchun o'rtacha yoki yig'indi
-                kpis = KPI.objects.filter(sales=s, date__gte=start_date, date__lte=end_date)
-                if not kpis.exists():
-                    # Agar KPI'lar yo'q bo'lsa, hisoblaymiz
-                    current_date = start_date
-                    while current_date <= end_date:
-                        KPIService.calculate_daily_kpi(s, current_date)
-                        current_date += timedelta(days=1)
-                    kpis = KPI.objects.filter(sales=s, date__gte=start_date, date__lte=end_date)
-                
-                if metric == 'conversion_rate':
-                    value = kpis.aggregate(avg=Avg('conversion_rate'))['avg'] or 0
-                elif metric == 'daily_contacts':
-                    value = kpis.aggregate(avg=Avg('daily_contacts'))['avg'] or 0
-                elif metric == 'trials_to_sales':
-                    value = kpis.aggregate(avg=Avg('trials_to_sales'))['avg'] or 0
-                elif metric == 'followup_completion_rate':
-                    value = kpis.aggregate(avg=Avg('followup_completion_rate'))['avg'] or 0
-                else:
-                    value = 0
-                
-                sales_metrics.append({'sales': s, 'value': value})
-                continue
-            
-            # Kunlik KPI uchun
-            if metric == 'conversion_rate':
-                value = kpi.conversion_rate
-            elif metric == 'daily_contacts':
-                value = kpi.daily_contacts
-            elif metric == 'trials_to_sales':
-                value = kpi.trials_to_sales
-            elif metric == 'followup_completion_rate':
-                value = kpi.followup_completion_rate
-            else:
-                value = 0
-            
-            sales_metrics.append({'sales': s, 'value': value})
-        
-        # Qiymat bo'yicha tartiblash (tushuvchi tartibda)
-        sales_metrics.sort(key=lambda x: x['value'], reverse=True)
-        
-        # Sotuvchi o'rni
-        rank = 1
-        current_sales_value = None
-        for idx, item in enumerate(sales_metrics):
-            if item['sales'].id == sales.id:
-                rank = idx + 1
-                current_sales_value = item['value']
-                break
-        
-        # O'rtacha, eng yaxshi, eng yomon
-        if sales_metrics:
-            values = [item['value'] for item in sales_metrics]
-            average = sum(values) / len(values) if values else 0
-            best = max(values) if values else 0
-            worst = min(values) if values else 0
-        else:
-            average = best = worst = 0
-        
-        # Position
-        if rank <= len(sales_metrics) * 0.33:
-            position = 'top'
-        elif rank <= len(sales_metrics) * 0.67:
-            position = 'middle'
-        else:
-            position = 'bottom'
-        
-        return {
-            'rank': rank,
-            'total_sales': len(sales_metrics),
-            'position': position,
-            'value': current_sales_value or 0,
-            'average': average,
-            'best': best,
-            'worst': worst
-        }
+        return Leaderboard.get(period, metric).ranking(sales)
     
     @staticmethod
     def get_trend_comparison(sales, days=7, metric='daily_contacts'):
@@ -1080,15 +3156,17 @@ class KPIService:
         today = timezone.now().date()
         previous_date = today - timedelta(days=days)
         
-        # Joriy kunlik KPI
-        current_kpi = KPI.objects.filter(sales=sales, date=today).first()
-        if not current_kpi:
-            current_kpi = KPIService.calculate_daily_kpi(sales, today)
+        # Joriy va oldingi kunlik KPI - hisoblanmagan kun nol sifatida olinadi, yo'q yoki eskirgan kunlar
+        # qayta hisoblashga navbatga qo'yiladi
+        from .kpi_backfill import schedule_recompute
         
-        # Oldingi kunlik KPI
-        previous_kpi = KPI.objects.filter(sales=sales, date=previous_date).first()
-        if not previous_kpi:
-            previous_kpi = KPIService.calculate_daily_kpi(sales, previous_date)
+        kpis = {kpi.date: kpi for kpi in KPI.objects.filter(sales=sales, date__in=[today, previous_date])}
+        missing = [date for date in (today, previous_date) if date not in kpis]
+        stale = [date for date, kpi in kpis.items() if KPIService.is_kpi_stale(kpi, today)]
+        if missing or stale:
+            schedule_recompute(sales, missing + stale)
+        current_kpi = kpis.get(today) or KPI(sales=sales, date=today)
+        previous_kpi = kpis.get(previous_date) or KPI(sales=sales, date=previous_date)
         
         # Ko'rsatkichlarni olish
         if metric == 'daily_contacts':
@@ -1126,7 +3204,9 @@ class KPIService:
             'current': current_value,
             'previous': previous_value,
             'change': change,
-            'trend': trend
+            'trend': trend,
+            'pending': bool(missing),
+            'stale': bool(stale),
         }
     
     @staticmethod
@@ -1146,136 +3226,31 @@ class KPIService:
                 'worst': dict,  # Eng yomon ko'rsatkichlar
             }
         """
-        from datetime import datetime, timedelta
-        from django.db.models import Avg, Max, Min
-        
-        today = timezone.now().date()
-        
-        # Period bo'yicha sana oralig'ini aniqlash
-        if period == 'day':
-            start_date = today
-            end_date = today
-        elif period == 'week':
-            start_date = today - timedelta(days=7)
-            end_date = today
-        elif period == 'month':
-            start_date = datetime(today.year, today.month, 1).date()
-            end_date = today
-        else:
-            start_date = today - timedelta(days=30)
-            end_date = today
-        
-        # Barcha faol sotuvchilar
-        all_sales = User.objects.filter(role='sales', is_active_sales=True)
-        
-        # Sotuvchi KPI'lari
-        if period == 'day':
-            sales_kpi = KPI.objects.filter(sales=sales, date=start_date).first()
-            if not sales_kpi:
-                sales_kpi = KPIService.calculate_daily_kpi(sales, start_date)
-        else:
-            sales_kpis = KPI.objects.filter(sales=sales, date__gte=start_date, date__lte=end_date)
-            if not sales_kpis.exists():
-                current_date = start_date
-                while current_date <= end_date:
-                    KPIService.calculate_daily_kpi(sales, current_date)
-                    current_date += timedelta(days=1)
-                sales_kpis = KPI.objects.filter(sales=sales, date__gte=start_date, date__lte=end_date)
-            
-            sales_kpi = {
-                'daily_contacts': sales_kpis.aggregate(avg=Avg('daily_contacts'))['avg'] or 0,
-                'conversion_rate': sales_kpis.aggregate(avg=Avg('conversion_rate'))['avg'] or 0,
-                'trials_to_sales': sales_kpis.aggregate(avg=Avg('trials_to_sales'))['avg'] or 0,
-                'followup_completion_rate': sales_kpis.aggregate(avg=Avg('followup_completion_rate'))['avg'] or 0,
-            }
+        metrics = {
+            'daily_contacts': 'avg_contacts',
+            'conversion_rate': 'avg_conversion_rate',
+            'trials_to_sales': 'avg_trials_to_sales',
+            'followup_completion_rate': 'avg_completion_rate',
+        }
         
-        # Barcha sotuvchilar uchun KPI'larni olish
-        all_kpis = []
-        for s in all_sales:
-            if period == 'day':
-                kpi = KPI.objects.filter(sales=s, date=start_date).first()
-                if not kpi:
-                    kpi = KPIService.calculate_daily_kpi(s, start_date)
-                all_kpis.append(kpi)
-            else:
-                kpis = KPI.objects.filter(sales=s, date__gte=start_date, date__lte=end_date)
-                if not kpis.exists():
-                    current_date = start_date
-                    while current_date <= end_date:
-                        KPIService.calculate_daily_kpi(s, current_date)
-                        current_date += timedelta(days=1)
-                    kpis = KPI.objects.filter(sales=s, date__gte=start_date, date__lte=end_date)
-                all_kpis.append(kpis)
-        
-        # O'rtacha, eng yaxshi, eng yomon
-        if period == 'day':
-            average = {
-                'daily_contacts': sum(kpi.daily_contacts for kpi in all_kpis) / len(all_kpis) if all_kpis else 0,
-                'conversion_rate': sum(kpi.conversion_rate for kpi in all_kpis) / len(all_kpis) if all_kpis else 0,
-                'trials_to_sales': sum(kpi.trials_to_sales for kpi in all_kpis) / len(all_kpis) if all_kpis else 0,
-                'followup_completion_rate': sum(kpi.followup_completion_rate for kpi in all_kpis) / len(all_kpis) if all_kpis else 0,
-            }
-            best = {
-                'daily_contacts': max((kpi.daily_contacts for kpi in all_kpis), default=0),
-                'conversion_rate': max((kpi.conversion_rate for kpi in all_kpis), default=0),
-                'trials_to_sales': max((kpi.trials_to_sales for kpi in all_kpis), default=0),
-                'followup_completion_rate': max((kpi.followup_completion_rate for kpi in all_kpis), default=0),
-            }
-            worst = {
-                'daily_contacts': min((kpi.daily_contacts for kpi in all_kpis), default=0),
-                'conversion_rate': min((kpi.conversion_rate for kpi in all_kpis), default=0),
-                'trials_to_sales': min((kpi.trials_to_sales for kpi in all_kpis), default=0),
-                'followup_completion_rate': min((kpi.followup_completion_rate for kpi in all_kpis), default=0),
-            }
-        else:
-            # Period uchun o'rtacha
-            all_contacts = []
-            all_conversions = []
-            all_trials = []
-            all_completions = []
-            
-            for kpis in all_kpis:
-                if hasattr(kpis, 'aggregate'):
-                    all_contacts.append(kpis.aggregate(avg=Avg('daily_contacts'))['avg'] or 0)
-                    all_conversions.append(kpis.aggregate(avg=Avg('conversion_rate'))['avg'] or 0)
-                    all_trials.append(kpis.aggregate(avg=Avg('trials_to_sales'))['avg'] or 0)
-                    all_completions.append(kpis.aggregate(avg=Avg('followup_completion_rate'))['avg'] or 0)
-            
-            average = {
-                'daily_contacts': sum(all_contacts) / len(all_contacts) if all_contacts else 0,
-                'conversion_rate': sum(all_conversions) / len(all_conversions) if all_conversions else 0,
-                'trials_to_sales': sum(all_trials) / len(all_trials) if all_trials else 0,
-                'followup_completion_rate': sum(all_completions) / len(all_completions) if all_completions else 0,
-            }
-            best = {
-                'daily_contacts': max(all_contacts) if all_contacts else 0,
-                'conversion_rate': max(all_conversions) if all_conversions else 0,
-                'trials_to_sales': max(all_trials) if all_trials else 0,
-                'followup_completion_rate': max(all_completions) if all_completions else 0,
-            }
-            worst = {
-                'daily_contacts': min(all_contacts) if all_contacts else 0,
-                'conversion_rate': min(all_conversions) if all_conversions else 0,
-                'trials_to_sales': min(all_trials) if all_trials else 0,
-                'followup_completion_rate': min(all_completions) if all_completions else 0,
-            }
+        # Barcha faol sotuvchilar - bitta o'qish (oy uchun KPIMonthly)
+        sales_ids = list(User.objects.filter(role='sales', is_active_sales=True).values_list('id', flat=True))
+        summaries = KPIRollups.get_period_summaries(period, sales_ids=sales_ids + [sales.id])
+        empty = KPIRollups.summarize(None)
         
-        # Sotuvchi ko'rsatkichlari
-        if period == 'day':
-            sales_value = {
-                'daily_contacts': sales_kpi.daily_contacts,
-                'conversion_rate': sales_kpi.conversion_rate,
-                'trials_to_sales': sales_kpi.trials_to_sales,
-                'followup_completion_rate': sales_kpi.followup_completion_rate,
-            }
-        else:
-            sales_value = sales_kpi
+        def values_for(sales_id):
+            summary = summaries.get(sales_id, empty)
+            return {metric: summary[key] for metric, key in metrics.items()}
         
+        all_values = [values_for(sales_id) for sales_id in sales_ids]
         return {
-            'sales_value': sales_value,
-            'average': average,
-            'best': best,
-            'worst': worst
+            'sales_value': values_for(sales.id),
+            'average': {
+                metric: sum(values[metric] for values in all_values) / len(all_values) if all_values else 0
+                for metric in metrics
+            },
+            'best': {metric: max((values[metric] for values in all_values), default=0) for metric in metrics},
+            'worst': {metric: min((values[metric] for values in all_values), default=0) for metric in metrics},
         }
     
     @staticmethod
@@ -1290,40 +3265,9 @@ class KPIService:
         Returns:
             dict: Haftalik yig'indilar va o'rtachalar
         """
-        from datetime import timedelta
-        
-        week_end_date = week_start_date + timedelta(days=6)
-        
-        kpis = KPI.objects.filter(
-            sales=sales,
-            date__gte=week_start_date,
-            date__lte=week_end_date
-        )
-        
-        # Agar KPI'lar yo'q bo'lsa, hisoblaymiz
-        if not kpis.exists():
-            current_date = week_start_date
-            while current_date <= week_end_date:
-                KPIService.calculate_daily_kpi(sales, current_date)
-                current_date += timedelta(days=1)
-            kpis = KPI.objects.filter(
-                sales=sales,
-                date__gte=week_start_date,
-                date__lte=week_end_date
-            )
-        
-        from django.db.models import Sum, Avg
-        
-        return {
-            'total_contacts': kpis.aggregate(sum=Sum('daily_contacts'))['sum'] or 0,
-            'total_followups': kpis.aggregate(sum=Sum('daily_followups'))['sum'] or 0,
-            'avg_completion_rate': kpis.aggregate(avg=Avg('followup_completion_rate'))['avg'] or 0,
-            'total_trials': kpis.aggregate(sum=Sum('trials_registered'))['sum'] or 0,
-            'total_sales': kpis.aggregate(sum=Sum('trials_to_sales'))['sum'] or 0,
-            'avg_conversion_rate': kpis.aggregate(avg=Avg('conversion_rate'))['avg'] or 0,
-            'avg_response_time': kpis.aggregate(avg=Avg('response_time_minutes'))['avg'] or 0,
-            'avg_overdue': kpis.aggregate(avg=Avg('overdue_count'))['avg'] or 0,
-        }
+        # Dushanbadan boshlangan hafta - bitta KPIWeekly qatori; boshqa kunlar - ikki hafta chekkalari
+        totals = KPIRollups.get_range_totals(week_start_date, week_start_date + timedelta(days=6), [sales.id])
+        return KPIRollups.summarize(totals.get(sales.id))
     
     @staticmethod
     def get_accurate_conversion_rate(sales, start_date, end_date):
@@ -1343,20 +3287,12 @@ class KPIService:
                 'by_status': dict  # Status bo'yicha taqsimot
             }
         """
-        # Berilgan lidlar
-        total_assigned = Lead.objects.filter(
-            assigned_sales=sales,
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
-        ).count()
-        
-        # Enrolled lidlar
-        enrolled = Lead.objects.filter(
-            assigned_sales=sales,
-            status='enrolled',
-            enrolled_at__date__gte=start_date,
-            enrolled_at__date__lte=end_date
-        ).count()
+        # Berilgan va enrolled lidlar - haftalik/oylik KPI yig'indilaridan (leads_assigned, trials_to_sales)
+        summary = KPIRollups.summarize(
+            KPIRollups.get_range_totals(start_date, end_date, [sales.id]).get(sales.id)
+        )
+        total_assigned = summary['total_assigned']
+        enrolled = summary['total_sales']
         
         # Status bo'yicha taqsimot
         from django.db.models import Count
@@ -1379,37 +3315,19 @@ class KPIService:
     
     @staticmethod
     def calculate_monthly_conversion_rate(sales, year, month):
-        """Oylik konversiya hisoblash: oy davomida enrolled bo'lganlar / oy davomida berilgan lidlar"""
-        from datetime import datetime
-        from calendar import monthrange
-        
-        # Oyning birinchi va oxirgi kuni
-        month_start = datetime(year, month, 1).date()
-        last_day = monthrange(year, month)[1]
-        month_end = datetime(year, month, last_day).date()
-        
-        # Oy davomida berilgan barcha lidlar
-        total_assigned_monthly = Lead.objects.filter(
-            assigned_sales=sales,
-            created_at__date__gte=month_start,
-            created_at__date__lte=month_end
-        ).count()
-        
-        # Oy davomida enrolled bo'lgan lidlar
-        enrolled_monthly = Lead.objects.filter(
-            assigned_sales=sales,
-            status='enrolled',
-            enrolled_at__date__gte=month_start,
-            enrolled_at__date__lte=month_end
-        ).count()
-        
-        # Oylik konversiya
-        monthly_conversion_rate = (enrolled_monthly / total_assigned_monthly * 100) if total_assigned_monthly > 0 else 0
+        """
+        Oylik konversiya hisoblash: oy davomidagi sotuvlar / oy davomida berilgan lidlar
+        KPIMonthly yig'indisidan o'qiladi.
+        """
+        from datetime import date
         
+        summary = KPIRollups.summarize(
+            KPIMonthly.objects.filter(sales=sales, period_start=date(year, month, 1)).first()
+        )
         return {
-            'total_assigned': total_assigned_monthly,
-            'enrolled': enrolled_monthly,
-            'conversion_rate': monthly_conversion_rate
+            'total_assigned': summary['total_assigned'],
+            'enrolled': summary['total_sales'],
+            'conversion_rate': summary['conversion_rate']
         }
 
 
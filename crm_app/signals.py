@@ -1,33 +1,84 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
-from datetime import timedelta
-from .models import Lead, FollowUp, TrialLesson, KPI, LeaveRequest
+from .models import Lead, FollowUp, TrialLesson, KPI, LeaveRequest, LeadStatusEvent, User
+from .deferred_writes import current_batch
 from .tasks import (
     send_new_lead_notification,
     send_status_change_notification,
     send_followup_created_notification,
-    create_next_contacted_followup,
 )
 
 
-@receiver(pre_save, sender=Lead)
-def store_old_status(sender, instance, **kwargs):
-    """Status o'zgarishini aniqlash uchun eski statusni saqlash"""
-    if instance.pk:
-        try:
-            old_instance = Lead.objects.get(pk=instance.pk)
-            instance._old_status = old_instance.status
-        except Lead.DoesNotExist:
-            instance._old_status = None
-    else:
-        instance._old_status = None
+@receiver(post_save, sender=Lead)
+def defer_lead_side_effects(sender, instance, created, **kwargs):
+    """deferred_side_effects() ichida - hodisani eski qiymatlar bilan navbatga qo'yish"""
+    batch = current_batch()
+    if batch is not None:
+        batch.lead_saved(
+            instance,
+            created,
+            '' if created else instance.old_value('status'),
+            None if created else instance.old_value('assigned_sales')
+        )
+
+
+@receiver(post_save, sender=Lead)
+def update_sales_load_counters(sender, instance, created, **kwargs):
+    """
+    Sotuvchining bugungi yangi lidlari hisoblagichi (SalesLoadCounters)
+    deferred_side_effects() ichida ham darhol yangilanadi - keyingi lidlar uni ko'radi.
+    create_followup_on_status_change dan oldin ulanadi.
+    """
+    from .services import SalesLoadCounters
+    
+    SalesLoadCounters.lead_changed(
+        instance,
+        created,
+        '' if created else instance.old_value('status'),
+        None if created else instance.old_value('assigned_sales')
+    )
+
+
+@receiver(post_save, sender=Lead)
+def record_status_event(sender, instance, created, **kwargs):
+    """Status o'zgarishini LeadStatusEvent jurnaliga yozish"""
+    if current_batch() is not None:
+        return  # deferred_side_effects() - flush'da bajariladi
+    # Eski qiymat FieldTrackerMixin nusxasidan (save() tugaguncha yangilanmaydi)
+    old_status = '' if created else instance.old_value('status')
+    if old_status is None or old_status == instance.status:
+        return
+    from .services import KPICounters
+    
+    event = LeadStatusEvent.objects.create(
+        lead=instance,
+        from_status=old_status,
+        to_status=instance.status,
+        sales_id=instance.assigned_sales_id
+    )
+    KPICounters.status_changed(event, instance)
+
+
+@receiver(post_save, sender=Lead)
+def update_assignment_kpi(sender, instance, created, **kwargs):
+    """Lid biriktirilishi o'zgarganda KPI hisoblagichini yangilash"""
+    from .services import KPICounters
+    
+    if current_batch() is not None:
+        return  # deferred_side_effects() - flush'da bajariladi
+    
+    old_sales_id = None if created else instance.old_value('assigned_sales')
+    KPICounters.lead_assignment_changed(instance, old_sales_id)
 
 
 @receiver(post_save, sender=Lead)
 def create_followup_on_status_change(sender, instance, created, **kwargs):
     """Avtomatik follow-up yaratish status o'zgarishi bilan"""
-    from .services import FollowUpService
+    from .services import FollowUpService, FollowUpSequence, SalesLoadCounters
+    
+    if current_batch() is not None:
+        return  # deferred_side_effects() - flush'da bajariladi
     
     if created:
         # Yangi lid - dinamik delay (15-30 daqiqa, lidlar soniga qarab)
@@ -35,89 +86,26 @@ def create_followup_on_status_change(sender, instance, created, **kwargs):
         if instance.assigned_sales:
             base_time = timezone.now()
             
-            # Sotuvchining hozirgi follow-up yukini hisoblash (keyingi 24 soatda)
-            current_followups = FollowUp.objects.filter(
-                sales=instance.assigned_sales,
-                completed=False,
-                due_date__lte=timezone.now() + timedelta(hours=24)
-            ).count()
+            # Bugungi yangi lidlar (shu lid bilan) va follow-up yuki - cache hisoblagichlaridan, O(1)
+            today_new_leads, current_followups = SalesLoadCounters.get(instance.assigned_sales_id)
             
-            # Bugungi yangi lidlar sonini hisoblash
-            today_new_leads = Lead.objects.filter(
-                assigned_sales=instance.assigned_sales,
-                created_at__date=timezone.now().date(),
-                status='new'
-            ).count()
-            
-            # Dinamik delay: 15-30 daqiqa orasida
-            # Agar bugun ko'p yangi lidlar bo'lsa, delay oshadi
-            if today_new_leads <= 5:
-                # Oddiy holat: 15 daqiqa
-                delay_minutes = 15
-            elif today_new_leads <= 10:
-                # O'rtacha: 20 daqiqa
-                delay_minutes = 20
-            elif today_new_leads <= 20:
-                # Ko'p: 25 daqiqa
-                delay_minutes = 25
-            else:
-                # Juda ko'p: 30 daqiqa (maksimum)
-                delay_minutes = 30
-            
-            # Agar sotuvchining hozirgi follow-up yuki ko'p bo'lsa, delay'ni yanada oshirish
-            if current_followups > 20:
-                delay_minutes = min(30, delay_minutes + 5)
-            elif current_followups > 10:
-                delay_minutes = min(30, delay_minutes + 3)
-            
-            delay = timedelta(minutes=delay_minutes)
-            
-            # Ish vaqtiga moslashtirish
+            # Dinamik delay (15-30 daqiqa) va ish vaqtiga moslashtirish
             due_date = FollowUpService.calculate_work_hours_due_date(
-                instance.assigned_sales, 
-                base_time, 
-                delay
+                instance.assigned_sales,
+                base_time,
+                FollowUpService.new_lead_delay(today_new_leads, current_followups)
             )
             
-            # Batch import uchun vaqt bo'yicha tarqatish
-            # Agar bugun ko'p yangi lidlar bo'lsa, ularni vaqt bo'yicha tarqatish
-            if today_new_leads > 10:
-                # Har bir lid uchun 5 daqiqa oraliq qo'shish
-                additional_delay = (today_new_leads - 10) * 5
-                delay_minutes = min(30, delay_minutes + additional_delay)
-                delay = timedelta(minutes=delay_minutes)
-                due_date = FollowUpService.calculate_work_hours_due_date(
-                    instance.assigned_sales, 
-                    base_time, 
-                    delay
-                )
-            
-            # Yaxshiroq tekshiruv - notes va due_date bo'yicha
-            # 1. Notes bo'yicha tekshirish
-            existing_by_notes = FollowUp.objects.filter(
-                lead=instance,
-                notes__contains="Yangi lid - darhol aloqa qilish kerak",
-                completed=False
-            ).exists()
-            
-            # 2. Due_date bo'yicha tekshirish (xuddi shu kundagi follow-up)
-            existing_by_date = FollowUp.objects.filter(
-                lead=instance,
-                due_date__date=due_date.date(),
-                notes__contains="Yangi lid",
-                completed=False
-            ).exists()
-            
-            # 3. Agar notes yoki due_date bo'yicha allaqachon bor bo'lsa, yaratmaymiz
-            if existing_by_notes or existing_by_date:
-                return  # Agar allaqachon bor bo'lsa, yaratmaymiz
-            
-            followup = FollowUp.objects.create(
-                lead=instance,
-                sales=instance.assigned_sales,
-                due_date=due_date,
-                notes=f"Yangi lid - darhol aloqa qilish kerak (yuklanish: {current_followups} follow-up, bugungi yangi: {today_new_leads})"
+            # Ochiq 'new_lead' follow-up allaqachon bo'lsa, unique indeks rad etadi (None)
+            followup = FollowUpService.create_once(
+                instance,
+                'new_lead',
+                instance.assigned_sales,
+                due_date,
+                FollowUpService.NEW_LEAD_NOTES.format(current_followups=current_followups, today_new_leads=today_new_leads)
             )
+            if not followup:
+                return  # Agar allaqachon bor bo'lsa, yaratmaymiz
             # Telegram xabarlar
             # Notification faqat bir marta yuborilishi kerak
             # Agar distribute_leads ichida yuborilgan bo'lsa, bu yerda yubormaslik
@@ -133,247 +121,21 @@ def create_followup_on_status_change(sender, instance, created, **kwargs):
             return
         
         # Status o'zgarganda notification yuborish
-        old_status = getattr(instance, '_old_status', None)
+        old_status = instance.old_value('status')
         if old_status and old_status != instance.status:
             send_status_change_notification.delay(instance.id, old_status, instance.status)
         
-        # Contacted status uchun ketma-ket follow-up yaratish
-        if instance.status == 'contacted':
-            # Allaqachon "Contacted" follow-up'lar borligini tekshirish
-            # Yaxshiroq tekshiruv - notes va followup_sequence bo'yicha
-            existing_contacted = FollowUp.objects.filter(
-                lead=instance,
-                notes__contains="Contacted - 24 soatdan keyin aloqa",
-                followup_sequence=1,
-                completed=False
-            ).exists()
-            
-            if existing_contacted:
-                return  # Agar allaqachon bor bo'lsa, yaratmaymiz
-            
-            base_time = timezone.now()
-            first_delay = timedelta(hours=24)
-            
-            # Birinchi follow-up'ni darhol yaratamiz
-            first_due_date = FollowUpService.calculate_work_hours_due_date(
-                instance.assigned_sales,
-                base_time,
-                first_delay
-            )
-            
-            # Yana bir bor tekshirish - due_date bo'yicha ham
-            existing_by_date = FollowUp.objects.filter(
-                lead=instance,
-                notes__contains="Contacted - 24 soatdan keyin aloqa",
-                due_date__date=first_due_date.date(),
-                completed=False
-            ).exists()
-            
-            if existing_by_date:
-                return  # Agar xuddi shu kundagi follow-up bor bo'lsa, yaratmaymiz
-            
-            first_followup = FollowUp.objects.create(
-                lead=instance,
-                sales=instance.assigned_sales,
-                due_date=first_due_date,
-                notes="Contacted - 24 soatdan keyin aloqa (ko'proq ma'lumot, kurs narxi, jadval, guruhlar)",
-                followup_sequence=1
-            )
-            send_followup_created_notification.delay(first_followup.id)
-            
-            # Keyingi follow-up'larni ketma-ket yaratish uchun task
-            # 2-followup: 3 kun (72 soat)
-            create_next_contacted_followup.delay(
-                lead_id=instance.id,
-                sequence=2,
-                delay_hours=72,
-                base_time=base_time.isoformat()
-            )
-            
-            # 3-followup: 7 kun (168 soat)
-            create_next_contacted_followup.delay(
-                lead_id=instance.id,
-                sequence=3,
-                delay_hours=168,
-                base_time=base_time.isoformat()
-            )
-        
-        # Interested status uchun ko'p bosqichli follow-up
-        elif instance.status == 'interested':
-            delays = [
-                timedelta(days=1),   # 1-kun: qo'shimcha ma'lumot
-                timedelta(days=3),   # 3-kun: guruhlar bandligi haqida xabar
-                timedelta(days=5),   # 5-kun: oxirgi joylar haqida eslatma
-                timedelta(days=7),   # 7-kun: "qaror qilishga yordam berish" qo'ng'irog'i
-            ]
-            base_time = timezone.now()
-            notes_map = {
-                1: "Qo'shimcha ma'lumot",
-                3: "Guruhlar bandligi haqida xabar",
-                5: "Oxirgi joylar haqida eslatma",
-                7: "Qaror qilishga yordam berish",
-            }
-            
-            for delay in delays:
-                days = delay.days
-                
-                # Avval due_date ni hisoblash
-                due_date = FollowUpService.calculate_work_hours_due_date(
-                    instance.assigned_sales,
-                    base_time,
-                    delay
-                )
-                
-                # Yaxshiroq tekshiruv - notes, due_date va completed bo'yicha
-                # 1. Notes bo'yicha tekshirish
-                existing_by_notes = FollowUp.objects.filter(
-                    lead=instance,
-                    notes__contains=f"Interested - {days} kundan keyin",
-                    completed=False
-                ).exists()
-                
-                # 2. Due_date bo'yicha tekshirish (xuddi shu kundagi follow-up)
-                existing_by_date = FollowUp.objects.filter(
-                    lead=instance,
-                    due_date__date=due_date.date(),
-                    notes__contains="Interested",
-                    completed=False
-                ).exists()
-                
-                # 3. Agar notes yoki due_date bo'yicha allaqachon bor bo'lsa, yaratmaymiz
-                if existing_by_notes or existing_by_date:
-                    continue  # Agar allaqachon bor bo'lsa, yaratmaymiz
-                
-                followup = FollowUp.objects.create(
-                    lead=instance,
-                    sales=instance.assigned_sales,
-                    due_date=due_date,
-                    notes=f"Interested - {days} kundan keyin: {notes_map.get(days, 'Follow-up')}"
-                )
-                send_followup_created_notification.delay(followup.id)
-        
-        # Trial Registered uchun 1 kun va 2 soat oldin eslatma
-        elif instance.status == 'trial_registered':
-            # Sinov sanasini topish
-            trial = instance.trials.filter(result__in=['', 'attended', 'not_attended']).order_by('date', 'time').first()
-            if trial:
-                trial_datetime = timezone.make_aware(
-                    timezone.datetime.combine(trial.date, trial.time)
-                )
-                now = timezone.now()
-                
-                # 1 kun oldin eslatma
-                one_day_before = trial_datetime - timedelta(days=1)
-                if one_day_before > now:
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        instance.assigned_sales,
-                        one_day_before,
-                        timedelta(0)
-                    )
-                    # Follow-up allaqachon yaratilganligini tekshirish (trial ID bilan)
-                    existing = FollowUp.objects.filter(
-                        lead=instance,
-                        notes__contains=f"Sinovdan 1 kun oldin",
-                        completed=False
-                    ).exists()
-                    if not existing:
-                        followup = FollowUp.objects.create(
-                            lead=instance,
-                            sales=instance.assigned_sales,
-                            due_date=due_date,
-                            notes=f"Sinovdan 1 kun oldin eslatma (Trial ID: {trial.id})"
-                        )
-                        send_followup_created_notification.delay(followup.id)
-                
-                # 2 soat oldin eslatma + lokatsiya
-                two_hours_before = trial_datetime - timedelta(hours=2)
-                if two_hours_before > now:
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        instance.assigned_sales,
-                        two_hours_before,
-                        timedelta(0)
-                    )
-                    existing = FollowUp.objects.filter(
-                        lead=instance,
-                        notes__contains=f"Sinovdan 2 soat oldin",
-                        completed=False
-                    ).exists()
-                    if not existing:
-                        followup = FollowUp.objects.create(
-                            lead=instance,
-                            sales=instance.assigned_sales,
-                            due_date=due_date,
-                            notes=f"Sinovdan 2 soat oldin eslatma + lokatsiya (Trial ID: {trial.id})"
-                        )
-                        send_followup_created_notification.delay(followup.id)
+        # Status bo'yicha follow-up ketma-ketligi (FollowUpSequence): contacted, interested,
+        # trial_registered (1 kun / 2 soat oldin eslatma), trial_not_attended - bitta bulk INSERT
+        # Faqat status o'zgarganda (boshqa maydonlarni tahrirlash ketma-ketlikni qayta rejalashtirmaydi)
+        if instance.has_changed('status'):
+            FollowUpSequence.materialize(instance)
         
         # Trial Attended - follow-up yaratmaymiz (offline taklif beriladi)
         # Lekin agar 24 soatdan keyin enrolled bo'lmagan bo'lsa, follow-up yaratamiz
-        # Bu Celery task orqali tekshiriladi (check_trial_attended_not_enrolled_task)
-        
-        # Trial Not Attended uchun follow-up
-        elif instance.status == 'trial_not_attended':
-            delays = [
-                timedelta(minutes=30),  # 30 daqiqa
-                timedelta(hours=24),    # 24 soat
-                timedelta(days=3),      # 3-kun
-            ]
-            base_time = timezone.now()
-            notes_map = {
-                timedelta(minutes=30): "Sinovga kelmadi - 30 daqiqadan keyin qayta yozish",
-                timedelta(hours=24): "Sinovga kelmadi - 24 soatdan keyin qayta taklif",
-                timedelta(days=3): "Sinovga kelmadi - 3 kundan keyin uzr va qayta imkon taklifi",
-            }
-            
-            for delay in delays:
-                # Har bir delay uchun alohida tekshirish
-                delay_key = None
-                if delay == timedelta(minutes=30):
-                    delay_key = "30 daqiqadan keyin"
-                elif delay == timedelta(hours=24):
-                    delay_key = "24 soatdan keyin"
-                elif delay == timedelta(days=3):
-                    delay_key = "3 kundan keyin"
-                
-                if delay_key:
-                    # Avval due_date ni hisoblash
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        instance.assigned_sales,
-                        base_time,
-                        delay
-                    )
-                    
-                    # Yaxshiroq tekshiruv - notes va due_date bo'yicha
-                    # 1. Notes bo'yicha tekshirish
-                    existing_by_notes = FollowUp.objects.filter(
-                        lead=instance,
-                        notes__contains=delay_key,
-                        completed=False
-                    ).exists()
-                    
-                    # 2. Due_date bo'yicha tekshirish (xuddi shu kundagi follow-up)
-                    existing_by_date = FollowUp.objects.filter(
-                        lead=instance,
-                        due_date__date=due_date.date(),
-                        notes__contains="Sinovga kelmadi",
-                        completed=False
-                    ).exists()
-                    
-                    # 3. Agar notes yoki due_date bo'yicha allaqachon bor bo'lsa, yaratmaymiz
-                    if existing_by_notes or existing_by_date:
-                        continue  # Agar allaqachon bor bo'lsa, yaratmaymiz
-                    
-                    followup = FollowUp.objects.create(
-                        lead=instance,
-                        sales=instance.assigned_sales,
-                        due_date=due_date,
-                        notes=notes_map.get(delay, f"Sinovga kelmadi - {delay}")
-                    )
-                    send_followup_created_notification.delay(followup.id)
+        # Bu ScheduledAction orqali tekshiriladi (trial_followup_* amallari)
         
         # Lost uchun reactivation (mavjud ReactivationService orqali boshqariladi)
-        elif instance.status == 'lost':
-            pass  # ReactivationService orqali boshqariladi
 
 
 @receiver(post_save, sender=TrialLesson)
@@ -382,14 +144,18 @@ def create_followup_after_trial(sender, instance, created, **kwargs):
     Sinovdan keyin follow-up yaratish
     Eslatma: Trial Attended bo'lganda offline taklif beriladi,
     shuning uchun 3 daqiqada follow-up yaratmaymiz.
-    Agar 24 soatdan keyin enrolled bo'lmagan bo'lsa, 
-    check_trial_attended_not_enrolled_task orqali follow-up yaratiladi.
-    Sinov darsi tugagandan keyin (90 minutdan keyin) follow-up 
-    create_followup_after_trial_end_task orqali yaratiladi.
+    Follow-up'lar ScheduledAction orqali vaqti kelganda yaratiladi:
+    - sinov darsi tugagandan keyin (90 minutdan keyin), natija kiritilmagan bo'lsa
+    - sinovga kelgan, lekin enrolled bo'lmagan lid uchun 1/3/7/14-kunlarda
     """
-    # Trial Attended uchun follow-up yaratmaymiz (offline taklif)
-    # Sinov darsi tugagandan keyin follow-up create_followup_after_trial_end_task orqali yaratiladi
-    pass
+    from .services import ScheduledActionService, FollowUpSequence
+    
+    ScheduledActionService.schedule_for_trial(instance)
+    
+    # Lid allaqachon trial_registered (yangi sinovga qayta yozildi) - status o'zgarmaydi,
+    # shuning uchun eslatmalar shu yerda ochiladi
+    if created and instance.lead.status == 'trial_registered':
+        FollowUpSequence.materialize(instance.lead)
 
 
 @receiver(pre_save, sender=FollowUp)
@@ -399,6 +165,50 @@ def check_overdue(sender, instance, **kwargs):
         instance.is_overdue = True
 
 
+@receiver(post_save, sender=FollowUp)
+def update_followup_kpi(sender, instance, created, **kwargs):
+    """Follow-up yaratilishi/bajarilishi/ko'chirilishi - KPI hisoblagichlari"""
+    from .services import KPICounters
+    
+    # Eski holat FieldTrackerMixin nusxasidan (qo'shimcha SELECT siz)
+    old_state = None
+    if not created:
+        old_sales_id, old_due_date = instance.old_value('sales'), instance.old_value('due_date')
+        if old_sales_id and old_due_date:
+            old_state = (old_sales_id, KPICounters.local_date(old_due_date), bool(instance.old_value('completed')))
+    change = (old_state, KPICounters.followup_state(instance))
+    batch = current_batch()
+    if batch is not None:
+        batch.followup_changed(*change)
+        return
+    KPICounters.followups_changed([change])
+
+
+@receiver(post_delete, sender=FollowUp)
+def remove_followup_kpi(sender, instance, origin=None, **kwargs):
+    """O'chirilgan follow-up'ni KPI hisoblagichlaridan ayirish"""
+    from .services import KPICounters
+    
+    # Cascade o'chirishda (sotuvchi/lid o'chirilganda) tungi reconcile tuzatadi
+    if origin is not None and origin is not instance:
+        return
+    KPICounters.followups_changed([(KPICounters.followup_state(instance), None)])
+
+
+@receiver(post_save, sender=FollowUp)
+def schedule_followup_reminder(sender, instance, created, **kwargs):
+    """Follow-up eslatmasini due_date vaqtiga rejalashtirish"""
+    from .services import ScheduledActionService
+    
+    if instance.completed or instance.reminder_sent or not instance.sales_id or not instance.due_date:
+        return
+    batch = current_batch()
+    if batch is not None:
+        batch.followup_reminder(instance.id, instance.due_date)
+        return
+    ScheduledActionService.schedule('followup_reminder', instance.id, instance.due_date)
+
+
 # @receiver(post_save, sender=FollowUp)
 # def notify_followup_created(sender, instance, created, **kwargs):
 #     """Follow-up yaratilganda notification (agar boshqa joyda yaratilmagan bo'lsa)"""
@@ -433,3 +243,25 @@ def handle_leave_request_status_change(sender, instance, created, **kwargs):
     # Ruxsat tugagandan keyin is_on_leave ni o'chirish
     # Bu Celery task orqali tekshiriladi (check_expired_leaves_task)
 
+
+@receiver(post_save, sender=LeaveRequest)
+@receiver(post_delete, sender=LeaveRequest)
+def invalidate_work_calendar(sender, instance, **kwargs):
+    """Ruxsat o'zgarganda sotuvchining ish kalendarini qayta qurish"""
+    from .services import WorkCalendar
+    
+    WorkCalendar.invalidate(instance.sales_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_leaderboard(sender, instance, **kwargs):
+    """Sotuvchilar tarkibi o'zgarganda reyting keshini yangilash"""
+    from .services import Leaderboard
+    
+    # Login (last_login) kabi qisman saqlashlar tarkibni o'zgartirmaydi
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and not {'role', 'is_active_sales'} & set(update_fields):
+        return
+    if instance.role == 'sales':
+        Leaderboard.invalidate()
@@ -1,10 +1,94 @@
 from celery import shared_task
 from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
 from datetime import timedelta
+from html import escape
 from .models import Lead, FollowUp, TrialLesson, Reactivation, Offer, User
-from .services import FollowUpService, KPIService, ReactivationService, OfferService
-from .telegram_bot import send_telegram_notification
+from .services import (
+    FollowUpService, KPIService, ReactivationService, OfferService, AvailabilitySnapshot,
+    OverdueMatrix, NotificationLedgerService, ScheduledActionService, KPICounters, DailyReport, LatencyStats
+)
+from .telegram_bot import send_telegram_notification, TelegramDigest
+
+
+# Digest qator shablonlari (avvalgi bitta-obyekt xabarlari formati)
+
+def format_overdue_followup_line(followup):
+    """Overdue follow-up qatori"""
+    due_date_str = followup.due_date.strftime('%d.%m.%Y %H:%M')
+    note = f"\n📝 {escape(followup.notes[:100])}" if followup.notes else ""
+    return (
+        f"👤 {escape(followup.lead.name)} | 📞 {followup.lead.phone}\n"
+        f"⏰ Reja: {due_date_str}"
+        f"{note}"
+    )
+
+
+def format_followup_reminder_line(followup, now):
+    """Aloqa vaqti kelgan follow-up qatori"""
+    due_date_str = followup.due_date.strftime('%d.%m.%Y %H:%M')
+    
+    # Qancha vaqt o'tganini hisoblash
+    minutes_passed = int((now - followup.due_date).total_seconds() / 60)
+    if minutes_passed < 60:
+        time_str = f"{minutes_passed} daqiqa oldin"
+    else:
+        time_str = f"{minutes_passed // 60} soat {minutes_passed % 60} daqiqa oldin"
+    
+    note = f"\n📝 {escape(followup.notes[:100])}" if followup.notes else ""
+    return (
+        f"👤 {escape(followup.lead.name)} | 📞 {followup.lead.phone}\n"
+        f"⏰ Reja: {due_date_str}\n"
+        f"⏱️ {time_str}"
+        f"{note}"
+    )
+
+
+def format_new_lead_line(lead, followup=None):
+    """Yangi lid qatori (digest uchun)"""
+    course = escape(lead.interested_course.name) if lead.interested_course else "Kurs tanlanmagan"
+    due_part = f"\n⏰ Follow-up: {timezone.localtime(followup.due_date).strftime('%H:%M')}" if followup else ""
+    return (
+        f"👤 {escape(lead.name)} | 📞 {lead.phone}\n"
+        f"📚 {course} | 📊 {lead.get_source_display()}"
+        f"{due_part}"
+    )
+
+
+def format_trial_reminder_line(trial, now):
+    """Yaqinlashayotgan sinov qatori"""
+    trial_datetime = timezone.make_aware(timezone.datetime.combine(trial.date, trial.time))
+    hours_left = int((trial_datetime - now).total_seconds() / 3600)
+    minutes_left = int(((trial_datetime - now).total_seconds() % 3600) / 60)
+    time_str = f"{hours_left} soat {minutes_left} daqiqa" if hours_left > 0 else f"{minutes_left} daqiqa"
+    
+    return (
+        f"👤 {escape(trial.lead.name)} | 📞 {trial.lead.phone}\n"
+        f"📆 {trial.date.strftime('%d.%m.%Y')} 🕐 {trial.time.strftime('%H:%M')}\n"
+        f"⏱️ Qolgan vaqt: {time_str}\n"
+        f"👥 Guruh: {escape(trial.group.name) if trial.group else 'N/A'} | 🏢 Xona: {escape(trial.room.name) if trial.room else 'N/A'}"
+    )
+
+
+def format_post_trial_reminder_message(trial, now):
+    """Sinovdan keyingi sotuv taklifi eslatmasi"""
+    # Sinovdan keyin necha vaqt o'tganini hisoblash
+    trial_datetime = timezone.make_aware(
+        timezone.datetime.combine(trial.date, trial.time)
+    )
+    hours_since = int((now - trial_datetime).total_seconds() / 3600)
+    
+    return (
+        f"💰 <b>SOTUV TAKLIFI ESLATMASI</b>\n"
+        f"{'=' * 25}\n\n"
+        f"👤 <b>Lid:</b> {trial.lead.name}\n"
+        f"📞 <b>Telefon:</b> <code>{trial.lead.phone}</code>\n\n"
+        f"📅 <b>Sinov sanasi:</b> {trial.date.strftime('%d.%m.%Y')} {trial.time.strftime('%H:%M')}\n"
+        f"📚 <b>Kurs:</b> {trial.lead.interested_course.name if trial.lead.interested_course else 'N/A'}\n"
+        f"⏱️ <b>Sinovdan keyin:</b> {hours_since} soat o'tdi\n\n"
+        f"⚠️ <b>Sotuv taklifi berish vaqt keldi!</b>"
+    )
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60)
@@ -49,57 +133,57 @@ def check_overdue_followups_task(self):
     """Overdue follow-uplarni tekshirish va notification yuborish"""
     try:
         print(f"[{timezone.now()}] check_overdue_followups_task ishga tushdi")
-        overdue_followups = FollowUpService.get_overdue_followups().select_related('lead', 'sales')
+        # Overdue flag'ni o'rnatish - bitta UPDATE
+        flagged_count = FollowUpService.flag_overdue()
+        
+        # Sotuvchilarga xabar - faqat Telegram chat ID si bor sotuvchilarning follow-up'lari
+        overdue_followups = list(FollowUpService.get_overdue_followups().filter(
+            sales__telegram_chat_id__isnull=False
+        ).exclude(sales__telegram_chat_id='').select_related(None).select_related('lead', 'sales'))
         
-        # Har bir sotuvchi uchun overdue sonini hisoblash
-        sales_overdue_count = {}
-        notifications_sent = 0
+        # Yaqinda xabar qilinganlarni o'tkazib yuborish (NotificationLedger)
+        allowed = NotificationLedgerService.filter_due(
+            'overdue_followup',
+            [(followup.id, followup.sales.telegram_chat_id) for followup in overdue_followups]
+        )
         
+        # Har bir sotuvchiga bitta digest xabar
+        digest = TelegramDigest("⚠️ OVERDUE FOLLOW-UP", footer="🔴 Darhol qo'ng'iroq qiling", ledger_kind='overdue_followup')
         for followup in overdue_followups:
-            # Overdue flag'ni o'rnatish
-            if not followup.is_overdue:
-                followup.is_overdue = True
-                followup.save()
-            
-            # Sotuvchiga xabar (faqat birinchi marta)
-            if followup.sales and followup.sales.telegram_chat_id:
-                due_date_str = followup.due_date.strftime('%d.%m.%Y %H:%M')
-                note = f"📝 {followup.notes[:100]}" if followup.notes else ""
-                message = (
-                    f"⚠️ OVERDUE FOLLOW-UP\n"
-                    f"👤 {followup.lead.name} | 📞 {followup.lead.phone}\n"
-                    f"⏰ Reja: {due_date_str}\n"
-                    f"{note}\n"
-                    f"🔴 Darhol qo'ng'iroq qiling"
-                )
-                
-                if send_telegram_notification(
-                    followup.sales.telegram_chat_id,
-                    message
-                ):
-                    notifications_sent += 1
-            
-            # Sotuvchi uchun overdue sonini hisoblash
-            if followup.sales:
-                sales_id = followup.sales.id
-                if sales_id not in sales_overdue_count:
-                    sales_overdue_count[sales_id] = {
-                        'sales': followup.sales,
-                        'count': 0
-                    }
-                sales_overdue_count[sales_id]['count'] += 1
+            key = (followup.id, followup.sales.telegram_chat_id)
+            if key in allowed:
+                digest.add(followup.sales.telegram_chat_id, format_overdue_followup_line(followup), key)
+        
+        # Jurnal xabarlar bilan bir tranzaksiyada - sender xatolikda uni bekor qila olishi uchun
+        with transaction.atomic():
+            sent_keys = digest.send()
+            NotificationLedgerService.record('overdue_followup', sent_keys)
+        notifications_sent = len(sent_keys)
         
-        # Manager/Admin ga xabar (5+ overdue bo'lsa)
+        # Manager/Admin ga xabar (5+ overdue bo'lsa) - sonlar bitta agregat so'rovdan,
+        # har bir sotuvchi uchun NotificationLedger oralig'ida bir marta
         if settings.TELEGRAM_ADMIN_CHAT_ID:
-            for sales_id, data in sales_overdue_count.items():
-                if data['count'] >= 5:
-                    send_telegram_notification(
+            escalations = {
+                row['sales_id']: row for row in OverdueMatrix().rows.values()
+                if row['sales_id'] and row['total'] >= 5
+            }
+            allowed = NotificationLedgerService.filter_due('overdue_manager', [
+                (sales_id, settings.TELEGRAM_ADMIN_CHAT_ID) for sales_id in escalations
+            ])
+            manager_keys = []
+            with transaction.atomic():
+                for key in sorted(allowed):
+                    row = escalations[key[0]]
+                    if send_telegram_notification(
                         settings.TELEGRAM_ADMIN_CHAT_ID,
-                        f"⚠️ Sotuvchi {data['sales'].username} da {data['count']} ta overdue follow-up bor!\n"
-                        f"Darhol tekshirish kerak."
-                    )
+                        f"⚠️ Sotuvchi {row['sales__username']} da {row['total']} ta overdue follow-up bor!\n"
+                        f"Darhol tekshirish kerak.",
+                        receipt=('overdue_manager', [key[0]])
+                    ):
+                        manager_keys.append(key)
+                NotificationLedgerService.record('overdue_manager', manager_keys)
         
-        print(f"[{timezone.now()}] check_overdue_followups_task yakunlandi: {notifications_sent} ta notification yuborildi")
+        print(f"[{timezone.now()}] check_overdue_followups_task yakunlandi: {flagged_count} ta overdue belgilandi, {notifications_sent} ta notification yuborildi")
     except Exception as e:
         print(f"[{timezone.now()}] check_overdue_followups_task xatolik: {e}")
         import traceback
@@ -115,22 +199,18 @@ def auto_reschedule_overdue_followups_task(self):
         print(f"[{timezone.now()}] auto_reschedule_overdue_followups_task ishga tushdi")
         from .services import FollowUpService
         
-        # Grace period o'tgan overdue'larni olish
-        overdue = FollowUpService.get_overdue_followups()
-        
-        # Faqat 1-6 soat overdue bo'lganlarni avtomatik reschedule qilish
+        # Faqat 1-6 soat overdue bo'lganlarni avtomatik reschedule qilish (grace period o'tganlar orasidan)
         now = timezone.now()
-        auto_reschedule_count = 0
+        overdue = FollowUpService.get_overdue_followups().filter(
+            due_date__gte=now - timedelta(hours=6),
+            due_date__lte=now - timedelta(hours=1)
+        )
         
-        for followup in overdue:
-            hours_overdue = (now - followup.due_date).total_seconds() / 3600
-            
-            # 1-6 soat overdue bo'lsa, avtomatik reschedule
-            if 1 <= hours_overdue <= 6:
-                # Keyingi ish vaqtiga o'tkazish (2 soatdan keyin)
-                if FollowUpService.auto_reschedule_overdue(followup, hours_ahead=2):
-                    auto_reschedule_count += 1
-                    print(f"Auto-rescheduled follow-up {followup.id} (overdue: {hours_overdue:.1f} hours)")
+        # Keyingi ish vaqtiga o'tkazish (2 soatdan keyin) - barcha vaqtlar bitta o'tishda hisoblanadi
+        auto_reschedule_count = FollowUpService.auto_reschedule_overdue_bulk(
+            overdue.select_related(None).only('id', 'sales', 'due_date', 'completed', 'is_overdue'),
+            hours_ahead=2
+        )
         
         print(f"[{timezone.now()}] auto_reschedule_overdue_followups_task yakunlandi: {auto_reschedule_count} ta follow-up qayta rejalashtirildi")
         return auto_reschedule_count
@@ -158,7 +238,15 @@ def send_trial_reminder_task(self):
             lead__status__in=['trial_registered', 'trial_attended']  # Faqat sinovga yozilganlar
         ).select_related('lead', 'lead__assigned_sales', 'group', 'room')
         
-        notifications_sent = 0
+        # Yuborilmagan eslatmalar (NotificationLedger - bitta so'rov)
+        trials = list(trials)
+        allowed = NotificationLedgerService.filter_due('trial_reminder', [
+            (trial.id, trial.lead.assigned_sales.telegram_chat_id)
+            for trial in trials
+            if trial.lead.assigned_sales and trial.lead.assigned_sales.telegram_chat_id
+        ])
+        
+        digest = TelegramDigest("🔔 Sinov eslatmasi", footer="💡 Sinovdan oldin bog'laning", ledger_kind='trial_reminder')
         for trial in trials:
             # Timezone aware datetime yaratish
             trial_datetime = timezone.make_aware(
@@ -167,30 +255,18 @@ def send_trial_reminder_task(self):
             
             # Agar sinov 2 soat ichida bo'lsa, eslatma yuborish
             if now <= trial_datetime <= two_hours_later:
-                # Telegram xabar yuborish
-                if trial.lead.assigned_sales and trial.lead.assigned_sales.telegram_chat_id:
-                    hours_left = int((trial_datetime - now).total_seconds() / 3600)
-                    minutes_left = int(((trial_datetime - now).total_seconds() % 3600) / 60)
-                    
-                    time_str = f"{hours_left} soat {minutes_left} daqiqa" if hours_left > 0 else f"{minutes_left} daqiqa"
-                    
-                    message = (
-                        f"🔔 Sinov eslatmasi\n"
-                        f"👤 {trial.lead.name} | 📞 {trial.lead.phone}\n"
-                        f"📆 {trial.date.strftime('%d.%m.%Y')} 🕐 {trial.time.strftime('%H:%M')}\n"
-                        f"⏱️ Qolgan vaqt: {time_str}\n"
-                        f"👥 Guruh: {trial.group.name if trial.group else 'N/A'} | 🏢 Xona: {trial.room.name if trial.room else 'N/A'}\n"
-                        f"💡 Sinovdan oldin bog'laning"
-                    )
-                    
-                    if send_telegram_notification(
-                        trial.lead.assigned_sales.telegram_chat_id,
-                        message
-                    ):
-                        notifications_sent += 1
+                key = (trial.id, trial.lead.assigned_sales.telegram_chat_id) if trial.lead.assigned_sales else None
+                if key in allowed:
+                    digest.add(trial.lead.assigned_sales.telegram_chat_id, format_trial_reminder_line(trial, now), key)
                 trial.reminder_sent = True
                 trial.save()
         
+        # Har bir sotuvchiga bitta digest xabar
+        with transaction.atomic():
+            sent_keys = digest.send()
+            NotificationLedgerService.record('trial_reminder', sent_keys)
+        notifications_sent = len(sent_keys)
+        
         print(f"[{timezone.now()}] send_trial_reminder_task yakunlandi: {notifications_sent} ta notification yuborildi")
     except Exception as e:
         print(f"[{timezone.now()}] send_trial_reminder_task xatolik: {e}")
@@ -200,212 +276,29 @@ def send_trial_reminder_task(self):
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=300)
-def send_followup_reminders_task(self):
-    """Follow-up eslatmalari yuborish - aloqa qilish kerak vaqtda (ish vaqtlarini tekshirish bilan)"""
-    try:
-        print(f"[{timezone.now()}] send_followup_reminders_task ishga tushdi")
-        now = timezone.now()
-        
-        # Bugun bajarilishi kerak bo'lgan follow-up'lar
-        today = now.date()
-        tomorrow = today + timedelta(days=1)
-        
-        # Bugun va ertaga bajarilishi kerak bo'lgan follow-up'lar
-        upcoming_followups = FollowUp.objects.filter(
-            due_date__date__gte=today,
-            due_date__date__lt=tomorrow,
-            completed=False,
-            reminder_sent=False,
-            sales__isnull=False
-        ).select_related('lead', 'sales')
-        
-        notifications_sent = 0
-        for followup in upcoming_followups:
-            # Aloqa qilish kerak vaqt
-            due_datetime = followup.due_date
-            
-            # Agar hozirgi vaqt due_date ga yetgan bo'lsa va ish vaqtida bo'lsa
-            if now >= due_datetime:
-                # Sotuvchi ish vaqtida ekanligini tekshirish
-                if followup.sales.is_available_for_leads:
-                    if followup.sales and followup.sales.telegram_chat_id:
-                        due_date_str = followup.due_date.strftime('%d.%m.%Y %H:%M')
-                        
-                        # Qancha vaqt o'tganini hisoblash
-                        time_passed = now - due_datetime
-                        minutes_passed = int(time_passed.total_seconds() / 60)
-                        
-                        if minutes_passed < 60:
-                            time_str = f"{minutes_passed} daqiqa oldin"
-                        else:
-                            hours = minutes_passed // 60
-                            mins = minutes_passed % 60
-                            time_str = f"{hours} soat {mins} daqiqa oldin"
-                        
-                        note = f"📝 {followup.notes[:100]}" if followup.notes else ""
-                        message = (
-                            f"📞 Aloqa vaqti keldi\n"
-                            f"👤 {followup.lead.name} | 📞 {followup.lead.phone}\n"
-                            f"⏰ Reja: {due_date_str}\n"
-                            f"⏱️ {time_str}\n"
-                            f"{note}\n"
-                            f"🔴 Darhol qo'ng'iroq qiling"
-                        )
-                        
-                        if send_telegram_notification(
-                            followup.sales.telegram_chat_id,
-                            message
-                        ):
-                            followup.reminder_sent = True
-                            followup.save()
-                            notifications_sent += 1
-                else:
-                    # Agar ish vaqti tashqarisida bo'lsa, keyingi ish vaqtida eslatma yuborish
-                    next_work_time = FollowUpService.calculate_work_hours_due_date(
-                        followup.sales,
-                        now,
-                        timedelta(0)  # Keyingi ish vaqti
-                    )
-                    # Agar keyingi ish vaqti aniq bo'lsa va hali eslatma yuborilmagan bo'lsa
-                    if next_work_time > now and not followup.reminder_sent:
-                        # Keyingi ish vaqtida eslatma yuborish uchun task yaratish
-                        send_followup_reminder_at_time.delay(
-                            followup.id,
-                            next_work_time.isoformat()
-                        )
-        
-        print(f"[{timezone.now()}] send_followup_reminders_task yakunlandi: {notifications_sent} ta notification yuborildi")
-    except Exception as e:
-        print(f"[{timezone.now()}] send_followup_reminders_task xatolik: {e}")
-        import traceback
-        traceback.print_exc()
-        raise self.retry(exc=e, countdown=300)
-
-
-@shared_task
-def send_followup_reminder_at_time(followup_id, reminder_time_iso):
+def calculate_daily_kpi_task(self):
     """
-    Belgilangan vaqtda follow-up eslatmasi yuborish
+    Kunlik KPI tekshiruvi (reconcile)
+    KPI qatorlari yozish vaqtida KPICounters orqali yangilanadi; bu task kecha va bugun uchun
+    to'liq hisob bilan hisoblagichlarni tuzatadi va farqni (reconcile_delta) yozadi.
+    Shu kunlar uchun o'tish vaqtlari gistogrammalari (LatencyStats) ham qayta yoziladi.
     """
-    try:
-        from datetime import datetime
-        
-        followup = FollowUp.objects.get(id=followup_id)
-        if followup.completed or followup.reminder_sent:
-            return
-        
-        reminder_time = datetime.fromisoformat(reminder_time_iso)
-        if timezone.is_naive(reminder_time):
-            reminder_time = timezone.make_aware(reminder_time)
-        
-        now = timezone.now()
-        
-        # Agar vaqt kelgan bo'lsa va sotuvchi ish vaqtida bo'lsa
-        if now >= reminder_time and followup.sales.is_available_for_leads:
-            if followup.sales and followup.sales.telegram_chat_id:
-                due_date_str = followup.due_date.strftime('%d.%m.%Y %H:%M')
-                
-                message = (
-                    f"📞 <b>ALOQA QILISH VAQTI!</b>\n"
-                    f"{'=' * 25}\n\n"
-                    f"👤 <b>Lid:</b> {followup.lead.name}\n"
-                    f"📞 <b>Telefon:</b> <code>{followup.lead.phone}</code>\n\n"
-                    f"⏰ <b>Rejalashtirilgan vaqt:</b> {due_date_str}\n\n"
-                )
-                
-                if followup.notes:
-                    message += f"📝 <b>Eslatma:</b>\n{followup.notes[:100]}\n\n"
-                
-                message += "🔴 <b>DARHOL ALOQA QILING!</b>"
-                
-                if send_telegram_notification(followup.sales.telegram_chat_id,message):
-                    followup.reminder_sent = True
-                    followup.save()
-    except FollowUp.DoesNotExist:
-        pass
-    except Exception as e:
-        print(f"send_followup_reminder_at_time xatolik (followup_id={followup_id}): {e}")
-        import traceback
-        traceback.print_exc()
-
-
-@shared_task(bind=True, max_retries=3, default_retry_delay=300)
-def send_post_trial_sales_reminder_task(self):
-    """Sinovdan keyin sotuv taklifi eslatmasi"""
-    try:
-        print(f"[{timezone.now()}] send_post_trial_sales_reminder_task ishga tushdi")
-        # Sinovdan keyin 3 daqiqada follow-up yaratiladi, lekin alohida eslatma ham yuboramiz
-        # Sinovga keldi va natija 'attended' bo'lgan, lekin hali 'enrolled' bo'lmagan lidlar
-        now = timezone.now()
-        today = now.date()
-        yesterday = today - timedelta(days=1)
-        
-        # Kechagi va bugungi sinovlar (faqat 'attended' natijali)
-        recent_trials = TrialLesson.objects.filter(
-            date__gte=yesterday,
-            result='attended',
-            sales_reminder_sent=False,
-            lead__status__in=['trial_attended', 'interested', 'contacted']  # Faqat sinovga kelgan, lekin hali yozilmagan
-        ).select_related('lead', 'lead__assigned_sales', 'lead__interested_course')
-        
-        notifications_sent = 0
-        for trial in recent_trials:
-            # Agar lid hali 'enrolled' bo'lmagan bo'lsa
-            if trial.lead.status != 'enrolled' and trial.lead.assigned_sales:
-                if trial.lead.assigned_sales.telegram_chat_id:
-                    # Sinovdan keyin necha vaqt o'tganini hisoblash
-                    trial_datetime = timezone.make_aware(
-                        timezone.datetime.combine(trial.date, trial.time)
-                    )
-                    time_since_trial = now - trial_datetime
-                    hours_since = int(time_since_trial.total_seconds() / 3600)
-                    
-                    message = (
-                        f"💰 <b>SOTUV TAKLIFI ESLATMASI</b>\n"
-                        f"{'=' * 25}\n\n"
-                        f"👤 <b>Lid:</b> {trial.lead.name}\n"
-                        f"📞 <b>Telefon:</b> <code>{trial.lead.phone}</code>\n\n"
-                        f"📅 <b>Sinov sanasi:</b> {trial.date.strftime('%d.%m.%Y')} {trial.time.strftime('%H:%M')}\n"
-                        f"📚 <b>Kurs:</b> {trial.lead.interested_course.name if trial.lead.interested_course else 'N/A'}\n"
-                        f"⏱️ <b>Sinovdan keyin:</b> {hours_since} soat o'tdi\n\n"
-                        f"⚠️ <b>Sotuv taklifi berish vaqt keldi!</b>"
-                    )
-                    
-                    if send_telegram_notification(
-                        trial.lead.assigned_sales.telegram_chat_id,
-                        message
-                    ):
-                        notifications_sent += 1
-                trial.sales_reminder_sent = True
-                trial.save()
-        
-        print(f"[{timezone.now()}] send_post_trial_sales_reminder_task yakunlandi: {notifications_sent} ta notification yuborildi")
-    except Exception as e:
-        print(f"[{timezone.now()}] send_post_trial_sales_reminder_task xatolik: {e}")
-        import traceback
-        traceback.print_exc()
-        raise self.retry(exc=e, countdown=300)
-
-
-@shared_task(bind=True, max_retries=3, default_retry_delay=300)
-def calculate_daily_kpi_task(self):
-    """Kunlik KPI hisoblash"""
     try:
         print(f"[{timezone.now()}] calculate_daily_kpi_task ishga tushdi")
-        from .models import User
-        
-        today = timezone.now().date()
-        sales_users = User.objects.filter(role='sales', is_active_sales=True)
-        
+        today = timezone.localdate()
         calculated_count = 0
-        for sales in sales_users:
-            try:
-                KPIService.calculate_daily_kpi(sales, today)
-                calculated_count += 1
-            except Exception as e:
-                print(f"KPI hisoblashda xatolik ({sales.username}): {e}")
+        for date in (today - timedelta(days=1), today):
+            report = KPIService.reconcile_daily_kpi(date)
+            calculated_count += report['rows']
+            print(
+                f"[{timezone.now()}] KPI tekshiruvi {date}: {report['rows']} ta qator, "
+                f"{report['drifted_rows']} tasida farq, jami farq {report['total_delta']} {report['by_field'] or ''}"
+            )
+            # O'tish vaqtlari gistogrammalari (faqat shu kunning hodisalari o'qiladi)
+            histogram_rows = LatencyStats.rebuild_day(date)
+            print(f"[{timezone.now()}] Vaqt gistogrammalari {date}: {histogram_rows} ta qator")
         
-        print(f"[{timezone.now()}] calculate_daily_kpi_task yakunlandi: {calculated_count} ta sotuvchi uchun KPI hisoblandi")
+        print(f"[{timezone.now()}] calculate_daily_kpi_task yakunlandi: {calculated_count} ta KPI qatori tekshirildi")
     except Exception as e:
         print(f"[{timezone.now()}] calculate_daily_kpi_task xatolik: {e}")
         import traceback
@@ -427,191 +320,6 @@ def reactivation_task(self):
         raise self.retry(exc=e, countdown=300)
 
 
-@shared_task
-def check_trial_attended_not_enrolled_task():
-    """Sinovga kelgan, lekin enrolled bo'lmagan lidlar uchun follow-up"""
-    try:
-        print(f"[{timezone.now()}] check_trial_attended_not_enrolled_task ishga tushdi")
-        
-        # Sinovga kelgan, lekin enrolled bo'lmagan lidlar
-        trial_attended_leads = Lead.objects.filter(
-            status='trial_attended',
-            assigned_sales__isnull=False
-        ).select_related('assigned_sales')
-        
-        now = timezone.now()
-        notifications_sent = 0
-        
-        for lead in trial_attended_leads:
-            # Eng so'nggi sinovni topish
-            last_trial = lead.trials.filter(result='attended').order_by('-date', '-time').first()
-            if not last_trial:
-                continue
-            
-            trial_datetime = timezone.make_aware(
-                timezone.datetime.combine(last_trial.date, last_trial.time)
-            )
-            time_since_trial = now - trial_datetime
-            
-            # 24 soatdan keyin follow-up yaratish
-            if timedelta(hours=23) < time_since_trial < timedelta(hours=25):
-                # Follow-up allaqachon yaratilganligini tekshirish
-                existing = FollowUp.objects.filter(
-                    lead=lead,
-                    notes__contains="Sinovdan keyin 24 soat",
-                    completed=False
-                ).exists()
-                
-                if not existing:
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        lead.assigned_sales,
-                        now,
-                        timedelta(0)
-                    )
-                    followup = FollowUp.objects.create(
-                        lead=lead,
-                        sales=lead.assigned_sales,
-                        due_date=due_date,
-                        notes="Sinovdan keyin 24 soat - qayta aloqa"
-                    )
-                    send_followup_created_notification.delay(followup.id)
-                    notifications_sent += 1
-            
-            # 3-kundan keyin follow-up
-            elif timedelta(days=2, hours=23) < time_since_trial < timedelta(days=3, hours=1):
-                existing = FollowUp.objects.filter(
-                    lead=lead,
-                    notes__contains="Sinovdan keyin 3-kun",
-                    completed=False
-                ).exists()
-                
-                if not existing:
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        lead.assigned_sales,
-                        now,
-                        timedelta(0)
-                    )
-                    followup = FollowUp.objects.create(
-                        lead=lead,
-                        sales=lead.assigned_sales,
-                        due_date=due_date,
-                        notes="Sinovdan keyin 3-kun - yakuniy follow-up"
-                    )
-                    send_followup_created_notification.delay(followup.id)
-                    notifications_sent += 1
-            
-            # 7-kundan keyin follow-up
-            elif timedelta(days=6, hours=23) < time_since_trial < timedelta(days=7, hours=1):
-                existing = FollowUp.objects.filter(
-                    lead=lead,
-                    notes__contains="Sinovdan keyin 7-kun",
-                    completed=False
-                ).exists()
-                
-                if not existing:
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        lead.assigned_sales,
-                        now,
-                        timedelta(0)
-                    )
-                    followup = FollowUp.objects.create(
-                        lead=lead,
-                        sales=lead.assigned_sales,
-                        due_date=due_date,
-                        notes="Sinovdan keyin 7-kun - qayta muloqot"
-                    )
-                    send_followup_created_notification.delay(followup.id)
-                    notifications_sent += 1
-            
-            # 14-kundan keyin follow-up
-            elif timedelta(days=13, hours=23) < time_since_trial < timedelta(days=14, hours=1):
-                existing = FollowUp.objects.filter(
-                    lead=lead,
-                    notes__contains="Sinovdan keyin 14-kun",
-                    completed=False
-                ).exists()
-                
-                if not existing:
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        lead.assigned_sales,
-                        now,
-                        timedelta(0)
-                    )
-                    followup = FollowUp.objects.create(
-                        lead=lead,
-                        sales=lead.assigned_sales,
-                        due_date=due_date,
-                        notes="Sinovdan keyin 14-kun - re-engagement"
-                    )
-                    send_followup_created_notification.delay(followup.id)
-                    notifications_sent += 1
-        
-        print(f"[{timezone.now()}] check_trial_attended_not_enrolled_task yakunlandi: {notifications_sent} ta follow-up yaratildi")
-    except Exception as e:
-        print(f"[{timezone.now()}] check_trial_attended_not_enrolled_task xatolik: {e}")
-        import traceback
-        traceback.print_exc()
-
-
-@shared_task
-def create_followup_after_trial_end_task():
-    """Sinov darsi tugagandan keyin (90 minutdan keyin) follow-up yaratish"""
-    try:
-        print(f"[{timezone.now()}] create_followup_after_trial_end_task ishga tushdi")
-        from datetime import timedelta
-        from .models import TrialLesson, Lead, FollowUp
-        from .services import FollowUpService
-        
-        now = timezone.now()
-        LESSON_DURATION_MINUTES = 90
-        
-        # Sinov darslari tugagan, lekin natija kiritilmagan trial'lar
-        trials = TrialLesson.objects.filter(
-            result__in=['', None],  # Natija kiritilmagan
-            lead__status='trial_registered',  # Hali sinovga yozilgan statusida
-            lead__assigned_sales__isnull=False  # Assigned sales bo'lishi kerak
-        ).select_related('lead', 'lead__assigned_sales')
-        
-        followups_created = 0
-        for trial in trials:
-            # Sinov darsi tugash vaqti
-            trial_datetime = timezone.make_aware(
-                timezone.datetime.combine(trial.date, trial.time)
-            )
-            trial_end_time = trial_datetime + timedelta(minutes=LESSON_DURATION_MINUTES)
-            
-            # Agar sinov darsi tugagan bo'lsa (90 minutdan keyin)
-            if now >= trial_end_time:
-                # Follow-up allaqachon yaratilganligini tekshirish
-                existing = FollowUp.objects.filter(
-                    lead=trial.lead,
-                    notes__contains="Sinov darsi tugadi",
-                    completed=False
-                ).exists()
-                
-                if not existing and trial.lead.assigned_sales:
-                    # Darhol follow-up yaratish
-                    due_date = FollowUpService.calculate_work_hours_due_date(
-                        trial.lead.assigned_sales,
-                        now,
-                        timedelta(0)  # Darhol
-                    )
-                    followup = FollowUp.objects.create(
-                        lead=trial.lead,
-                        sales=trial.lead.assigned_sales,
-                        due_date=due_date,
-                        notes="Sinov darsi tugadi - natija kiritish va aloqa qilish kerak (keldi/kelmadi)"
-                    )
-                    send_followup_created_notification.delay(followup.id)
-                    followups_created += 1
-        
-        print(f"[{timezone.now()}] create_followup_after_trial_end_task yakunlandi: {followups_created} ta follow-up yaratildi")
-    except Exception as e:
-        print(f"[{timezone.now()}] create_followup_after_trial_end_task xatolik: {e}")
-        import traceback
-        traceback.print_exc()
-
-
 @shared_task
 def check_expired_leaves_task():
     """Ruxsat tugagan sotuvchilarning is_on_leave holatini yangilash"""
@@ -693,6 +401,36 @@ def send_new_lead_notification(lead_id):
         print(f"send_new_lead_notification xatolik (lead_id={lead_id}): {e}")
 
 
+@shared_task
+def send_new_leads_digest_task(sales_id, lead_ids):
+    """
+    Sotuvchiga biriktirilgan yangi lidlar - bitta digest xabar
+    (deferred_side_effects() orqali import/ommaviy taqsimlashda har bir sotuvchiga bitta job)
+    """
+    try:
+        sales = User.objects.filter(id=sales_id).first()
+        if not sales or not sales.telegram_chat_id:
+            return
+        
+        leads = Lead.objects.select_related('interested_course').filter(id__in=lead_ids, assigned_sales_id=sales_id)
+        followups = {}
+        for followup in FollowUp.objects.filter(
+            lead_id__in=lead_ids,
+            kind='new_lead',
+            completed=False
+        ).only('lead_id', 'due_date'):
+            followups[followup.lead_id] = followup
+        
+        digest = TelegramDigest("🆕 Yangi lidlar", footer="⚠️ Darhol bog'laning")
+        for lead in sorted(leads, key=lambda lead: followups[lead.id].due_date if lead.id in followups else lead.created_at):
+            digest.add(sales.telegram_chat_id, format_new_lead_line(lead, followups.get(lead.id)))
+        digest.send()
+    except Exception as e:
+        print(f"send_new_leads_digest_task xatolik (sales_id={sales_id}): {e}")
+        import traceback
+        traceback.print_exc()
+
+
 @shared_task
 def send_status_change_notification(lead_id, old_status, new_status):
     """Status o'zgarishi haqida xabar"""
@@ -808,64 +546,10 @@ def send_followup_created_notification(followup_id):
 
 
 @shared_task
-def create_next_contacted_followup(lead_id, sequence, delay_hours, base_time):
-    """
-    Contacted status uchun keyingi follow-up'ni yaratish
-    sequence: Ketma-ketlik raqami (2, 3, ...)
-    delay_hours: Kechikish (soat)
-    base_time: Birinchi follow-up yaratilgan vaqt (ISO format)
-    """
-    try:
-        from datetime import datetime
-        
-        lead = Lead.objects.get(id=lead_id)
-        if not lead.assigned_sales or lead.status != 'contacted':
-            return  # Agar status o'zgargandan bo'lsa, to'xtatish
-        
-        # Allaqachon bu sequence uchun follow-up borligini tekshirish
-        existing = FollowUp.objects.filter(
-            lead=lead,
-            followup_sequence=sequence,
-            completed=False
-        ).exists()
-        
-        if existing:
-            return  # Agar allaqachon bor bo'lsa, yaratmaymiz
-        
-        # Base time ni parse qilish
-        if isinstance(base_time, str):
-            base_datetime = datetime.fromisoformat(base_time)
-            if timezone.is_naive(base_datetime):
-                base_datetime = timezone.make_aware(base_datetime)
-        else:
-            base_datetime = base_time
-        
-        delay = timedelta(hours=delay_hours)
-        due_date = FollowUpService.calculate_work_hours_due_date(
-            lead.assigned_sales,
-            base_datetime,
-            delay
-        )
-        
-        notes_map = {
-            2: "Contacted - 3 kundan keyin aloqa (qo'shimcha ma'lumot, bonuslar, chegirmalar)",
-            3: "Contacted - 7 kundan keyin aloqa (yakuniy taklif, qaror qabul qilish)",
-        }
-        
-        followup = FollowUp.objects.create(
-            lead=lead,
-            sales=lead.assigned_sales,
-            due_date=due_date,
-            notes=notes_map.get(sequence, f"Contacted - {delay_hours} soatdan keyin aloqa"),
-            followup_sequence=sequence
-        )
-        send_followup_created_notification.delay(followup.id)
-    except Lead.DoesNotExist:
-        pass
-    except Exception as e:
-        print(f"create_next_contacted_followup xatolik (lead_id={lead_id}, sequence={sequence}): {e}")
-        import traceback
-        traceback.print_exc()
+def send_followups_created_notifications(followup_ids):
+    """Bir status o'tishida yaratilgan follow-up'lar xabarlari - bitta job (har biri alohida xabar)"""
+    for followup_id in followup_ids:
+        send_followup_created_notification(followup_id)
 
 
 @shared_task
@@ -935,11 +619,12 @@ def send_daily_sales_summary_task():
     """
     Har ish kuni belgilangan vaqtda sotuv statistikalarini barcha admin va
     sales_manager larga (shaxsiy chat + guruh) Telegram orqali yuborish.
+    Hisobot matni sana bo'yicha keshlanadi - barcha chatlarga bir xil matn yuboriladi.
     """
     from .telegram_bot import get_admin_manager_telegram_chat_ids
 
     today = timezone.now().date()
-    message = KPIService.build_daily_report_message(today)
+    message = DailyReport.get_message(today)
     chat_ids = get_admin_manager_telegram_chat_ids()
     sent = 0
     for chat_id in chat_ids:
@@ -1036,3 +721,400 @@ def import_leads_from_google_sheets(self):
             'success': False,
             'error': str(e)
         }
+
+
+@shared_task(bind=True)
+def drain_telegram_outbox_task(self, time_budget_seconds=50):
+    """
+    TelegramOutbox navbatini yuborish (TELEGRAM_OUTBOX_CELERY_DRAIN rejimi).
+    Worker ichida sleep qilinmaydi: vaqt tugasa yoki navbat kechiktirilgan bo'lsa,
+    task o'zini countdown bilan qayta rejalashtiradi.
+    
+    Qatorlar shartli claim bilan olinadi - parallel drain'lar bir xabarni ikki marta yubormaydi.
+    Lekin lock va rate limit (TokenBucket) jarayon ichida: global 30/s va chat bo'yicha 1/s
+    chegaralari faqat umumiy cache (Redis) va bitta drain jarayoni bilan kafolatlanadi
+    (masalan, alohida navbat va --concurrency=1). Aks holda run_telegram_sender ishlating.
+    """
+    import time
+    from django.core.cache import cache
+
+    if not getattr(settings, 'TELEGRAM_OUTBOX_CELERY_DRAIN', False):
+        return
+    # Bir vaqtda faqat bitta drain ishlaydi (LocMem cache'da - faqat shu jarayon ichida)
+    lock_key = 'telegram_outbox_drain_lock'
+    if not cache.add(lock_key, 1, time_budget_seconds + 30):
+        return
+
+    from .telegram_sender import TelegramOutboxSender
+
+    sender = TelegramOutboxSender()
+    reschedule = False
+    try:
+        started = time.monotonic()
+        total_sent = 0
+        while time.monotonic() - started < time_budget_seconds:
+            claimed, sent, deferred = sender.drain_once()
+            total_sent += sent
+            if not claimed:
+                break
+            if deferred == claimed:
+                # Hammasi rate limitga tushdi - keyinroq davom etish
+                reschedule = True
+                break
+        else:
+            reschedule = True
+        if total_sent:
+            print(f"[{timezone.now()}] Telegram outbox: {total_sent} ta xabar yuborildi")
+    except Exception as e:
+        print(f"[{timezone.now()}] Telegram outbox drain xatolik: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        sender.close()
+        cache.delete(lock_key)
+
+    if reschedule:
+        drain_telegram_outbox_task.apply_async(countdown=1)
+
+
+@shared_task
+def prune_telegram_outbox_task():
+    """Eski yuborilgan outbox xabarlarini o'chirish"""
+    from .models import TelegramOutbox
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'TELEGRAM_OUTBOX_RETENTION_DAYS', 7))
+    deleted, _ = TelegramOutbox.objects.filter(status='sent', sent_at__lt=cutoff).delete()
+    if deleted:
+        print(f"[outbox] {deleted} ta eski xabar o'chirildi")
+
+
+# ============ REJALASHTIRILGAN AMALLAR (ScheduledAction) ============
+# Har bir handler bir turdagi amallar partiyasini oladi va
+# {action_id: yangi fire_at} qaytaradi - keyinroqqa qoldirilganlar; qolganlari bajarilgan hisoblanadi.
+
+def _create_followups_now(rows, now):
+    """
+    Lidlar uchun darhol (keyingi ish vaqtida) follow-up yaratish
+    Ochiq (lead, kind) allaqachon bor bo'lsa, shu qator unique indeks bo'yicha tashlab yuboriladi.
+    Args:
+        rows: [(lead, kind, notes), ...]
+    """
+    if not rows:
+        return []
+    due_dates = FollowUpService.calculate_due_dates_bulk([
+        (lead.assigned_sales_id, now, timedelta(0)) for lead, _, _ in rows
+    ])
+    followups = FollowUpService.bulk_create_once([
+        FollowUp(lead=lead, sales_id=lead.assigned_sales_id, due_date=due_date, notes=notes, kind=kind)
+        for (lead, kind, notes), due_date in zip(rows, due_dates)
+    ])
+    # bulk_create post_save signalini chaqirmaydi - eslatmalar va KPI shu yerda
+    ScheduledActionService.schedule_many('followup_reminder', [
+        (followup.id, followup.due_date) for followup in followups
+    ])
+    KPICounters.followups_created(followups)
+    for followup in followups:
+        send_followup_created_notification.delay(followup.id)
+    return followups
+
+
+def handle_followup_reminder_actions(actions, now):
+    """Aloqa vaqti kelgan follow-up'lar - sotuvchiga bitta digest xabar"""
+    followups = FollowUp.objects.select_related('lead', 'sales').in_bulk(
+        [action.object_id for action in actions]
+    )
+    pending = [
+        (action, followups[action.object_id]) for action in actions
+        if action.object_id in followups
+        and not followups[action.object_id].completed
+        and not followups[action.object_id].reminder_sent
+        and followups[action.object_id].sales_id
+    ]
+    if not pending:
+        return {}
+    
+    availability = AvailabilitySnapshot(now, users=[followup.sales for _, followup in pending])
+    allowed = NotificationLedgerService.filter_due('followup_reminder', [
+        (followup.id, followup.sales.telegram_chat_id)
+        for _, followup in pending
+        if followup.sales.telegram_chat_id
+    ], now)
+    
+    digest = TelegramDigest("📞 Aloqa vaqti keldi", footer="🔴 Darhol qo'ng'iroq qiling", ledger_kind='followup_reminder')
+    off_hours = []
+    for action, followup in pending:
+        if availability.is_available(followup.sales_id, now):
+            key = (followup.id, followup.sales.telegram_chat_id)
+            if followup.sales.telegram_chat_id and key in allowed:
+                digest.add(followup.sales.telegram_chat_id, format_followup_reminder_line(followup, now), key)
+        else:
+            off_hours.append((action, followup))
+    
+    # Ish vaqti tashqarisida - keyingi ish vaqtiga qoldirish
+    next_work_times = FollowUpService.calculate_due_dates_bulk([
+        (followup.sales_id, now, timedelta(0)) for _, followup in off_hours
+    ])
+    rescheduled = {
+        action.id: next_work_time
+        for (action, _), next_work_time in zip(off_hours, next_work_times)
+        if next_work_time > now
+    }
+    
+    # Belgilar xabarlar bilan bir tranzaksiyada - sender xatolikda ularni bekor qila olishi uchun
+    with transaction.atomic():
+        sent_keys = digest.send()
+        FollowUp.objects.filter(id__in=[followup_id for followup_id, _ in sent_keys]).update(reminder_sent=True)
+        NotificationLedgerService.record('followup_reminder', sent_keys, now)
+    return rescheduled
+
+
+def handle_trial_end_actions(actions, now):
+    """Sinov darsi tugadi, natija kiritilmagan - follow-up yaratish"""
+    trials = TrialLesson.objects.select_related('lead').in_bulk([action.object_id for action in actions])
+    candidates = [
+        trial for trial in trials.values()
+        if not trial.result
+        and trial.lead.status == 'trial_registered'
+        and trial.lead.assigned_sales_id
+        and now >= timezone.make_aware(timezone.datetime.combine(trial.date, trial.time))
+        + ScheduledActionService.TRIAL_LESSON_DURATION
+    ]
+    if not candidates:
+        return {}
+    
+    # Allaqachon ochiq 'trial_end' follow-up bo'lsa, INSERT unique indeks bo'yicha tashlab yuboriladi
+    rows = []
+    seen_leads = set()
+    for trial in candidates:
+        if trial.lead_id not in seen_leads:
+            seen_leads.add(trial.lead_id)
+            rows.append((
+                trial.lead,
+                'trial_end',
+                "Sinov darsi tugadi - natija kiritish va aloqa qilish kerak (keldi/kelmadi)"
+            ))
+    _create_followups_now(rows, now)
+    return {}
+
+
+def handle_post_trial_reminder_actions(actions, now):
+    """Sinovga keldi - sotuv taklifi eslatmasi"""
+    trials = TrialLesson.objects.select_related(
+        'lead', 'lead__assigned_sales', 'lead__interested_course'
+    ).in_bulk([action.object_id for action in actions])
+    pending = [
+        trial for trial in trials.values()
+        if trial.result == 'attended'
+        and not trial.sales_reminder_sent
+        and trial.lead.status in ['trial_attended', 'interested', 'contacted']
+        and trial.lead.assigned_sales
+    ]
+    if not pending:
+        return {}
+    
+    allowed = NotificationLedgerService.filter_due('post_trial_reminder', [
+        (trial.id, trial.lead.assigned_sales.telegram_chat_id)
+        for trial in pending
+        if trial.lead.assigned_sales.telegram_chat_id
+    ], now)
+    
+    sent_keys = []
+    with transaction.atomic():
+        for trial in pending:
+            key = (trial.id, trial.lead.assigned_sales.telegram_chat_id)
+            if key in allowed and send_telegram_notification(
+                trial.lead.assigned_sales.telegram_chat_id,
+                format_post_trial_reminder_message(trial, now),
+                receipt=('post_trial_reminder', [trial.id])
+            ):
+                sent_keys.append(key)
+        
+        TrialLesson.objects.filter(id__in=[trial.id for trial in pending]).update(sales_reminder_sent=True)
+        NotificationLedgerService.record('post_trial_reminder', sent_keys, now)
+    return {}
+
+
+def handle_trial_followup_actions(actions, now):
+    """Sinovga kelgan, lekin yozilmagan lid - 1/3/7/14-kun follow-up'lari"""
+    trials = TrialLesson.objects.select_related('lead').in_bulk([action.object_id for action in actions])
+    lead_ids = {trial.lead_id for trial in trials.values()}
+    
+    # Har bir lidning eng so'nggi 'attended' sinovi
+    latest_trial = {}
+    for trial_id, lead_id in TrialLesson.objects.filter(
+        lead_id__in=lead_ids,
+        result='attended'
+    ).order_by('lead_id', '-date', '-time').values_list('id', 'lead_id'):
+        latest_trial.setdefault(lead_id, trial_id)
+    
+    # Allaqachon ochiq bosqichlar INSERT da unique indeks bo'yicha tashlab yuboriladi
+    seen = set()
+    rows = []
+    for action in actions:
+        trial = trials.get(action.object_id)
+        if (
+            not trial
+            or trial.lead.status != 'trial_attended'
+            or not trial.lead.assigned_sales_id
+            or latest_trial.get(trial.lead_id) != trial.id
+        ):
+            continue
+        kind = ScheduledActionService.TRIAL_FOLLOWUP_KINDS[action.kind]
+        if (trial.lead_id, kind) in seen:
+            continue
+        seen.add((trial.lead_id, kind))
+        rows.append((trial.lead, kind, ScheduledActionService.TRIAL_FOLLOWUP_STAGES[action.kind][1]))
+    _create_followups_now(rows, now)
+    return {}
+
+
+SCHEDULED_ACTION_HANDLERS = {
+    'followup_reminder': handle_followup_reminder_actions,
+    'trial_end_followup': handle_trial_end_actions,
+    'post_trial_reminder': handle_post_trial_reminder_actions,
+    **{kind: handle_trial_followup_actions for kind in ScheduledActionService.TRIAL_FOLLOWUP_STAGES},
+}
+
+
+@shared_task
+def dispatch_scheduled_actions_task(time_budget_seconds=50):
+    """
+    Vaqti kelgan ScheduledAction'larni bajarish
+    Har tick'dagi ish faqat vaqti kelgan amallar soniga bog'liq (jadval hajmiga emas).
+    """
+    import time
+    
+    try:
+        started = time.monotonic()
+        done = 0
+        rescheduled_count = 0
+        failed = 0
+        while time.monotonic() - started < time_budget_seconds:
+            actions = ScheduledActionService.claim_due()
+            if not actions:
+                break
+            
+            actions_by_kind = {}
+            for action in actions:
+                actions_by_kind.setdefault(action.kind, []).append(action)
+            
+            for kind, kind_actions in actions_by_kind.items():
+                handler = SCHEDULED_ACTION_HANDLERS.get(kind)
+                if handler is None:
+                    ScheduledActionService.fail(kind_actions, f"Noma'lum amal turi: {kind}")
+                    failed += len(kind_actions)
+                    continue
+                try:
+                    rescheduled = handler(kind_actions, timezone.now()) or {}
+                except Exception as e:
+                    print(f"[{timezone.now()}] ScheduledAction xatolik ({kind}): {e}")
+                    import traceback
+                    traceback.print_exc()
+                    ScheduledActionService.fail(kind_actions, f"{type(e).__name__}: {e}")
+                    failed += len(kind_actions)
+                    continue
+                ScheduledActionService.reschedule(rescheduled)
+                ScheduledActionService.complete([
+                    action.id for action in kind_actions if action.id not in rescheduled
+                ])
+                rescheduled_count += len(rescheduled)
+                done += len(kind_actions) - len(rescheduled)
+            
+            if len(actions) < ScheduledActionService.BATCH_SIZE:
+                break
+        
+        if done or rescheduled_count or failed:
+            print(
+                f"[{timezone.now()}] dispatch_scheduled_actions_task: {done} ta bajarildi, "
+                f"{rescheduled_count} ta qoldirildi, {failed} ta xatolik"
+            )
+    except Exception as e:
+        print(f"[{timezone.now()}] dispatch_scheduled_actions_task xatolik: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+@shared_task
+def prune_scheduled_actions_task():
+    """Bajarilgan eski amallarni o'chirish"""
+    from .models import ScheduledAction
+    
+    cutoff = timezone.now() - timedelta(days=7)
+    deleted, _ = ScheduledAction.objects.filter(state='done', updated_at__lt=cutoff).delete()
+    if deleted:
+        print(f"[scheduled actions] {deleted} ta eski amal o'chirildi")
+
+
+@shared_task
+def recompute_kpi_task(sales_id, dates):
+    """
+    Sahifa o'qiganda yo'q yoki eskirgan chiqqan kunlik KPI qatorlarini qayta hisoblash
+    (sahifalar faqat tayyor qatorlarni o'qiydi; dedupe - kpi_backfill.schedule_recompute)
+    """
+    from datetime import date
+    from .models import User
+    
+    try:
+        sales = User.objects.filter(pk=sales_id).first()
+        if sales is None:
+            return
+        for day in dates:
+            KPIService.reconcile_daily_kpi(date.fromisoformat(day), [sales])
+        print(f"[{timezone.now()}] recompute_kpi_task: {sales.username}, {len(dates)} kun")
+    except Exception as e:
+        print(f"[{timezone.now()}] recompute_kpi_task xatolik: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+@shared_task
+def backfill_kpi_task(start_date, end_date, sales_ids=None, missing_only=True):
+    """
+    Yetishmagan kunlik KPI qatorlarini hisoblash (sahifalar o'zi hisoblamaydi)
+    Celery worker jarayonlari daemon bo'lgani uchun shu jarayonda bajariladi;
+    parallel backfill uchun: python manage.py backfill_kpi --workers N
+    """
+    from datetime import date
+    from .kpi_backfill import plan_backfill, run_backfill
+    
+    try:
+        units = plan_backfill(
+            date.fromisoformat(start_date),
+            date.fromisoformat(end_date),
+            sales_ids=sales_ids,
+            missing_only=missing_only
+        )
+        if not units:
+            return
+        result = run_backfill(units, workers=1, progress=lambda message: None)
+        print(
+            f"[{timezone.now()}] backfill_kpi_task: {result['days']} kun, {result['failed']} xatolik, "
+            f"{result['seconds']:.1f} s ({result['days_per_second']:.1f} kun/s)"
+        )
+    except Exception as e:
+        print(f"[{timezone.now()}] backfill_kpi_task xatolik: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+@shared_task
+def build_analytics_snapshot_task():
+    """
+    Har kecha Lead, FollowUp va TrialLesson ni ustunli .npy snapshotga eksport qilish
+    (voronka/kogorta sahifasi OLTP bazaga murojaat qilmaydi)
+    """
+    from .analytics_snapshot import build_snapshot, NUMPY_AVAILABLE
+    
+    if not NUMPY_AVAILABLE:
+        print(f"[{timezone.now()}] build_analytics_snapshot_task: NumPy o'rnatilmagan, o'tkazib yuborildi")
+        return
+    try:
+        result = build_snapshot()
+        print(
+            f"[{timezone.now()}] Analitika snapshot: {result['leads']} lid, {result['followups']} follow-up, "
+            f"{result['trials']} sinov ({result['seconds']:.1f} s)"
+        )
+    except Exception as e:
+        print(f"[{timezone.now()}] build_analytics_snapshot_task xatolik: {e}")
+        import traceback
+        traceback.print_exc()
@@ -13,8 +13,18 @@ def _get_telegram_bot():
         return None, None
 
 
-def send_telegram_notification(chat_id, message, parse_mode='HTML'):
-    """Telegram xabar yuborish (sync) - retry bilan"""
+def send_telegram_notification(chat_id, message, parse_mode='HTML', receipt=None):
+    """
+    Telegram xabar yuborish.
+    
+    TELEGRAM_OUTBOX_ENABLED bo'lsa xabar faqat TelegramOutbox navbatiga qo'shiladi va
+    alohida sender (run_telegram_sender yoki drain_telegram_outbox_task) yuboradi.
+    Returns: True - navbatga qo'shildi (yoki yuborildi). Navbat rejimida True yetkazilganini
+    bildirmaydi: producer NotificationLedger va "yuborildi" belgilarini yozadi, sender esa
+    xabar yakuniy xatolik bilan tugasa ularni bekor qiladi.
+    
+    receipt: (NotificationLedger turi, [obyekt ID, ...]) - xabar yuborilmasa bekor qilinadigan belgilar
+    """
     if not settings.TELEGRAM_BOT_TOKEN:
         print("TELEGRAM_BOT_TOKEN sozlanmagan!")
         return False
@@ -23,6 +33,48 @@ def send_telegram_notification(chat_id, message, parse_mode='HTML'):
         print(f"Chat ID bo'sh: {chat_id}")
         return False
     
+    if getattr(settings, 'TELEGRAM_OUTBOX_ENABLED', True):
+        return enqueue_telegram_message(chat_id, message, parse_mode=parse_mode, receipt=receipt)
+    return _send_telegram_now(chat_id, message, parse_mode=parse_mode)
+
+
+def enqueue_telegram_message(chat_id, message, parse_mode='HTML', receipt=None):
+    """Xabarni TelegramOutbox ga qo'shish"""
+    from django.db import transaction
+    from .models import TelegramOutbox
+    
+    receipt_kind, receipt_ids = receipt or ('', [])
+    try:
+        TelegramOutbox.objects.create(
+            chat_id=str(chat_id).strip(),
+            text=message,
+            parse_mode=parse_mode or '',
+            receipt_kind=receipt_kind,
+            receipt_ids=list(receipt_ids)
+        )
+    except Exception as e:
+        print(f"Telegram xabarni navbatga qo'shishda xatolik: {type(e).__name__}: {e}")
+        return False
+    
+    if getattr(settings, 'TELEGRAM_OUTBOX_CELERY_DRAIN', False):
+        transaction.on_commit(_trigger_outbox_drain)
+    return True
+
+
+def _trigger_outbox_drain():
+    """Celery orqali navbatni yuborishni boshlash (bir necha soniyada bir marta)"""
+    from django.core.cache import cache
+    if not cache.add('telegram_outbox_drain_scheduled', 1, 5):
+        return
+    try:
+        from .tasks import drain_telegram_outbox_task
+        drain_telegram_outbox_task.apply_async(countdown=1)
+    except Exception as e:
+        print(f"Outbox drain task ishga tushmadi: {type(e).__name__}: {e}")
+
+
+def _send_telegram_now(chat_id, message, parse_mode='HTML'):
+    """Telegram xabar yuborish (sync) - retry bilan, outboxsiz"""
     # Lazy import
     Bot, TelegramError = _get_telegram_bot()
     if Bot is None:
@@ -88,6 +140,91 @@ def send_telegram_notification(chat_id, message, parse_mode='HTML'):
     return False
 
 
+# Telegram xabar uzunligi chegarasi
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class TelegramDigest:
+    """
+    Bir tick davomidagi xabarlarni chat bo'yicha yig'ib yuborish.
+    
+    Har bir chat uchun barcha qatorlar bitta xabarga birlashtiriladi; xabar 4096 belgidan
+    yoki settings.TELEGRAM_DIGEST_MAX_ITEMS qatordan oshsa, bir nechta xabarga bo'linadi.
+    send() faqat yetkazilgan (navbat rejimida - navbatga qo'shilgan) qatorlar kalitlarini
+    qaytaradi (NotificationLedger uchun). ledger_kind berilsa, kalitlar (object_id, chat_id)
+    xabarga receipt sifatida biriktiriladi - xabar yuborilmasa belgilar bekor qilinadi.
+    """
+    
+    def __init__(self, title, footer='', max_items=None, parse_mode='HTML', ledger_kind=None):
+        self.title = title
+        self.footer = footer
+        self.ledger_kind = ledger_kind
+        self.max_items = max_items or getattr(settings, 'TELEGRAM_DIGEST_MAX_ITEMS', 20)
+        self.parse_mode = parse_mode
+        self._items = {}  # chat_id -> [(key, line), ...]
+    
+    def add(self, chat_id, line, key=None):
+        """Chat uchun qator qo'shish"""
+        if chat_id:
+            self._items.setdefault(str(chat_id), []).append((key, line))
+    
+    def __len__(self):
+        return sum(len(items) for items in self._items.values())
+    
+    def _header(self, count, part, parts):
+        header = f"{self.title} ({count} ta)"
+        if parts > 1:
+            header += f" [{part}/{parts}]"
+        return header
+    
+    def build_messages(self, items):
+        """
+        Qatorlarni xabarlarga bo'lish
+        Returns: [(message, [key, ...]), ...]
+        """
+        # Header/footer uchun joy qoldirish
+        reserve = len(self._header(len(items), 99, 99)) + len(self.footer) + 4
+        limit = TELEGRAM_MESSAGE_LIMIT - reserve
+        
+        chunks = []
+        current, size = [], 0
+        for key, line in items:
+            line = line[:limit]
+            added = len(line) + 2
+            if current and (len(current) >= self.max_items or size + added > limit):
+                chunks.append(current)
+                current, size = [], 0
+            current.append((key, line))
+            size += added
+        if current:
+            chunks.append(current)
+        
+        messages = []
+        for part, chunk in enumerate(chunks, 1):
+            message = self._header(len(items), part, len(chunks)) + "\n\n"
+            message += "\n\n".join(line for _, line in chunk)
+            if self.footer:
+                message += "\n\n" + self.footer
+            messages.append((message, [key for key, _ in chunk]))
+        return messages
+    
+    def send(self):
+        """
+        Barcha chatlarga yig'ilgan xabarlarni yuborish
+        Returns: yetkazilgan qatorlar kalitlari ro'yxati
+        """
+        delivered = []
+        for chat_id, items in self._items.items():
+            for message, keys in self.build_messages(items):
+                receipt = None
+                if self.ledger_kind:
+                    receipt = (self.ledger_kind, [key[0] for key in keys if key is not None])
+                if send_telegram_notification(chat_id, message, parse_mode=self.parse_mode, receipt=receipt):
+                    delivered.extend(key for key in keys if key is not None)
+        self._items = {}
+        return delivered
+
+
 def get_admin_manager_telegram_chat_ids():
     """
     Barcha admin va sales_manager larga hisobot yuborish uchun chat ID larni qaytaradi.
@@ -24,9 +24,10 @@ except ImportError as e:
     CallbackContext = None
     TELEGRAM_AVAILABLE = False
 from django.utils import timezone
+from django.db.models import Sum
 from datetime import date
 from .models import Lead, FollowUp, User, KPI
-from .services import FollowUpService, KPIService
+from .services import FollowUpService, KPIService, OverdueMatrix
 
 
 def start(update: Update, context: CallbackContext):
@@ -55,7 +56,20 @@ def stats(update: Update, context: CallbackContext):
     stats_text = f"📊 Bugungi Statistikalar ({today})\n\n"
     stats_text += f"Yangi lidlar: {Lead.objects.filter(created_at__date=today).count()}\n"
     stats_text += f"Jami follow-ups: {FollowUpService.get_today_followups().count()}\n"
-    stats_text += f"Overdue: {FollowUpService.get_overdue_followups().count()}\n"
+    stats_text += f"Overdue: {OverdueMatrix.current().overdue_count()}\n"
+    
+    # Sotuvchilar KPI hisoblagichlari (yig'indi)
+    totals = KPI.objects.filter(date=today).aggregate(
+        contacts=Sum('daily_contacts'),
+        trials=Sum('trials_registered'),
+        sales=Sum('trials_to_sales'),
+    )
+    stats_text += f"Aloqalar: {totals['contacts'] or 0}\n"
+    stats_text += f"Sinovga yozilganlar: {totals['trials'] or 0}\n"
+    stats_text += f"Sotuvlar: {totals['sales'] or 0}\n"
+    reconcile = KPIService.get_reconcile_status()
+    if reconcile:
+        stats_text += f"\nKPI tekshiruvi ({reconcile['date']}): farq {reconcile['delta'] or 0}\n"
     
     update.message.reply_text(stats_text)
 
@@ -80,17 +94,23 @@ def followups(update: Update, context: CallbackContext):
 
 def overdue(update: Update, context: CallbackContext):
     """Overdue follow-uplar"""
-    overdue_followups = FollowUpService.get_overdue_followups()
+    stats = OverdueMatrix.current().statistics()
     
-    if not overdue_followups.exists():
+    if not stats['total']:
         update.message.reply_text("Overdue follow-up yo'q ✅")
         return
     
-    text = "⚠️ Overdue Follow-ups:\n\n"
-    for followup in overdue_followups[:10]:
-        text += f"• {followup.lead.name} ({followup.sales.username})\n"
+    text = f"⚠️ Overdue Follow-ups: {stats['total']}\n"
+    text += " | ".join(f"{age}: {count}" for age, count in stats['by_age'].items() if count) + "\n\n"
+    for followup in FollowUpService.get_overdue_followups()[:10]:
+        text += f"• {followup.lead.name} ({followup.sales.username if followup.sales else '-'})\n"
         text += f"  Vaqt: {followup.due_date.strftime('%d.%m.%Y %H:%M')}\n\n"
     
+    if stats['by_sales']:
+        text += "👥 Sotuvchilar bo'yicha:\n"
+        for username, count in sorted(stats['by_sales'].items(), key=lambda item: item[1], reverse=True):
+            text += f"   {username}: {count}\n"
+    
     update.message.reply_text(text)
 
 
@@ -99,11 +119,13 @@ def rating(update: Update, context: CallbackContext):
     today = timezone.now().date()
     sales_users = User.objects.filter(role='sales', is_active_sales=True)
     
+    overdue_matrix = OverdueMatrix.current()
+    today_kpis = KPIService.get_live_kpis(today, sales_users)
     ratings = []
     for sales in sales_users:
         try:
-            kpi = KPIService.calculate_daily_kpi(sales, today)
-            overdue_count = FollowUpService.get_overdue_followups(sales).count()
+            kpi = today_kpis[sales.id]
+            overdue_count = overdue_matrix.overdue_count(sales)
             ratings.append({
                 'sales': sales,
                 'kpi': kpi,
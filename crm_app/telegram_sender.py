@@ -0,0 +1,289 @@
+"""
+Telegram outbox yuboruvchisi
+
+Producerlar (send_telegram_notification) faqat TelegramOutbox ga qator qo'shadi.
+Xabar yakuniy xatolik bilan tugasa, unga biriktirilgan eslatma belgilari (receipt) bekor qilinadi.
+Bu modul navbatni bitta qayta ishlatiladigan HTTP session orqali Bot API ga yuboradi:
+- global (~30 xabar/s) va har bir chat (~1 xabar/s) uchun token bucket
+- 429 da retry_after ga rioya qilish
+- xatolarda backoff - next_attempt_at orqali (worker ichida sleep qilinmaydi)
+"""
+import time
+import uuid
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import TelegramOutbox
+
+
+TELEGRAM_API_URL = 'https://api.telegram.org/bot{token}/sendMessage'
+
+# Doimiy xatolar (chat topilmadi, bot bloklangan va h.k.) - qayta urinilmaydi
+PERMANENT_ERROR_CODES = (400, 401, 403, 404)
+
+
+class TokenBucket:
+    """Oddiy token bucket: rate - soniyasiga token, capacity - maksimal burst"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def has_token(self, now=None):
+        """Token bormi (olmasdan tekshirish)"""
+        self._refill(now or time.monotonic())
+        return self.tokens >= 1
+
+    def try_acquire(self, now=None):
+        """Token olish; bo'lmasa False"""
+        self._refill(now or time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        """Keyingi token uchun kutish vaqti (soniya)"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class TelegramOutboxSender:
+    """TelegramOutbox navbatini rate limit bilan yuboruvchi"""
+
+    LEASE_SECONDS = 60  # Olingan (sending) qator shu vaqtdan keyin qayta olinishi mumkin
+    MAX_ATTEMPTS = 5
+    MAX_BACKOFF_SECONDS = 15 * 60
+
+    def __init__(self, workers=None, batch_size=100):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.workers = workers or getattr(settings, 'TELEGRAM_SENDER_WORKERS', 8)
+        self.batch_size = batch_size
+        self.url = TELEGRAM_API_URL.format(token=settings.TELEGRAM_BOT_TOKEN)
+
+        # Bitta session - ulanishlar qayta ishlatiladi
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=self.workers))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        self.global_bucket = TokenBucket(getattr(settings, 'TELEGRAM_GLOBAL_RATE', 30))
+        self.chat_rate = getattr(settings, 'TELEGRAM_PER_CHAT_RATE', 1)
+        self.chat_buckets = {}
+        self.chat_blocked_until = {}  # chat_id -> monotonic vaqt (429 dan keyin)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def claim_batch(self):
+        """
+        Yuborish vaqti kelgan qatorlarni olish (lease bilan)
+        skip_locked bo'lmagan backend'da (SQLite) SELECT va UPDATE orasida boshqa sender shu
+        qatorlarni olishi mumkin - shuning uchun UPDATE shartli (hali olinmagan qatorlar) va
+        faqat shu partiya tokeni yozilgan qatorlar qaytariladi.
+        """
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        with transaction.atomic():
+            queryset = TelegramOutbox.objects.filter(
+                status__in=['pending', 'sending'],
+                next_attempt_at__lte=now
+            ).order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            ids = list(queryset.values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return []
+            TelegramOutbox.objects.filter(
+                id__in=ids,
+                status__in=['pending', 'sending'],
+                next_attempt_at__lte=now
+            ).update(
+                status='sending',
+                next_attempt_at=now + timedelta(seconds=self.LEASE_SECONDS),
+                claimed_by=token
+            )
+        return list(TelegramOutbox.objects.filter(id__in=ids, claimed_by=token).order_by('id'))
+
+    def _chat_allowed(self, chat_id, now):
+        if self.chat_blocked_until.get(chat_id, 0) > now:
+            return False
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+        return bucket.has_token(now)
+
+    def _post(self, message):
+        """Bot API ga so'rov (thread ichida, DB ga murojaat qilmaydi)"""
+        payload = {'chat_id': message.chat_id, 'text': message.text}
+        if message.parse_mode:
+            payload['parse_mode'] = message.parse_mode
+        try:
+            response = self.session.post(self.url, json=payload, timeout=10)
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            return response.status_code, data, ''
+        except Exception as e:
+            return None, {}, f"{type(e).__name__}: {e}"
+
+    def drain_once(self):
+        """
+        Bitta partiyani yuborish
+        Returns: (olingan, yuborilgan, kechiktirilgan) soni
+        """
+        batch = self.claim_batch()
+        if not batch:
+            return 0, 0, 0
+
+        to_send, deferred = [], []
+        now = time.monotonic()
+        for message in batch:
+            if self._chat_allowed(message.chat_id, now) and self.global_bucket.try_acquire(now):
+                self.chat_buckets[message.chat_id].try_acquire(now)
+                to_send.append(message)
+            else:
+                deferred.append(message)
+
+        # Rate limitga tushganlarni navbatga qaytarish (urinish hisoblanmaydi)
+        if deferred:
+            wait = max(self.global_bucket.wait_time(), 1.0 / self.chat_rate)
+            TelegramOutbox.objects.filter(id__in=[message.id for message in deferred]).update(
+                status='pending',
+                next_attempt_at=timezone.now() + timedelta(seconds=wait)
+            )
+
+        sent = 0
+        for message, result in zip(to_send, self.executor.map(self._post, to_send)):
+            if self._handle_result(message, *result):
+                sent += 1
+        return len(batch), sent, len(deferred)
+
+    def _handle_result(self, message, status_code, data, error):
+        """Natijani saqlash: yuborildi, qayta urinish yoki xatolik"""
+        now = timezone.now()
+        attempts = message.attempts + 1
+
+        if status_code == 200 and data.get('ok', True):
+            TelegramOutbox.objects.filter(id=message.id).update(
+                status='sent',
+                attempts=attempts,
+                sent_at=now,
+                latency_ms=int((now - message.created_at).total_seconds() * 1000),
+                last_error=''
+            )
+            return True
+
+        description = data.get('description') or error or f"HTTP {status_code}"
+
+        if status_code == 429:
+            # Telegram ko'rsatgan vaqtgacha shu chatga yubormaslik
+            retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+            self.chat_blocked_until[message.chat_id] = time.monotonic() + retry_after
+            TelegramOutbox.objects.filter(id=message.id).update(
+                status='pending',
+                next_attempt_at=now + timedelta(seconds=retry_after),
+                last_error=description
+            )
+            return False
+
+        if status_code in PERMANENT_ERROR_CODES or attempts >= self.MAX_ATTEMPTS:
+            print(f"Telegram xabar yuborilmadi (outbox #{message.id}, chat {message.chat_id}): {description}")
+            with transaction.atomic():
+                TelegramOutbox.objects.filter(id=message.id).update(
+                    status='failed',
+                    attempts=attempts,
+                    last_error=description
+                )
+                # Producer "yuborildi" deb belgilagan eslatmalar - bekor qilish
+                if message.receipt_kind:
+                    from .services import NotificationLedgerService
+                    NotificationLedgerService.release(
+                        message.receipt_kind,
+                        message.receipt_ids,
+                        message.chat_id,
+                        retry=status_code not in PERMANENT_ERROR_CODES
+                    )
+            return False
+
+        # Network yoki server xatoligi - eksponensial backoff
+        backoff = min(self.MAX_BACKOFF_SECONDS, 5 * 2 ** attempts)
+        TelegramOutbox.objects.filter(id=message.id).update(
+            status='pending',
+            attempts=attempts,
+            next_attempt_at=now + timedelta(seconds=backoff),
+            last_error=description
+        )
+        return False
+
+    def run_forever(self, poll_interval=1.0, stats_interval=60):
+        """Doimiy ishlovchi sender (alohida jarayon - run_telegram_sender)"""
+        last_stats = time.monotonic()
+        while True:
+            claimed, sent, deferred = self.drain_once()
+            if time.monotonic() - last_stats >= stats_interval:
+                print(format_outbox_stats(get_outbox_stats()))
+                last_stats = time.monotonic()
+            if not claimed or deferred == claimed:
+                time.sleep(poll_interval)
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentil"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def get_outbox_stats(window_minutes=60):
+    """
+    Outbox holati: navbat chuqurligi va oxirgi window_minutes dagi yetkazish kechikishi
+    """
+    from django.db.models import Count, Min, Q
+
+    now = timezone.now()
+    since = now - timedelta(minutes=window_minutes)
+
+    counts = TelegramOutbox.objects.aggregate(
+        pending=Count('id', filter=Q(status__in=['pending', 'sending'])),
+        failed=Count('id', filter=Q(status='failed', created_at__gte=since)),
+        oldest_pending=Min('created_at', filter=Q(status__in=['pending', 'sending'])),
+    )
+    latencies = sorted(TelegramOutbox.objects.filter(
+        status='sent',
+        sent_at__gte=since
+    ).values_list('latency_ms', flat=True))
+
+    return {
+        'depth': counts['pending'],
+        'oldest_pending_seconds': (now - counts['oldest_pending']).total_seconds() if counts['oldest_pending'] else 0,
+        'failed': counts['failed'],
+        'sent': len(latencies),
+        'latency_p50_ms': _percentile(latencies, 50),
+        'latency_p90_ms': _percentile(latencies, 90),
+        'latency_p99_ms': _percentile(latencies, 99),
+    }
+
+
+def format_outbox_stats(stats):
+    """Statistikani bir qator matnga o'tkazish"""
+    return (
+        f"[{timezone.now()}] Telegram outbox: navbat {stats['depth']} "
+        f"(eng eskisi {stats['oldest_pending_seconds']:.0f} s), "
+        f"yuborildi {stats['sent']}, xatolik {stats['failed']}, "
+        f"kechikish p50/p90/p99: {stats['latency_p50_ms']}/{stats['latency_p90_ms']}/{stats['latency_p99_ms']} ms"
+    )
@@ -235,3 +235,22 @@ def uzbek_timeuntil(value):
         else:
             return f"{total_years} yil {remaining_months} oydan keyin"
 
+
+
+@register.filter
+def minutes_duration(value):
+    """
+    Daqiqalarni qisqa ko'rinishda ko'rsatish (vaqt taqsimoti jadvallari uchun)
+    Masalan: 45 -> "45 daq", 150 -> "2.5 soat", 4320 -> "3.0 kun"
+    """
+    if value is None or value == '':
+        return "–"
+    
+    minutes = float(value)
+    if minutes < 1:
+        return "<1 daq"
+    if minutes < 60:
+        return f"{minutes:.0f} daq"
+    if minutes < 24 * 60:
+        return f"{minutes / 60:.1f} soat"
+    return f"{minutes / (24 * 60):.1f} kun"
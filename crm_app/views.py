@@ -11,9 +11,11 @@ from io import BytesIO
 from openpyxl import Workbook
 from django.views.decorators.csrf import csrf_exempt
 from datetime import date, timedelta
+from .deferred_writes import deferred_side_effects
 from .models import (
     Lead, Course, Group, Room, FollowUp, TrialLesson, 
-    KPI, User, Reactivation, LeaveRequest, SalesMessage, SalesMessageRead, Offer
+    KPI, User, Reactivation, LeaveRequest, SalesMessage, SalesMessageRead, Offer,
+    KPIWeekly, KPIMonthly
 )
 from .forms import (
     LeadForm, LeadStatusForm, TrialLessonForm, TrialResultForm,
@@ -24,7 +26,8 @@ from .forms import (
 from .decorators import role_required, admin_required, manager_or_admin_required
 from .services import (
     LeadDistributionService, FollowUpService, GroupService,
-    KPIService, ReactivationService, OfferService, GoogleSheetsService
+    KPIService, ReactivationService, OfferService, GoogleSheetsService,
+    OverdueMatrix, KPICounters, Leaderboard, KPIRollups, LatencyStats
 )
 try:
     import pandas as pd
@@ -109,6 +112,7 @@ def dashboard(request):
         if request.user.is_admin or request.user.is_sales_manager:
             # Admin/Manager dashboard
             overdue_followups_queryset = FollowUpService.get_overdue_followups_prioritized()
+            overdue_matrix = OverdueMatrix.current()
             
             context.update({
             'total_leads': Lead.objects.count(),
@@ -118,33 +122,24 @@ def dashboard(request):
             ).count(),
             'total_sales': User.objects.filter(role='sales', is_active_sales=True).count(),
             'active_groups': Group.objects.filter(is_active=True).count(),
-            'overdue_followups': overdue_followups_queryset.count(),
+            'overdue_followups': overdue_matrix.overdue_count(),
             'overdue_followups_list': overdue_followups_queryset.select_related(
                 'lead', 'sales', 'lead__assigned_sales', 'lead__interested_course'
             )[:10],  # Eng qadimgi 10 tasi
-                'overdue_stats': FollowUpService.get_overdue_statistics(),
+                'overdue_stats': overdue_matrix.statistics(),
             })
         else:
             # Sales dashboard
             sales = request.user
             overdue_followups_queryset = FollowUpService.get_overdue_followups_prioritized(sales)
+            overdue_matrix = OverdueMatrix.current()
             
-            # Bugungi KPI
+            # Bugungi KPI - yozish vaqtida yangilanadigan hisoblagichlardan
             today = timezone.now().date()
-            today_kpi = KPIService.calculate_daily_kpi(sales, today)
+            today_kpi = KPIService.get_live_kpi(sales, today)
             
-            # Oxirgi 7 kunlik KPI
-            from datetime import timedelta
-            last_7_days_kpi = []
-            for i in range(7):
-                date = today - timedelta(days=i)
-                kpi = KPI.objects.filter(sales=sales, date=date).first()
-                if not kpi:
-                    kpi = KPIService.calculate_daily_kpi(sales, date)
-                last_7_days_kpi.append({
-                    'date': date,
-                    'kpi': kpi
-                })
+            # Oxirgi 7 kunlik KPI (yo'q kunlar - 'pending', eskirganlari - 'stale'; qayta hisoblash navbatga qo'yiladi)
+            last_7_days_kpi = KPIService.get_kpi_history(sales, 7, today)
             
             # Reyting (conversion_rate bo'yicha)
             ranking = KPIService.get_sales_ranking(sales, period='month', metric='conversion_rate')
@@ -156,12 +151,13 @@ def dashboard(request):
             context.update({
                 'my_leads': Lead.objects.filter(assigned_sales=sales).count(),
                 'today_followups': FollowUpService.get_today_followups(sales).count(),
-                'overdue_followups': overdue_followups_queryset.count(),
+                'overdue_followups': overdue_matrix.overdue_count(sales),
                 'overdue_followups_list': overdue_followups_queryset.select_related(
                     'lead', 'lead__interested_course'
                 )[:10],  # Eng qadimgi 10 tasi
-                'is_blocked': FollowUpService.check_sales_blocked(sales),
+                'is_blocked': overdue_matrix.is_blocked(sales),
                 'today_kpi': today_kpi,
+                'kpi_reconcile': KPIService.get_reconcile_status(sales),
                 'last_7_days_kpi': last_7_days_kpi,
                 'ranking': ranking,
                 'trend_contacts': trend_contacts,
@@ -552,7 +548,16 @@ def lead_assign(request, pk):
             
             # Follow-up'larni yangi sotuvchiga o'tkazish
             if pending_count > 0:
+                due_dates = list(pending_followups.values_list('due_date', flat=True))
                 pending_followups.update(sales=new_sales)
+                # update() signal chaqirmaydi - KPI hisoblagichlarini ko'chirish
+                KPICounters.followups_changed([
+                    (
+                        (old_sales.id, KPICounters.local_date(due_date), False),
+                        (new_sales.id, KPICounters.local_date(due_date), False),
+                    )
+                    for due_date in due_dates
+                ])
             
             # Eski sotuvchiga xabar yuborish (agar telegram_chat_id bo'lsa)
             if old_sales.telegram_chat_id:
@@ -1071,11 +1076,10 @@ def bulk_reschedule_overdue(request):
         if not followup_ids:
             messages.error(request, "Hech qanday follow-up tanlanmagan")
         else:
-            count = 0
-            for followup_id in followup_ids:
-                followup = get_object_or_404(FollowUp, pk=followup_id)
-                if FollowUpService.auto_reschedule_overdue(followup, hours_ahead):
-                    count += 1
+            count = FollowUpService.auto_reschedule_overdue_bulk(
+                FollowUp.objects.filter(pk__in=followup_ids),
+                hours_ahead
+            )
             
             messages.success(request, f'{count} ta follow-up qayta rejalashtirildi')
     
@@ -1097,10 +1101,11 @@ def bulk_reassign_overdue(request):
         else:
             new_sales = get_object_or_404(User, pk=new_sales_id, role='sales')
             count = 0
-            for followup_id in followup_ids:
-                followup = get_object_or_404(FollowUp, pk=followup_id)
-                if FollowUpService.reassign_overdue_followup(followup, new_sales):
-                    count += 1
+            # KPI va eslatma o'zgarishlari partiya oxirida bitta flush bilan (deferred_side_effects)
+            with deferred_side_effects():
+                for followup in FollowUp.objects.filter(pk__in=followup_ids):
+                    if FollowUpService.reassign_overdue_followup(followup, new_sales):
+                        count += 1
             
             messages.success(request, f'{count} ta follow-up {new_sales.username} ga o\'tkazildi')
     
@@ -1118,15 +1123,17 @@ def bulk_complete_overdue(request):
             messages.error(request, "Hech qanday follow-up tanlanmagan")
         else:
             count = 0
-            skipped = 0
-            for followup_id in followup_ids:
-                followup = get_object_or_404(FollowUp, pk=followup_id)
-                # Admin/Manager uchun ish vaqti tekshirilmaydi
-                try:
-                    followup.mark_completed(check_work_hours=False)
-                    count += 1
-                except Exception as e:
-                    skipped += 1
+            followups = list(FollowUp.objects.filter(pk__in=followup_ids))
+            skipped = len(set(followup_ids)) - len(followups)
+            # KPI va eslatma o'zgarishlari partiya oxirida bitta flush bilan (deferred_side_effects)
+            with deferred_side_effects():
+                for followup in followups:
+                    # Admin/Manager uchun ish vaqti tekshirilmaydi
+                    try:
+                        followup.mark_completed(check_work_hours=False)
+                        count += 1
+                    except Exception as e:
+                        skipped += 1
             
             if count > 0:
                 messages.success(request, f'{count} ta follow-up bajarilgan deb belgilandi')
@@ -1147,16 +1154,14 @@ def bulk_delete_overdue(request):
             messages.error(request, "Hech qanday follow-up tanlanmagan")
         else:
             count = 0
-            for followup_id in followup_ids:
-                try:
-                    followup = get_object_or_404(FollowUp, pk=followup_id)
+            # KPI va eslatma o'zgarishlari partiya oxirida bitta flush bilan (deferred_side_effects)
+            with deferred_side_effects():
+                for followup in FollowUp.objects.filter(pk__in=followup_ids):
                     # Mark as completed instead of deleting from database
                     followup.completed = True
                     followup.is_overdue = False
                     followup.save()
                     count += 1
-                except Exception as e:
-                    pass
             
             if count > 0:
                 messages.success(request, f'{count} ta overdue follow-up o\'chirildi (bajarilgan deb belgilandi)')
@@ -1879,8 +1884,18 @@ def analytics(request):
     
     # Sotuvchi statistikasi (Admin va Manager uchun) - kunlik / haftalik / oylik
     sales_stats = []
-    for sales in User.objects.filter(role='sales', is_active_sales=True):
-        kpi = KPIService.calculate_daily_kpi(sales, today)
+    overdue_matrix = OverdueMatrix.current()
+    sales_users = list(User.objects.filter(role='sales', is_active_sales=True))
+    # Bugungi KPI - jonli hisoblagichlar + OverdueMatrix (qator tungi reconcile da yoziladi)
+    today_kpis = KPIService.get_live_kpis(today, sales_users)
+    # Reyting - barcha qatorlar uchun bitta so'rov (keshlangan)
+    leaderboard = Leaderboard.get(period='month', metric='conversion_rate')
+    # Haftalik va oylik yig'indilar - har biri bitta o'qish
+    sales_ids = [sales.id for sales in sales_users]
+    weekly_rollups = KPIRollups.get_rows(KPIWeekly, week_start, sales_ids)
+    monthly_rollups = KPIRollups.get_rows(KPIMonthly, current_month_start, sales_ids)
+    for sales in sales_users:
+        kpi = today_kpis[sales.id]
         leads_assigned = Lead.objects.filter(assigned_sales=sales).count()
         sales_count = Lead.objects.filter(
             assigned_sales=sales,
@@ -1890,39 +1905,33 @@ def analytics(request):
             lead__assigned_sales=sales
         ).select_related('lead', 'group').count()
         
-        monthly_kpis = KPI.objects.filter(
-            sales=sales,
-            date__gte=current_month_start,
-            date__lte=today
-        )
-        ranking = KPIService.get_sales_ranking(sales, period='month', metric='conversion_rate')
+        ranking = leaderboard.ranking(sales)
         
         # Haftalik ko'rsatkichlar
-        weekly_summary = KPIService.get_weekly_kpi_summary(sales, week_start)
-        weekly_conv = KPIService.get_accurate_conversion_rate(sales, week_start, week_end)
-        weekly_contacts = weekly_summary.get('total_contacts', 0) or 0
-        weekly_followups = weekly_summary.get('total_followups', 0) or 0
-        weekly_trials = weekly_summary.get('total_trials', 0) or 0
-        weekly_sales_count = weekly_summary.get('total_sales', 0) or 0
-        weekly_conversion = weekly_conv.get('conversion_rate', 0) or 0
+        weekly_summary = KPIRollups.summarize(weekly_rollups.get(sales.id))
+        weekly_contacts = weekly_summary['total_contacts']
+        weekly_followups = weekly_summary['total_followups']
+        weekly_trials = weekly_summary['total_trials']
+        weekly_sales_count = weekly_summary['total_sales']
+        weekly_conversion = weekly_summary['conversion_rate']
         
         # Oylik to'liq ko'rsatkichlar (yig'indi)
-        monthly_total_contacts = monthly_kpis.aggregate(s=Sum('daily_contacts'))['s'] or 0
-        monthly_total_followups = monthly_kpis.aggregate(s=Sum('daily_followups'))['s'] or 0
-        monthly_total_trials = monthly_kpis.aggregate(s=Sum('trials_registered'))['s'] or 0
-        monthly_total_sales = monthly_kpis.aggregate(s=Sum('trials_to_sales'))['s'] or 0
-        monthly_conv = KPIService.calculate_monthly_conversion_rate(sales, today.year, today.month)
-        monthly_conversion = monthly_conv.get('conversion_rate', 0) or 0
+        monthly_summary = KPIRollups.summarize(monthly_rollups.get(sales.id))
+        monthly_total_contacts = monthly_summary['total_contacts']
+        monthly_total_followups = monthly_summary['total_followups']
+        monthly_total_trials = monthly_summary['total_trials']
+        monthly_total_sales = monthly_summary['total_sales']
+        monthly_conversion = monthly_summary['conversion_rate']
         
         sales_stats.append({
             'sales': sales,
             'kpi': kpi,
-            'overdue': FollowUpService.get_overdue_followups(sales).count(),
+            'overdue': overdue_matrix.overdue_count(sales),
             'leads_assigned': leads_assigned,
             'sales_count': sales_count,
             'trials_registered': trials_registered,
-            'monthly_avg_contacts': monthly_kpis.aggregate(avg=Avg('daily_contacts'))['avg'] or 0 if monthly_kpis.exists() else 0,
-            'monthly_avg_conversion': monthly_kpis.aggregate(avg=Avg('conversion_rate'))['avg'] or 0 if monthly_kpis.exists() else 0,
+            'monthly_avg_contacts': monthly_summary['avg_contacts'],
+            'monthly_avg_conversion': monthly_summary['avg_conversion_rate'],
             'monthly_total_sales': monthly_total_sales,
             'ranking': ranking,
             # Haftalik
@@ -2107,27 +2116,12 @@ def sales_kpi(request, sales_id=None):
         sales = get_object_or_404(User, pk=sales_id, role='sales')
     today = timezone.now().date()
     
-    # Bugungi KPI
-    today_kpi = KPIService.calculate_daily_kpi(sales, today)
+    # Bugungi KPI - yozish vaqtida yangilanadigan hisoblagichlardan
+    today_kpi = KPIService.get_live_kpi(sales, today)
     
-    # Oxirgi 7 kunlik KPI
+    # Oxirgi 7 kunlik KPI (yo'q kunlar - 'pending', eskirganlari - 'stale'; qayta hisoblash navbatga qo'yiladi)
     from datetime import timedelta
-    last_7_days = []
-    for i in range(7):
-        date = today - timedelta(days=i)
-        kpi = KPI.objects.filter(sales=sales, date=date).first()
-        if kpi:
-            last_7_days.append({
-                'date': date,
-                'kpi': kpi
-            })
-        else:
-            # Agar KPI hisoblanmagan bo'lsa, hisoblaymiz
-            kpi = KPIService.calculate_daily_kpi(sales, date)
-            last_7_days.append({
-                'date': date,
-                'kpi': kpi
-            })
+    last_7_days = KPIService.get_kpi_history(sales, 7, today)
     
     # Oylik statistikalar
     from datetime import datetime
@@ -2138,19 +2132,19 @@ def sales_kpi(request, sales_id=None):
         date__lte=today
     ).order_by('-date')
     
-    # Oylik konversiya (berilgan lidlar -> enrolled)
-    monthly_conv = KPIService.calculate_monthly_conversion_rate(sales, today.year, today.month)
-    
-    # Oylik yig'indilar
+    # Oylik yig'indilar va konversiya (berilgan lidlar -> enrolled) - bitta KPIMonthly qatoridan
+    monthly_summary = KPIRollups.summarize(
+        KPIMonthly.objects.filter(sales=sales, period_start=current_month_start).first()
+    )
     monthly_stats = {
-        'total_contacts': sum(kpi.daily_contacts for kpi in monthly_kpis),
-        'total_followups': sum(kpi.daily_followups for kpi in monthly_kpis),
-        'total_trials': sum(kpi.trials_registered for kpi in monthly_kpis),
-        'total_sales': sum(kpi.trials_to_sales for kpi in monthly_kpis),
-        'avg_conversion': monthly_conv['conversion_rate'],
-        'avg_response_time': sum(kpi.response_time_minutes for kpi in monthly_kpis) / len(monthly_kpis) if monthly_kpis else 0,
-        'monthly_assigned': monthly_conv['total_assigned'],
-        'monthly_enrolled': monthly_conv['enrolled'],
+        'total_contacts': monthly_summary['total_contacts'],
+        'total_followups': monthly_summary['total_followups'],
+        'total_trials': monthly_summary['total_trials'],
+        'total_sales': monthly_summary['total_sales'],
+        'avg_conversion': monthly_summary['conversion_rate'],
+        'avg_response_time': monthly_summary['avg_response_time'],
+        'monthly_assigned': monthly_summary['total_assigned'],
+        'monthly_enrolled': monthly_summary['total_sales'],
     }
     
     # Mening lidlarim statistikasi
@@ -2167,21 +2161,13 @@ def sales_kpi(request, sales_id=None):
     
     # Oxirgi 30 kunlik KPI (batafsil)
     from datetime import timedelta
-    last_30_days_kpi = []
-    for i in range(30):
-        date = today - timedelta(days=i)
-        kpi = KPI.objects.filter(sales=sales, date=date).first()
-        if not kpi:
-            kpi = KPIService.calculate_daily_kpi(sales, date)
-        last_30_days_kpi.append({
-            'date': date,
-            'kpi': kpi
-        })
+    last_30_days_kpi = KPIService.get_kpi_history(sales, 30, today)
     
-    # O'rtacha, minimum, maksimum
-    if last_30_days_kpi:
-        contacts_values = [day['kpi'].daily_contacts for day in last_30_days_kpi]
-        conversion_values = [day['kpi'].conversion_rate for day in last_30_days_kpi]
+    # O'rtacha, minimum, maksimum (faqat hisoblangan kunlar)
+    computed_days = [day for day in last_30_days_kpi if not day['pending']]
+    if computed_days:
+        contacts_values = [day['kpi'].daily_contacts for day in computed_days]
+        conversion_values = [day['kpi'].conversion_rate for day in computed_days]
         stats_summary = {
             'contacts': {
                 'avg': sum(contacts_values) / len(contacts_values) if contacts_values else 0,
@@ -2243,10 +2229,24 @@ def sales_kpi(request, sales_id=None):
     # Overdue statistikasi (prioritet bo'yicha)
     overdue_summary = FollowUpService.get_sales_overdue_summary(sales)
     
+    # O'tish vaqtlari taqsimoti (oxirgi 30 kun) - kunlik gistogrammalar qo'shiladi
+    latency_start = today - timedelta(days=29)
+    latency_distribution = LatencyStats.get_distributions(latency_start, today, sales_ids=[sales.id])[None]
+    latency_by_course_raw = LatencyStats.get_distributions(latency_start, today, by='course', sales_ids=[sales.id])
+    course_names = dict(Course.objects.filter(id__in=[key for key in latency_by_course_raw if key]).values_list('id', 'name'))
+    latency_by_course = sorted(
+        (
+            {'course': course_names.get(course_id, 'Kurs belgilanmagan'), 'metrics': rows}
+            for course_id, rows in latency_by_course_raw.items()
+        ),
+        key=lambda item: item['course']
+    )
+    
     context = {
         'sales': sales,
         'viewing_own': (request.user == sales),
         'today_kpi': today_kpi,
+        'kpi_reconcile': KPIService.get_reconcile_status(sales),
         'last_7_days': last_7_days,
         'last_30_days_kpi': last_30_days_kpi,
         'stats_summary': stats_summary,
@@ -2259,11 +2259,78 @@ def sales_kpi(request, sales_id=None):
         'weekly_summary': weekly_summary,
         'followup_stats': followup_stats,
         'overdue_summary': overdue_summary,
+        'latency_distribution': latency_distribution,
+        'latency_by_course': latency_by_course,
     }
     
     return render(request, 'analytics/sales_kpi.html', context)
 
 
+@login_required
+@manager_or_admin_required
+def analytics_funnel(request):
+    """
+    Voronka, kogorta va bosqichgacha vaqt - tungi ustunli snapshotdan (OLTP bazaga so'rov yo'q)
+    """
+    import time
+    from datetime import datetime
+    from .analytics_snapshot import get_engine, STAGES, DIMENSIONS, NUMPY_AVAILABLE
+    
+    context = {
+        'numpy_available': NUMPY_AVAILABLE,
+        'stages': STAGES[1:],
+        'source_choices': Lead.SOURCE_CHOICES,
+    }
+    engine = get_engine()
+    if engine is None:
+        return render(request, 'analytics/funnel.html', context)
+    
+    started = time.perf_counter()
+    filters = {}
+    for name in ('course', 'sales'):
+        value = request.GET.get(name, '')
+        if value.isdigit():
+            filters[name] = int(value)
+    if request.GET.get('source'):
+        filters['source'] = request.GET['source']
+    for name in ('start', 'end'):
+        try:
+            filters[name] = datetime.strptime(request.GET.get(name, ''), '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    
+    stage = request.GET.get('stage', 'enrolled')
+    if stage not in dict(STAGES) or stage == 'created':
+        stage = 'enrolled'
+    try:
+        weeks = min(max(int(request.GET.get('weeks', 12)), 1), 52)
+    except ValueError:
+        weeks = 12
+    group_by = [dimension for dimension in request.GET.getlist('group_by') if dimension in DIMENSIONS]
+    horizon = 8
+    
+    context.update({
+        'engine': engine,
+        'filters': filters,
+        'stage': stage,
+        'stage_label': dict(STAGES)[stage],
+        'weeks': weeks,
+        'group_by': group_by,
+        'horizon_range': range(1, horizon + 1),
+        'funnel': engine.funnel(**filters),
+        'cohorts': engine.cohorts(stage=stage, weeks=weeks, horizon=horizon, group_by=group_by, **filters),
+        'time_to_stage': [
+            dict(engine.time_to_stage(name, **filters)[0], label=label)
+            for name, label in STAGES[1:]
+        ],
+        'time_by_sales': engine.time_to_stage(stage, group_by='sales', **filters),
+        'followup_stats': engine.followup_stats(**filters),
+        'trial_stats': engine.trial_stats(**filters),
+    })
+    context['elapsed_ms'] = (time.perf_counter() - started) * 1000
+    return render(request, 'analytics/funnel.html', context)
+
+
 @login_required
 @manager_or_admin_required
 def send_kpi_report_telegram(request):
@@ -2331,23 +2398,27 @@ def export_analytics_excel(request):
     
     # Ma'lumotlar
     sales_stats = []
-    for sales in User.objects.filter(role='sales', is_active_sales=True):
-        kpi = KPIService.calculate_daily_kpi(sales, today)
+    overdue_matrix = OverdueMatrix.current()
+    sales_users = list(User.objects.filter(role='sales', is_active_sales=True))
+    # Bugungi KPI - jonli hisoblagichlar + OverdueMatrix (qator tungi reconcile da yoziladi)
+    today_kpis = KPIService.get_live_kpis(today, sales_users)
+    # Reyting - barcha qatorlar uchun bitta so'rov (keshlangan)
+    leaderboard = Leaderboard.get(period='month', metric='conversion_rate')
+    # Oylik yig'indilar - bitta o'qish
+    monthly_rollups = KPIRollups.get_rows(KPIMonthly, current_month_start, [sales.id for sales in sales_users])
+    for sales in sales_users:
+        kpi = today_kpis[sales.id]
         leads_assigned = Lead.objects.filter(assigned_sales=sales).count()
         sales_count = Lead.objects.filter(assigned_sales=sales, status='enrolled').count()
         trials_registered = TrialLesson.objects.filter(lead__assigned_sales=sales).count()
-        overdue = FollowUpService.get_overdue_followups(sales).count()
+        overdue = overdue_matrix.overdue_count(sales)
         
-        monthly_kpis = KPI.objects.filter(
-            sales=sales,
-            date__gte=current_month_start,
-            date__lte=today
-        )
-        monthly_avg_contacts = monthly_kpis.aggregate(avg=Avg('daily_contacts'))['avg'] or 0 if monthly_kpis.exists() else 0
-        monthly_avg_conversion = monthly_kpis.aggregate(avg=Avg('conversion_rate'))['avg'] or 0 if monthly_kpis.exists() else 0
-        monthly_total_sales = monthly_kpis.aggregate(sum=Sum('trials_to_sales'))['sum'] or 0 if monthly_kpis.exists() else 0
+        monthly_summary = KPIRollups.summarize(monthly_rollups.get(sales.id))
+        monthly_avg_contacts = monthly_summary['avg_contacts']
+        monthly_avg_conversion = monthly_summary['avg_conversion_rate']
+        monthly_total_sales = monthly_summary['total_sales']
         
-        ranking = KPIService.get_sales_ranking(sales, period='month', metric='conversion_rate')
+        ranking = leaderboard.ranking(sales)
         
         sales_stats.append({
             'rank': ranking['rank'],
@@ -2388,6 +2459,32 @@ def export_analytics_excel(request):
     for col, width in enumerate(column_widths, 1):
         ws.column_dimensions[ws.cell(row=1, column=col).column_letter].width = width
     
+    # O'tish vaqtlari taqsimoti (oy boshidan) - kunlik gistogrammalardan
+    ws_latency = wb.create_sheet("O'tish vaqtlari")
+    latency_headers = ['Sotuvchi', "O'tish", 'Soni', 'p50 (daq)', 'p90 (daq)', 'p99 (daq)', "O'rtacha (daq)"]
+    ws_latency.append(latency_headers)
+    for col in range(1, len(latency_headers) + 1):
+        cell = ws_latency.cell(row=1, column=col)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+    latency = LatencyStats.get_distributions(
+        current_month_start, today, by='sales', sales_ids=[stat['sales'].id for stat in sales_stats]
+    )
+    for stat in sales_stats:
+        for metric_row in latency.get(stat['sales'].id, []):
+            ws_latency.append([
+                stat['sales'].username,
+                metric_row['label'],
+                metric_row['count'],
+                *(
+                    round(metric_row[key], 1) if metric_row[key] is not None else None
+                    for key in ('p50', 'p90', 'p99', 'mean')
+                ),
+            ])
+    for col, width in enumerate([20, 32, 10, 12, 12, 12, 14], 1):
+        ws_latency.column_dimensions[ws_latency.cell(row=1, column=col).column_letter].width = width
+    
     # Response yaratish
     response = HttpResponse(
         content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
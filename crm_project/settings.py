@@ -162,18 +162,10 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm_app.tasks.auto_reschedule_overdue_followups_task',
         'schedule': crontab(minute='*/30'),  # Har 30 daqiqada
     },
-    'send-followup-reminders': {
-        'task': 'crm_app.tasks.send_followup_reminders_task',
-        'schedule': crontab(minute='*/5'),  # Har 5 daqiqada (ish vaqtlarini tekshirish uchun)
-    },
     'send-trial-reminders': {
         'task': 'crm_app.tasks.send_trial_reminder_task',
         'schedule': crontab(minute='*/30'),  # Har 30 daqiqada
     },
-    'send-post-trial-sales-reminders': {
-        'task': 'crm_app.tasks.send_post_trial_sales_reminder_task',
-        'schedule': crontab(minute=0),  # Har soatda (0-daqiqada)
-    },
     'calculate-daily-kpi': {
         'task': 'crm_app.tasks.calculate_daily_kpi_task',
         'schedule': crontab(hour=23, minute=59),  # Har kuni kechasi
@@ -182,14 +174,6 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm_app.tasks.reactivation_task',
         'schedule': crontab(hour=9, minute=0),  # Har kuni ertalab
     },
-    'check-trial-attended-not-enrolled': {
-        'task': 'crm_app.tasks.check_trial_attended_not_enrolled_task',
-        'schedule': crontab(minute='*/60'),  # Har soatda
-    },
-    'create-followup-after-trial-end': {
-        'task': 'crm_app.tasks.create_followup_after_trial_end_task',
-        'schedule': crontab(minute='*/15'),  # Har 15 daqiqada
-    },
     'check-expired-leaves': {
         'task': 'crm_app.tasks.check_expired_leaves_task',
         'schedule': crontab(minute='*/60'),  # Har soatda
@@ -206,11 +190,56 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm_app.tasks.import_leads_from_google_sheets',
         'schedule': crontab(minute='*/5'),  # Har 5 daqiqada
     },
+    'dispatch-scheduled-actions': {
+        'task': 'crm_app.tasks.dispatch_scheduled_actions_task',
+        'schedule': crontab(minute='*'),  # Har daqiqada - follow-up eslatmalari va sinovdan keyingi follow-up'lar
+    },
+    'prune-scheduled-actions': {
+        'task': 'crm_app.tasks.prune_scheduled_actions_task',
+        'schedule': crontab(hour=3, minute=45),  # Har kuni 03:45 da
+    },
+    'drain-telegram-outbox': {
+        'task': 'crm_app.tasks.drain_telegram_outbox_task',
+        'schedule': crontab(minute='*'),  # Har daqiqada (faqat TELEGRAM_OUTBOX_CELERY_DRAIN bo'lsa)
+    },
+    'prune-telegram-outbox': {
+        'task': 'crm_app.tasks.prune_telegram_outbox_task',
+        'schedule': crontab(hour=3, minute=30),  # Har kuni 03:30 da
+    },
+    'build-analytics-snapshot': {
+        'task': 'crm_app.tasks.build_analytics_snapshot_task',
+        'schedule': crontab(hour=1, minute=30),  # Har kuni 01:30 da
+    },
 }
 
+# Analitika snapshot (voronka/kogorta sahifasi uchun ustunli .npy fayllar)
+ANALYTICS_SNAPSHOT_DIR = os.getenv('ANALYTICS_SNAPSHOT_DIR', str(BASE_DIR / 'analytics_snapshot'))
+
 # Telegram Bot
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
 TELEGRAM_ADMIN_CHAT_ID = os.getenv('TELEGRAM_ADMIN_CHAT_ID', '')
+# Bitta digest xabaridagi maksimal qatorlar soni (eslatmalar chat bo'yicha yig'ib yuboriladi)
+TELEGRAM_DIGEST_MAX_ITEMS = int(os.getenv('TELEGRAM_DIGEST_MAX_ITEMS', '20'))
+
+# Telegram outbox: xabarlar navbatga yoziladi va alohida sender yuboradi
+TELEGRAM_OUTBOX_ENABLED = os.getenv('TELEGRAM_OUTBOX_ENABLED', 'True').lower() in ('true', '1', 'yes')
+# True - navbatni Celery task yuboradi; False - alohida jarayon (manage.py run_telegram_sender)
+# Celery rejimida rate limit faqat umumiy cache (Redis CACHES) va bitta drain jarayoni bilan
+# (--concurrency=1) to'g'ri ishlaydi - prefork worker'ning har bir bolasi o'z limitini hisoblaydi
+TELEGRAM_OUTBOX_CELERY_DRAIN = os.getenv('TELEGRAM_OUTBOX_CELERY_DRAIN', 'False').lower() in ('true', '1', 'yes')
+TELEGRAM_GLOBAL_RATE = int(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # xabar/soniya (bot bo'yicha)
+TELEGRAM_PER_CHAT_RATE = 1  # xabar/soniya (har bir chat)
+TELEGRAM_SENDER_WORKERS = int(os.getenv('TELEGRAM_SENDER_WORKERS', '8'))
+TELEGRAM_OUTBOX_RETENTION_DAYS = 7  # Yuborilgan xabarlar shu muddatdan keyin o'chiriladi
+
+# Takroriy eslatmalar oralig'i (soniya). None - faqat bir marta yuboriladi
+NOTIFICATION_RENOTIFY_INTERVALS = {
+    'overdue_followup': 4 * 60 * 60,  # 4 soatda bir marta
+    'overdue_manager': 4 * 60 * 60,  # Manager ogohlantirishi (sotuvchi bo'yicha) - 4 soatda bir marta
+    'followup_reminder': None,
+    'trial_reminder': None,
+    'post_trial_reminder': None,
+}
 
 # Google Sheets Configuration
 GOOGLE_SHEETS_CREDENTIALS = os.getenv('GOOGLE_SHEETS_CREDENTIALS', '')
@@ -238,24 +267,28 @@ LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
 
 # Cache Configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
-            'CULL_FREQUENCY': 3,
+# CACHE_REDIS_URL berilsa - umumiy Redis cache (gunicorn/celery jarayonlari bitta hisoblagichlarni ko'radi).
+# Bo'lmasa LocMem - har bir jarayonning o'z cache'i; jarayonlararo hisoblagichlar
+# (SalesLoadCounters) bu holda har safar DB dan hisoblanadi.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', '')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'OPTIONS': {
+                'MAX_ENTRIES': 1000,
+                'CULL_FREQUENCY': 3,
+            }
         }
     }
-}
-
-# settings.py production
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
-#         'LOCATION': 'redis://127.0.0.1:6379/1',
-#     }
-# }
 
 # Cache timeout (seconds)
 CACHE_TIMEOUT = 300  # 5 daqiqa
@@ -79,6 +79,21 @@ else
     echo -e "${YELLOW}⚠️  Celerybeat service topilmadi${NC}"
 fi
 
+# 7.1 Telegram sender (TelegramOutbox navbatini yuboradi - usiz xabarlar yuborilmaydi)
+echo -e "${YELLOW}🔄 Telegram sender restart qilinmoqda...${NC}"
+if [ ! -f /etc/systemd/system/telegram-sender.service ]; then
+    sudo cp deploy/telegram-sender.service /etc/systemd/system/telegram-sender.service
+    sudo systemctl daemon-reload
+    sudo systemctl enable telegram-sender
+fi
+
+if sudo systemctl restart telegram-sender 2>/dev/null; then
+    echo -e "${GREEN}✅ Telegram sender restart qilindi${NC}"
+else
+    echo -e "${RED}❌ Telegram sender ishga tushmadi! Xabarlar navbatda qoladi${NC}"
+    echo -e "${YELLOW}  .env ga TELEGRAM_OUTBOX_CELERY_DRAIN=True qo'shing (navbatni Celery yuboradi)${NC}"
+fi
+
 # 8. Nginx reload
 echo -e "${YELLOW}🔄 Nginx reload qilinmoqda...${NC}"
 if sudo nginx -t > /dev/null 2>&1; then
@@ -96,6 +111,7 @@ echo ""
 echo "📊 Status tekshirish:"
 echo "  - Gunicorn: sudo systemctl status gunicorn"
 echo "  - Celery:   sudo systemctl status celery"
+echo "  - Telegram: sudo systemctl status telegram-sender"
 echo "  - Nginx:    sudo systemctl status nginx"
 echo ""
 echo "🧪 Test qilish:"
@@ -104,5 +120,6 @@ echo ""
 echo "📋 Log'lar:"
 echo "  - Gunicorn: sudo journalctl -u gunicorn -f"
 echo "  - Celery:   sudo journalctl -u celery -f"
+echo "  - Telegram: sudo journalctl -u telegram-sender -f"
 echo ""
 